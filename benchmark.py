@@ -0,0 +1,169 @@
+import sys
+import time
+import json
+import argparse
+import warnings
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+from features import get_all_features, compile_plan, convert_types, extract_features, extract_features_symmetric, RAW_COLUMNS
+from predict import symmetrize_features
+from data_io import object_array, TYPE_NAMES
+
+SIZES = [100, 1000, 10000, 100000, 1000000]
+CARDINALITIES = {'low': 5, 'high': 1000}
+
+def discretize(v, tp, levels):
+    # values of type tp with at most levels distinct values
+    if tp == "Binary":
+        return (v > np.median(v)).astype(float)
+    ranks = np.argsort(np.argsort(v, kind='mergesort'), kind='mergesort')
+    if tp == "Categorical":
+        return np.floor(ranks * levels / float(len(v)))
+    if levels < len(v):
+        edges = np.percentile(v, np.linspace(0, 100, levels + 1)[1:-1])
+        return np.round(np.searchsorted(edges, v) * np.std(v) / levels, 6)
+    return v
+
+def synthetic_pair(rng, n, a_type, b_type, levels):
+    """A cause A of type a_type and an effect B of type b_type, B = f(A) + noise."""
+    a = discretize(rng.standard_normal(n), a_type, levels)
+    f = np.tanh(rng.uniform(0.5, 2.0) * (a - a.mean()) / (a.std() + 1e-12)) + rng.uniform(-0.5, 0.5) * a
+    b = discretize(f + rng.uniform(0.1, 1.0) * rng.standard_normal(n), b_type, levels)
+    return a, b
+
+def synthetic_pairs(n_pairs, n, a_type, b_type, levels, seed=0):
+    rng = np.random.RandomState(seed)
+    pairs = [synthetic_pair(rng, n, a_type, b_type, levels) for i in xrange(n_pairs)]
+    ids = ['bench%d' % i for i in xrange(n_pairs)]
+    X = pd.DataFrame({'A': object_array([a for a, b in pairs]),
+                      'B': object_array([b for a, b in pairs]),
+                      'A type': [a_type] * n_pairs,
+                      'B type': [b_type] * n_pairs},
+                     index=ids, columns=RAW_COLUMNS)
+    X.index.name = "SampleID"
+    return X
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, None if it cannot be measured."""
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on OS X, kilobytes elsewhere
+        return rss / (1024. * 1024.) if sys.platform == 'darwin' else rss / 1024.
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    # peak working set on Windows, current RSS where psutil has no peak
+    return getattr(info, 'peak_wset', info.rss) / (1024. * 1024.)
+
+def format_mb(mb):
+    return "    n/a" if mb is None else "%7.1f MB" % mb
+
+def timed(f, *args, **kwargs):
+    t = time.time()
+    result = f(*args, **kwargs)
+    return result, time.time() - t
+
+def feature_medians(X, features):
+    # median seconds of every plan step over the pairs of X
+    plan = compile_plan(features, available=RAW_COLUMNS)
+    times = np.zeros((len(X), len(plan.steps)))
+    Xc = convert_types(X)
+    for i, values in enumerate(zip(*[Xc[c].values for c in plan.sources])):
+        slots = list(values) + [None] * len(plan.steps)
+        k = len(plan.sources)
+        for j, (node, inputs) in enumerate(plan.steps):
+            t = time.time()
+            slots[k + j] = node.transformer(*[slots[m] for m in inputs])
+            times[i, j] = time.time() - t
+    return dict((node.name, float(np.median(times[:, j]))) for j, (node, _) in enumerate(plan.steps))
+
+def run_group(n_pairs, n, a_type, b_type, cardinality, features, used, per_feature=True, seed=0):
+    X = synthetic_pairs(n_pairs, n, a_type, b_type, CARDINALITIES[cardinality], seed)
+    result = {'types': '%s-%s' % (a_type, b_type), 'size': n, 'cardinality': cardinality, 'pairs': n_pairs}
+    t, seconds = timed(extract_features, X, features)
+    result['extract_features'] = {'seconds': seconds, 'pairs_per_sec': n_pairs / seconds}
+    _, seconds = timed(symmetrize_features, X, t, features)
+    result['symmetrize_features'] = {'seconds': seconds, 'pairs_per_sec': n_pairs / seconds}
+    _, seconds = timed(extract_features_symmetric, X, features, list(used))
+    result['extract_features_symmetric'] = {'seconds': seconds, 'pairs_per_sec': n_pairs / seconds}
+    if per_feature:
+        result['features'] = feature_medians(X, features)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+def groups(sizes, samples_per_group, max_pairs):
+    for a_type in TYPE_NAMES:
+        for b_type in TYPE_NAMES:
+            for cardinality in sorted(CARDINALITIES):
+                # binary pairs look the same at every cardinality
+                if a_type == b_type == "Binary" and cardinality != 'low':
+                    continue
+                for n in sizes:
+                    yield min(max_pairs, max(1, samples_per_group // n)), n, a_type, b_type, cardinality
+
+def group_key(g):
+    return g['types'], g['size'], g['cardinality']
+
+def compare(report, baseline, tolerance):
+    """Print the runs slower than baseline by more than tolerance; returns their number."""
+    previous = dict((group_key(g), g) for g in baseline['groups'])
+    slower = 0
+    for g in report['groups']:
+        b = previous.get(group_key(g))
+        if b is None:
+            continue
+        for run in ('extract_features', 'symmetrize_features', 'extract_features_symmetric'):
+            if run not in b:
+                continue
+            ratio = g[run]['pairs_per_sec'] / b[run]['pairs_per_sec']
+            if ratio < 1 - tolerance:
+                slower += 1
+                print "slower %s %s size=%d %s: %.2fx of baseline" % (run, g['types'], g['size'], g['cardinality'], ratio)
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description="Time feature extraction on synthetic cause-effect pairs.")
+    parser.add_argument('output', help="JSON report")
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help="comma separated sample sizes")
+    parser.add_argument('--samples-per-group', type=int, default=200000, help="pairs of a group add up to about this many samples")
+    parser.add_argument('--max-pairs', type=int, default=200, help="pairs per group at most")
+    parser.add_argument('--no-per-feature', action='store_true', help="skip the per-feature timings")
+    parser.add_argument('--baseline', default=None, help="JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="slowdown relative to the baseline that is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    features, used = get_all_features()
+    sizes = [int(s) for s in args.sizes.split(',')]
+    report = {'sizes': sizes, 'samples_per_group': args.samples_per_group, 'groups': []}
+    total_pairs, total_seconds = 0, 0.
+    for n_pairs, n, a_type, b_type, cardinality in groups(sizes, args.samples_per_group, args.max_pairs):
+        g = run_group(n_pairs, n, a_type, b_type, cardinality, features, used, not args.no_per_feature, args.seed)
+        print "%-22s size=%-8d %-4s %4d pairs  %8.1f pairs/sec  %s" % (
+            g['types'], n, cardinality, n_pairs, g['extract_features']['pairs_per_sec'], format_mb(g['peak_rss_mb']))
+        report['groups'].append(g)
+        total_pairs += n_pairs
+        total_seconds += g['extract_features']['seconds']
+    report['pairs_per_sec'] = total_pairs / total_seconds
+    report['peak_rss_mb'] = peak_rss_mb()
+    with open(args.output, 'w') as fo:
+        json.dump(report, fo, indent=1, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as fi:
+            baseline = json.load(fi)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
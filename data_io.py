@@ -0,0 +1,167 @@
+import os
+import multiprocessing
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+CHUNK_BYTES = 1 << 24
+
+def parse_cell(cell):
+    return np.fromstring(cell.strip().strip('"'), dtype=np.float, sep=" ")
+
+def object_array(values):
+    # filling element-wise keeps numpy from stacking equal-length samples into a 2-d array
+    a = np.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        a[i] = v
+    return a
+
+def split_ranges(filename, chunk_bytes=CHUNK_BYTES):
+    size = os.path.getsize(filename)
+    ranges = []
+    with open(filename, 'rb') as fi:
+        header = fi.readline()
+        start = fi.tell()
+        while start < size:
+            fi.seek(min(start + chunk_bytes, size) - 1)
+            fi.readline()
+            end = fi.tell()
+            ranges.append((start, end))
+            start = end
+    columns = [c.strip().strip('"') for c in header.split(',')]
+    return columns, ranges
+
+def parse_range(filename, start, end, columns):
+    isid, ia, ib = columns.index('SampleID'), columns.index('A'), columns.index('B')
+    with open(filename, 'rb') as fi:
+        fi.seek(start)
+        lines = fi.read(end - start).splitlines()
+    rows = []
+    for line in lines:
+        if not line.strip():
+            continue
+        cells = line.split(',')
+        rows.append((cells[isid].strip().strip('"'), parse_cell(cells[ia]), parse_cell(cells[ib])))
+    return rows
+
+def iter_pairs(filename, n_jobs=1, chunk_bytes=CHUNK_BYTES):
+    columns, ranges = split_ranges(filename, chunk_bytes)
+    if n_jobs == 1:
+        for start, end in ranges:
+            for row in parse_range(filename, start, end, columns):
+                yield row
+        return
+
+    # at most two chunks per worker are in flight, so memory does not grow with the file
+    pool = multiprocessing.Pool(n_jobs)
+    try:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.apply_async(parse_range, (filename, start, end, columns)))
+            if len(pending) >= 2 * n_jobs:
+                for row in pending.popleft().get():
+                    yield row
+        while pending:
+            for row in pending.popleft().get():
+                yield row
+    finally:
+        pool.terminate()
+        pool.join()
+
+def read_pairs(filename, n_jobs=1, chunk_bytes=CHUNK_BYTES):
+    ids, A, B = [], [], []
+    for sid, a, b in iter_pairs(filename, n_jobs, chunk_bytes):
+        ids.append(sid)
+        A.append(a)
+        B.append(b)
+    df = pd.DataFrame({'A': object_array(A), 'B': object_array(B)}, index=ids, columns=['A', 'B'])
+    df.index.name = "SampleID"
+    return df
+
+TYPE_NAMES = ["Binary", "Categorical", "Numerical"]
+
+STORE_FILES = {'values': 'values.f8', 'offsets': 'offsets.i8', 'types': 'types.i1', 'ids': 'ids.txt', 'source': 'source.txt'}
+
+def store_path(store_dir, key):
+    return os.path.join(store_dir, STORE_FILES[key])
+
+def source_stamp(filename_pairs, filename_info):
+    # full mtime precision: an edit that keeps the size is caught within the same second
+    return '\n'.join('%s %d %r' % (os.path.abspath(f), os.path.getsize(f), os.path.getmtime(f))
+                     for f in (filename_pairs, filename_info))
+
+def store_is_current(store_dir, filename_pairs, filename_info):
+    try:
+        with open(store_path(store_dir, 'source')) as fi:
+            return fi.read() == source_stamp(filename_pairs, filename_info)
+    except IOError:
+        return False
+
+def write_pair_store(filename_pairs, filename_info, store_dir, n_jobs=1):
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+    elif os.path.exists(store_path(store_dir, 'source')):
+        os.remove(store_path(store_dir, 'source'))
+    info = pd.read_csv(filename_info, index_col="SampleID")
+    codes = dict((name, i) for i, name in enumerate(TYPE_NAMES))
+
+    ids, offsets = [], [0]
+    with open(store_path(store_dir, 'values'), 'wb') as fo:
+        for sid, a, b in iter_pairs(filename_pairs, n_jobs):
+            a.tofile(fo)
+            b.tofile(fo)
+            ids.append(sid)
+            offsets.extend([offsets[-1] + len(a), offsets[-1] + len(a) + len(b)])
+    np.array(offsets, dtype=np.int64).tofile(store_path(store_dir, 'offsets'))
+    info = info.reindex(ids)
+    types = np.array([[codes.get(t, -1) for t in info[col]] for col in ('A type', 'B type')], dtype=np.int8).T
+    types.tofile(store_path(store_dir, 'types'))
+    with open(store_path(store_dir, 'ids'), 'w') as fo:
+        fo.write(''.join(sid + '\n' for sid in ids))
+    # written last, so an interrupted conversion is never taken for a current store
+    with open(store_path(store_dir, 'source'), 'w') as fo:
+        fo.write(source_stamp(filename_pairs, filename_info))
+
+class PairStore(object):
+    def __init__(self, store_dir):
+        self.offsets = np.fromfile(store_path(store_dir, 'offsets'), dtype=np.int64)
+        if self.offsets[-1] > 0:
+            self.values = np.memmap(store_path(store_dir, 'values'), dtype=np.float64, mode='r').view(np.ndarray)
+        else:
+            self.values = np.zeros(0)
+        self.types = np.fromfile(store_path(store_dir, 'types'), dtype=np.int8).reshape(-1, 2)
+        with open(store_path(store_dir, 'ids')) as fi:
+            self.ids = fi.read().splitlines()
+        self.index = dict((sid, i) for i, sid in enumerate(self.ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def pair(self, i):
+        o = self.offsets
+        return self.values[o[2*i]:o[2*i+1]], self.values[o[2*i+1]:o[2*i+2]]
+
+    def __getitem__(self, sid):
+        return self.pair(self.index[sid])
+
+    def __iter__(self):
+        for i, sid in enumerate(self.ids):
+            a, b = self.pair(i)
+            yield sid, a, b
+
+    def to_frame(self):
+        pairs = [self.pair(i) for i in xrange(len(self))]
+        names = np.array(TYPE_NAMES + [np.nan], dtype=object)
+        df = pd.DataFrame({'A': object_array([a for a, b in pairs]),
+                           'B': object_array([b for a, b in pairs]),
+                           'A type': names[self.types[:, 0]],
+                           'B type': names[self.types[:, 1]]},
+                          index=self.ids, columns=['A', 'B', 'A type', 'B type'])
+        df.index.name = "SampleID"
+        return df
+
+def load_pair_store(filename_pairs, filename_info, store_dir, n_jobs=1):
+    if not store_is_current(store_dir, filename_pairs, filename_info):
+        write_pair_store(filename_pairs, filename_info, store_dir, n_jobs)
+    return PairStore(store_dir)
@@ -1,9 +1,16 @@
+import os
+import shutil
+import tempfile
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
 import features as f
 import numpy as np
 from sklearn import pipeline
 from sklearn.base import BaseEstimator
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, GradientBoostingClassifier
 from estimator_base import *
+from tree_ensemble import compile_ensemble
 
 rfr_params_cc = {
     'n_estimators': 30,
@@ -151,14 +158,22 @@ gbr_params_union = {
 
 class Pipeline(pipeline.Pipeline):
     def predict(self, X):
+        # tree ensembles are scored by the array-based evaluator, other regressors by sklearn
+        ensemble = compile_ensemble(self.steps[-1][1])
+        if ensemble is None:
+            model = super(Pipeline, self)
+        else:
+            model = ensemble
+            for name, transform in self.steps[:-1]:
+                X = transform.transform(X)
         try:
-            p = pipeline.Pipeline.predict_proba(self, X)
+            p = model.predict_proba(X)
             if p.shape[1] == 2:
                 p = p[:,1]
             elif p.shape[1] == 3:
                 p = p[:,2] - p[:,0]
         except AttributeError:
-            p = pipeline.Pipeline.predict(self, X)
+            p = model.predict(X)
         return p
 
 
@@ -169,6 +184,33 @@ def get_pipeline(features, regressor=None, params=None):
         ]
     return Pipeline(steps)
 
+def consumed_features(model):
+    """Feature columns read by the leaf pipelines of a model or system combination."""
+    if hasattr(model, 'systems'):
+        return set().union(*[consumed_features(m) for m in model.systems])
+    return set(c for p in model.pipelines() for c in p.steps[0][1].features)
+
+def take_rows(X, rows):
+    if rows is None:
+        return X
+    if isinstance(X, f.FeatureMatrix):
+        return X.take(rows)
+    return X[rows]
+
+def fit_pipeline(p, X, target, fit_params):
+    if not fit_params:
+        return p.fit(X, target)
+    try:
+        return p.fit(X, target, **fit_params)
+    except TypeError:
+        return p.fit(X, target)
+
+def fit_estimator(m, X, y):
+    # fit_tasks lists (pipeline attribute, training rows, target, fit params)
+    for name, rows, target, fit_params in m.fit_tasks(y):
+        fit_pipeline(getattr(m, name), take_rows(X, rows), target, fit_params)
+    return m
+
 class CauseEffectEstimatorOneStep(BaseEstimator):
     def __init__(self, features=None, regressor=None, params=None, symmetrize=True):
         self.extractor = f.extract_features
@@ -178,9 +220,11 @@ class CauseEffectEstimatorOneStep(BaseEstimator):
     def extract(self, features):
         return self.extractor(features)
 
+    def fit_tasks(self, y):
+        return [('classifier', None, y, {})]
+
     def fit(self, X, y=None):
-        self.classifier.fit(X, y)
-        return self
+        return fit_estimator(self, X, y)
 
     def fit_transform(self, X, y=None):
         return self.classifier.fit_transform(X, y)
@@ -188,8 +232,13 @@ class CauseEffectEstimatorOneStep(BaseEstimator):
     def transform(self, X):
         return self.classifier.transform(X)
 
+    def pipelines(self):
+        return [self.classifier]
+
     def predict(self, X):
-        predictions = self.classifier.predict(X)
+        return self.combine(self.classifier.predict(X))
+
+    def combine(self, predictions):
         #print self.classifier
         #print predictions
         if self.symmetrize:
@@ -207,26 +256,21 @@ class CauseEffectEstimatorSymmetric(BaseEstimator):
     def extract(self, features):
         return self.extractor(features)
 
-    def fit(self, X, y=None):
+    def fit_tasks(self, y):
         target_left = np.array(y)
         target_left[target_left != 1] = 0
         weight_left = np.ones(len(target_left))
         weight_left[target_left==0] = sum(target_left==1)/float(sum(target_left==0))
-        try:
-            self.classifier_left.fit(X, target_left, regressor__sample_weight=weight_left)
-        except TypeError:
-            self.classifier_left.fit(X, target_left)
         target_right = np.array(y)
         target_right[target_right != -1] = 0
         target_right[target_right == -1] = 1
         weight_right = np.ones(len(target_right))
         weight_right[target_right==0] = sum(target_right==1)/float(sum(target_right==0))
-        try:
-            self.classifier_right.fit(X, target_right, regressor__sample_weight=weight_right)
-        except TypeError:
-            self.classifier_right.fit(X, target_right)
+        return [('classifier_left', None, target_left, {'regressor__sample_weight': weight_left}),
+                ('classifier_right', None, target_right, {'regressor__sample_weight': weight_right})]
 
-        return self
+    def fit(self, X, y=None):
+        return fit_estimator(self, X, y)
 
     def fit_transform(self, X, y=None):
         target_left = np.array(y)
@@ -241,9 +285,13 @@ class CauseEffectEstimatorSymmetric(BaseEstimator):
     def transform(self, X):
         return self.classifier_left.transform(X), self.classifier_right.transform(X)
 
+    def pipelines(self):
+        return [self.classifier_left, self.classifier_right]
+
     def predict(self, X):
-        predictions_left = self.classifier_left.predict(X)
-        predictions_right = self.classifier_right.predict(X)
+        return self.combine(self.classifier_left.predict(X), self.classifier_right.predict(X))
+
+    def combine(self, predictions_left, predictions_right):
         #print self.classifier_left
         #print predictions_left
         predictions = predictions_left - predictions_right
@@ -263,28 +311,22 @@ class CauseEffectEstimatorID(BaseEstimator):
     def extract(self, features):
         return self.extractor(features)
 
-    def fit(self, X, y=None):
+    def fit_tasks(self, y):
         #independence training pairs
-        train_independence = X
         target_independence = np.array(y)
         target_independence[target_independence != 0] = 1
         weight_independence = np.ones(len(target_independence))
         weight_independence[target_independence==0] = sum(target_independence==1)/float(sum(target_independence==0))
-        try:
-            self.classifier_independence.fit(train_independence, target_independence, regressor__sample_weight=weight_independence)
-        except TypeError:
-            self.classifier_independence.fit(train_independence, target_independence)
         #direction training pairs
-        direction_filter = y != 0
-        train_direction = X[direction_filter]
-        target_direction = y[direction_filter]
+        direction_filter = np.asarray(y) != 0
+        target_direction = np.asarray(y)[direction_filter]
         weight_direction = np.ones(len(target_direction))
         weight_direction[target_direction==0] = sum(target_direction==1)/float(sum(target_direction==0))
-        try:
-            self.classifier_direction.fit(train_direction, target_direction, regressor__sample_weight=weight_direction)
-        except TypeError:
-            self.classifier_direction.fit(train_direction, target_direction)
-        return self
+        return [('classifier_independence', None, target_independence, {'regressor__sample_weight': weight_independence}),
+                ('classifier_direction', direction_filter, target_direction, {'regressor__sample_weight': weight_direction})]
+
+    def fit(self, X, y=None):
+        return fit_estimator(self, X, y)
 
     def fit_transform(self, X, y=None):
         #independence training pairs
@@ -305,34 +347,83 @@ class CauseEffectEstimatorID(BaseEstimator):
         X_dir = self.classifier_direction.transform(X)
         return X_ind, X_dir
 
+    def pipelines(self):
+        return [self.classifier_independence, self.classifier_direction]
+
     def predict(self, X):
-        predictions_independence = self.classifier_independence.predict(X)
+        return self.combine(self.classifier_independence.predict(X), self.classifier_direction.predict(X))
+
+    def combine(self, predictions_independence, predictions_direction):
         if self.symmetrize:
             predictions_independence[0::2] = (predictions_independence[0::2] + predictions_independence[1::2])*0.5
             predictions_independence[1::2] = predictions_independence[0::2]
         assert predictions_independence.min() >= 0
-        predictions_direction = self.classifier_direction.predict(X)
         if self.symmetrize:
             predictions_direction[0::2] = (predictions_direction[0::2] - predictions_direction[1::2])*0.5
             predictions_direction[1::2] = -predictions_direction[0::2]
         predictions = predictions_independence * predictions_direction
         return predictions
 
-def train_model((m, X, y)):
-    m.fit(X, y)
-    return m
+# training matrix of a fit worker, mapped read-only from the file the parent wrote
+TRAINING = None
+
+def init_training(path, columns, index):
+    global TRAINING
+    TRAINING = f.FeatureMatrix(np.load(path, mmap_mode='r'), columns, index)
+
+def train_pipeline((k, p, rows, target, fit_params)):
+    fit_pipeline(p, take_rows(TRAINING, rows), target, fit_params)
+    return k, p
+
+def fit_cost(p, rows, n):
+    # trees grown times training rows, to start the longest fits first
+    n_estimators = p.steps[-1][1].get_params().get('n_estimators', 1)
+    if rows is not None:
+        n = np.count_nonzero(rows) if np.asarray(rows).dtype == bool else len(rows)
+    return n_estimators * n
+
+def predict_pipeline((p, X)):
+    return p.predict(X)
 
 class CauseEffectSystemCombination(BaseEstimator):
+    # workers scoring the leaf pipelines of predict; the compiled tree
+    # evaluator runs without the GIL, so threads share X without copies
+    n_jobs = 1
+    executor = 'thread'
+    # worker processes of fit (-1 for all cores); a pool is only started when asked for
+    fit_jobs = 1
+
     def extract(self, features):
         return self.extractor(features)
 
     def fit(self, X, y=None):
-        #for m in self.systems:
-        #    m.fit(X, y)
+        n_jobs = self.fit_jobs
+        if n_jobs < 0:
+            n_jobs = multiprocessing.cpu_count() + 1 + n_jobs
+        if n_jobs <= 1:
+            for m in self.systems:
+                fit_estimator(m, X, y)
+            return self
         ############### parallel training ##############
-        import multiprocessing
-        pool = multiprocessing.Pool(5)
-        self.systems = pool.map(train_model, [(m, X, y) for m in self.systems])
+        # every leaf pipeline is a task; X is written once and memory-mapped by the workers
+        leaves = [(m, name, rows, target, fit_params) for m in self.systems for name, rows, target, fit_params in m.fit_tasks(y)]
+        if not isinstance(X, f.FeatureMatrix):
+            X = f.feature_matrix(X, sorted(set(c for m, name, rows, target, fit_params in leaves for c in getattr(m, name).steps[0][1].features)))
+        values = X.values if X.rows is None else X.values[X.rows]
+        tasks = [(k, getattr(m, name), rows, target, fit_params) for k, (m, name, rows, target, fit_params) in enumerate(leaves)]
+        tasks.sort(key=lambda t: -fit_cost(t[1], t[2], len(X)))
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'X.npy')
+            np.save(path, values)
+            pool = multiprocessing.Pool(min(n_jobs, len(tasks)), init_training, (path, X.columns, X.index))
+            try:
+                for k, p in pool.imap_unordered(train_pipeline, tasks):
+                    setattr(leaves[k][0], leaves[k][1], p)
+            finally:
+                pool.terminate()
+        finally:
+            shutil.rmtree(tmp)
         return self
 
     def fit_transform(self, X, y=None):
@@ -341,8 +432,26 @@ class CauseEffectSystemCombination(BaseEstimator):
     def transform(self, X):
         return [m.transform(X) for m in self.systems]
 
+    def predict_pipelines(self, X):
+        leaves = [p for m in self.systems for p in m.pipelines()]
+        n_jobs = self.n_jobs
+        if n_jobs < 0:
+            n_jobs = multiprocessing.cpu_count() + 1 + n_jobs
+        n_jobs = min(n_jobs, len(leaves))
+        if n_jobs <= 1:
+            return [p.predict(X) for p in leaves]
+        if self.executor == 'process':
+            pool = multiprocessing.Pool(n_jobs)
+        else:
+            pool = ThreadPool(n_jobs)
+        try:
+            return pool.map(predict_pipeline, [(p, X) for p in leaves], chunksize=1)
+        finally:
+            pool.terminate()
+
     def predict(self, X):
-        a = np.array([m.predict(X) for m in self.systems])
+        scores = iter(self.predict_pipelines(X))
+        a = np.array([m.combine(*[scores.next() for p in m.pipelines()]) for m in self.systems])
         if self.weights is not None:
             return np.dot(self.weights, a)
         else:
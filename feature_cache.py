@@ -0,0 +1,271 @@
+import os
+import time
+import hashlib
+import tempfile
+import cPickle as pickle
+
+import numpy as np
+import pandas as pd
+
+from features import (FeatureNode, FEATURE_VERSIONS, feature_name, as_column, convert_types, swap_pair,
+                      extract_features, extract_features_symmetric)
+
+DEFAULT_MAX_BYTES = 1 << 30
+# eviction brings the cache down to this share of max_bytes, so a full cache is not scanned every batch
+EVICT_TO = 0.8
+REPLACE_ATTEMPTS = 5
+
+def feature_versions(features):
+    """Version tag of every feature: its definition, its FEATURE_VERSIONS number and the tags of its inputs."""
+    nodes = {}
+    for fea in features:
+        node = FeatureNode(*fea)
+        nodes.setdefault(node.name, node)
+    versions = {}
+    def version(name):
+        if name not in versions:
+            node = nodes.get(name)
+            if node is None:
+                versions[name] = name
+            else:
+                f = node.transformer
+                definition = (name, getattr(f, '__module__', None), getattr(f, '__name__', repr(f)),
+                              FEATURE_VERSIONS.get(name, 0), [version(inp) for inp in node.inputs])
+                versions[name] = hashlib.sha1(repr(definition)).hexdigest()[:16]
+        return versions[name]
+    for name in nodes:
+        version(name)
+    return versions
+
+def pair_key(a, b, a_type, b_type):
+    h = hashlib.sha1()
+    for values in (a, b):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        h.update(str(len(values)))
+        h.update(values.tostring())
+    h.update(repr((a_type, b_type)))
+    return h.hexdigest()
+
+def entry_tag(entry):
+    # file name of a set of feature values: the same features at the same versions share it
+    return hashlib.sha1(repr(sorted((name, version) for name, (version, _) in entry.items()))).hexdigest()[:16]
+
+def same_value(a, b):
+    # NaN read back from a file never equals itself
+    if a == b:
+        return True
+    return isinstance(a, (float, np.floating)) and isinstance(b, (float, np.floating)) and np.isnan(a) and np.isnan(b)
+
+def replace_file(src, dst):
+    # os.rename does not replace an existing file on Windows: remove it first, retrying
+    # while another process has it open or renames over it
+    if os.name != 'nt':
+        os.rename(src, dst)
+        return
+    for attempt in xrange(REPLACE_ATTEMPTS):
+        try:
+            if os.path.exists(dst):
+                os.remove(dst)
+            os.rename(src, dst)
+            return
+        except OSError:
+            if attempt == REPLACE_ATTEMPTS - 1:
+                raise
+            time.sleep(0.01 * 2 ** attempt)
+
+class FeatureCache(object):
+    """Feature values of pairs on disk, one directory per pair named by the hash of its content.
+
+    Every value is stored with the version tag of its feature, so a changed
+    definition only recomputes that feature and the ones reading it. A pair
+    holds one file per set of features (and versions) written to it, and reads
+    merge them, so processes adding different features to the same pair never
+    drop each other's values. Files are written under a temporary name and
+    renamed, so concurrent writers never leave a partial entry; reads refresh
+    the mtime, and the least recently used files are removed once the cache
+    grows over max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # bytes found by the last scan plus the bytes stored since; None before the first scan
+        self.size = None
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def load(self, key, versions):
+        # the values of all files of the pair that are at their current version
+        directory = self.path(key)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return {}
+        entry = {}
+        for name in names:
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, 'rb') as fi:
+                    part = pickle.load(fi)
+                os.utime(path, None)
+            except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError):
+                continue
+            for feature, value in part.items():
+                if versions.get(feature) == value[0]:
+                    entry[feature] = value
+        return entry
+
+    def store(self, key, entry):
+        directory = self.path(key)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        except OSError:
+            # created by another process, or removed by its eviction meanwhile
+            return
+        with os.fdopen(fd, 'wb') as fo:
+            pickle.dump(entry, fo, pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp)
+        try:
+            replace_file(tmp, os.path.join(directory, entry_tag(entry) + '.pkl'))
+        except OSError:
+            # another process holds the file; these values are computed again next time
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        if self.size is not None:
+            self.size += size
+
+    def evict(self):
+        # the directory is only scanned once the bytes stored may have crossed max_bytes
+        if self.size is not None and self.size <= self.max_bytes:
+            return
+        files = []
+        for directory, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if total > self.max_bytes:
+            for mtime, size, path in sorted(files):
+                if total <= EVICT_TO * self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                else:
+                    total -= size
+                try:
+                    os.rmdir(os.path.dirname(path))
+                except OSError:
+                    pass
+        self.size = total
+
+    def update(self, key, entry, row, names, versions):
+        # non-scalar intermediates are recorded as None: known, but recomputed when needed;
+        # only the values not in the pair's files yet are written, as a file of their own
+        new = {}
+        for name in names:
+            value = row[name]
+            if not np.isscalar(value):
+                value = None
+            old = entry.get(name)
+            if old is None or old[0] != versions[name] or not same_value(old[1], value):
+                new[name] = (versions[name], value)
+        if new:
+            entry.update(new)
+            self.store(key, new)
+
+    def extract(self, X, features, outputs=None, symmetric=False, n_jobs=1, profile=None):
+        """Same rows as extract_features (or extract_features_symmetric), with cached values reused.
+
+        Non-scalar intermediate columns are not part of the result.
+        """
+        versions = feature_versions(features)
+        names = []
+        for fea in features:
+            name = feature_name(fea[0], fea[1]).lstrip('+')
+            if name not in names:
+                names.append(name)
+        if outputs is None:
+            outputs = names
+        pairs = zip(X['A'], X['B'], X['A type'], X['B type'])
+        if symmetric:
+            result = self.extract_symmetric(X, features, outputs, pairs, versions, n_jobs, profile)
+        else:
+            result = self.extract_pairs(X, features, outputs, pairs, versions, n_jobs, profile)
+        self.evict()
+        result.index.name = "SampleID"
+        return result
+
+    def extract_pairs(self, X, features, outputs, pairs, versions, n_jobs, profile=None):
+        keys = [pair_key(*p) for p in pairs]
+        entries = [self.load(k, versions) for k in keys]
+        groups = {}
+        for i, entry in enumerate(entries):
+            hit = frozenset(n for n in outputs if n in entry and entry[n][0] == versions[n])
+            groups.setdefault(hit, []).append(i)
+
+        parts, positions = [], []
+        for hit, rows in groups.items():
+            part = X.iloc[rows].copy()
+            for name in hit:
+                values = [entries[i][name][1] for i in rows]
+                if values[0] is not None:
+                    part[name] = as_column(values)
+            missing = [n for n in outputs if n not in hit]
+            if missing:
+                part = extract_features(part, features, n_jobs=n_jobs, outputs=missing, profile=profile)
+                computed = [c for c in part.columns if c in versions and c not in X.columns]
+                for i, (_, row) in zip(rows, part[computed].iterrows()):
+                    self.update(keys[i], entries[i], row, computed, versions)
+            else:
+                part = convert_types(part)
+            parts.append(part)
+            positions.extend(rows)
+
+        result = pd.concat(parts).iloc[np.argsort(positions, kind='mergesort')]
+        columns = list(convert_types(X.iloc[:0]).columns)
+        columns += [n for n in outputs if n in result.columns and n not in columns and result[n].dtype != object]
+        return result[columns]
+
+    def extract_symmetric(self, X, features, outputs, pairs, versions, n_jobs, profile=None):
+        # a pair is reused only when both orientations are cached; otherwise both are recomputed
+        keys = [(pair_key(a, b, ta, tb), pair_key(b, a, tb, ta)) for a, b, ta, tb in pairs]
+        entries = [(self.load(kf, versions), self.load(kb, versions)) for kf, kb in keys]
+        def cached(entry):
+            return all(n in entry and entry[n][0] == versions[n] and entry[n][1] is not None for n in outputs)
+        hits = [i for i, (ef, eb) in enumerate(entries) if cached(ef) and cached(eb)]
+        misses = [i for i, (ef, eb) in enumerate(entries) if not (cached(ef) and cached(eb))]
+
+        parts, positions = [], []
+        if misses:
+            part = extract_features_symmetric(X.iloc[misses], features, outputs, n_jobs=n_jobs, profile=profile)
+            computed = [c for c in outputs if c in versions]
+            for k, (_, row) in enumerate(part[computed].iterrows()):
+                i = misses[k // 2]
+                self.update(keys[i][k % 2], entries[i][k % 2], row, computed, versions)
+            parts.append(part)
+            positions.extend(misses)
+        if hits:
+            part = X.iloc[hits]
+            n = len(part)
+            order = np.arange(2 * n).reshape(2, n).T.ravel()
+            part = convert_types(pd.concat([part, swap_pair(part)]).iloc[order])
+            for name in outputs:
+                part[name] = as_column([entries[hits[k // 2]][k % 2][name][1] for k in xrange(2 * n)])
+            parts.append(part)
+            positions.extend(hits)
+
+        order = np.argsort(positions, kind='mergesort')
+        return pd.concat(parts).iloc[(2 * order[:, np.newaxis] + np.arange(2)).ravel()]
@@ -1,14 +1,68 @@
+import os
+import sys
+import time
+import json
+import Queue
+import threading
 import numpy as np
 from sklearn.base import BaseEstimator
 import pandas as pd
 import operator
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from estimator_base import *
 from features_base import *
+from data_io import object_array
 
 BINARY      = "Binary"
 CATEGORICAL = "Categorical"
 NUMERICAL   = "Numerical"
 
+class FeatureMatrix(object):
+    """Feature columns of a frame as one contiguous float64 array.
+
+    take() selects rows by position without copying the array, so the per-type
+    subsets handed to the models all share it; FeatureMapper then gathers its
+    columns of the selected rows in a single indexing step.
+    """
+    def __init__(self, values, columns, index, rows=None, position=None):
+        self.values = values
+        self.columns = columns
+        self.index = index
+        self.rows = rows
+        if position is None:
+            position = dict((c, j) for j, c in enumerate(columns))
+        self.position = position
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def shape(self):
+        return len(self), len(self.columns)
+
+    def take(self, rows):
+        # rows: boolean mask, slice or positions relative to this selection
+        selected = np.arange(len(self))[rows]
+        index = self.index[selected]
+        if self.rows is not None:
+            selected = self.rows[selected]
+        return FeatureMatrix(self.values, self.columns, index, selected, self.position)
+
+    def select(self, cols):
+        if self.rows is None:
+            return self.values[:, cols]
+        return self.values[np.ix_(self.rows, cols)]
+
+    def __getitem__(self, name):
+        return self.select([self.position[name]])[:, 0]
+
+def feature_matrix(X, columns=None):
+    if columns is None:
+        columns = list(X.columns)
+    values = np.ascontiguousarray(X[columns].values, dtype=np.float64)
+    return FeatureMatrix(values, columns, np.asarray(X.index))
+
 class FeatureMapper:
     def __init__(self, features):
         self.features = features
@@ -17,12 +71,26 @@ class FeatureMapper:
         for feature_name in self.features:
             extractor.fit(X[feature_name].values[:,np.newaxis], y)
 
+    def positions(self, X):
+        # column positions, resolved once per matrix layout
+        resolved = getattr(self, 'resolved', None)
+        if resolved is None or resolved[0] is not X.columns:
+            self.resolved = resolved = X.columns, np.array([X.position[c] for c in self.features])
+        return resolved[1]
+
     def transform(self, X):
+        if isinstance(X, FeatureMatrix):
+            return X.select(self.positions(X))
         return X[self.features].as_matrix()
 
     def fit_transform(self, X, y=None):
         return self.transform(X)
 
+def as_column(values):
+    if all(np.isscalar(v) for v in values):
+        return np.array(values)
+    return object_array(values)
+
 class SimpleTransform(BaseEstimator):
     def __init__(self, transformer):
         self.transformer = transformer
@@ -34,7 +102,7 @@ class SimpleTransform(BaseEstimator):
         return self.transform(X)
 
     def transform(self, X, y=None):
-        return np.array([self.transformer(x) for x in X], ndmin=2).T
+        return as_column([self.transformer(x) for x in X])[:, np.newaxis]
 
 class MultiColumnTransform(BaseEstimator):
     def __init__(self, transformer):
@@ -47,24 +115,310 @@ class MultiColumnTransform(BaseEstimator):
         return self.transform(X)
 
     def transform(self, X, y=None):
-        return np.array([self.transformer(*x[1]) for x in X.iterrows()], ndmin=2).T
+        return as_column([self.transformer(*x[1]) for x in X.iterrows()])[:, np.newaxis]
+
+RAW_COLUMNS = ['A', 'A type', 'B', 'B type']
+
+def feature_name(prefix, column_names):
+    if not type(column_names) is list:
+        column_names = [column_names]
+    return prefix + '[' + ','.join(column_names) + ']'
+
+class FeatureNode(object):
+    def __init__(self, prefix, column_names, extractor, aux_column_names=[]):
+        if not type(column_names) is list:
+            column_names = [column_names]
+        self.name = feature_name(prefix, column_names)
+        # a leading '+' asks for the feature to be recomputed even if the column exists
+        self.force = self.name[0] == '+'
+        if self.force:
+            self.name = self.name[1:]
+        self.inputs = column_names + list(aux_column_names)
+        self.transformer = extractor.transformer
+
+def value_bytes(value, seen):
+    # bytes reachable from value that are not in seen (already counted or inputs of the pair)
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(value_bytes(v, seen) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_bytes(v, seen) for v in value.values())
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + value_bytes(vars(value), seen)
+    return sys.getsizeof(value)
+
+def size_bucket(n):
+    return 10 ** int(np.log10(max(n, 1)))
+
+class PlanProfile(object):
+    """Wall time, calls and result bytes of every plan step.
+
+    Steps are broken down by the type combination of the pair and the power of
+    ten below its sample size. Pass one to extract_features (or
+    extract_features2, extract_features_symmetric) as profile=.
+    """
+    TYPE_NAMES = {0: BINARY, 1: CATEGORICAL, 2: NUMERICAL}
+
+    def __init__(self):
+        self.stats = {}
+
+    def key(self, a, a_type, b_type):
+        types = [self.TYPE_NAMES.get(t, str(t)) for t in (a_type, b_type)]
+        return '%s-%s' % tuple(types), 0 if a is None else size_bucket(len(a))
+
+    def record(self, name, key, seconds, nbytes):
+        s = self.stats.setdefault((name,) + key, [0, 0., 0])
+        s[0] += 1
+        s[1] += seconds
+        s[2] += nbytes
+
+    def merge(self, other):
+        for k, (calls, seconds, nbytes) in other.stats.items():
+            s = self.stats.setdefault(k, [0, 0., 0])
+            s[0] += calls
+            s[1] += seconds
+            s[2] += nbytes
+
+    def rows(self):
+        rows = [{'feature': name, 'types': types, 'size': size, 'calls': calls, 'seconds': seconds, 'bytes': nbytes}
+                for (name, types, size), (calls, seconds, nbytes) in self.stats.items()]
+        return sorted(rows, key=lambda r: -r['seconds'])
+
+    def totals(self):
+        totals = {}
+        for (name, types, size), (calls, seconds, nbytes) in self.stats.items():
+            s = totals.setdefault(name, [0, 0., 0])
+            s[0] += calls
+            s[1] += seconds
+            s[2] += nbytes
+        return sorted(totals.items(), key=lambda t: -t[1][1])
+
+    def report(self, limit=20):
+        total = sum(seconds for _, (calls, seconds, nbytes) in self.totals()) or 1.
+        lines = ['%-70s %8s %10s %6s %12s' % ('feature', 'calls', 'seconds', '%', 'MB')]
+        for name, (calls, seconds, nbytes) in self.totals()[:limit]:
+            lines.append('%-70s %8d %10.3f %6.1f %12.1f' % (name[:70], calls, seconds, 100 * seconds / total, nbytes / 1048576.))
+        lines.append('')
+        lines.append('%-70s %8s %10s %6s %12s' % ('feature / types / size', 'calls', 'seconds', '%', 'MB'))
+        for r in self.rows()[:limit]:
+            label = '%s / %s / %d' % (r['feature'], r['types'], r['size'])
+            lines.append('%-70s %8d %10.3f %6.1f %12.1f' % (label[-70:], r['calls'], r['seconds'], 100 * r['seconds'] / total, r['bytes'] / 1048576.))
+        return '\n'.join(lines)
+
+    def dump(self, filename):
+        with open(filename, 'w') as fo:
+            json.dump({'steps': self.rows()}, fo, indent=1, sort_keys=True)
+
+def run_step((i, transformer, args)):
+    t = time.time()
+    try:
+        value = transformer(*args)
+    except Exception:
+        return i, None, 0, sys.exc_info()
+    return i, value, time.time() - t, None
+
+STEP_POOL = None
+step_pool_lock = threading.Lock()
+
+def step_pool(threads):
+    # one pool per process, shared by all plans; a forked worker starts its own
+    global STEP_POOL
+    with step_pool_lock:
+        if STEP_POOL is None or STEP_POOL[0] != (os.getpid(), threads):
+            # the threads of a pool inherited from the parent do not exist in this process
+            if STEP_POOL is not None and STEP_POOL[0][0] == os.getpid():
+                STEP_POOL[1].terminate()
+                STEP_POOL[1].join()
+            STEP_POOL = ((os.getpid(), threads), ThreadPool(threads))
+        return STEP_POOL[1]
+
+class FeaturePlan(object):
+    # pairs of at least parallel_size samples run their independent steps on this many threads
+    threads = 1
+    parallel_size = 100000
+
+    def __init__(self, sources, steps):
+        self.sources = sources
+        self.steps = steps
+        self.names = sources + [node.name for node, _ in steps]
+        # slots the profile key of a pair is read from
+        self.key_slots = [self.names.index(c) if c in self.names else None for c in ('A', 'A type', 'B type')]
+        # the steps reading every step, and the number of steps every step reads
+        k = len(sources)
+        self.readers = [[] for _ in steps]
+        self.waits = []
+        for i, (node, inputs) in enumerate(steps):
+            reads = set(j - k for j in inputs if j >= k)
+            for j in reads:
+                self.readers[j].append(i)
+            self.waits.append(len(reads))
+
+    def __len__(self):
+        return len(self.sources) + len(self.steps)
+
+    def pair_size(self, slots):
+        j = self.key_slots[0]
+        return 0 if j is None else len(slots[j])
+
+    def run(self, values, profile=None):
+        slots = list(values) + [None] * len(self.steps)
+        k = len(self.sources)
+        if self.threads > 1 and self.pair_size(slots) >= self.parallel_size:
+            return self.run_threaded(slots, profile)
+        if profile is not None:
+            return self.run_profiled(slots, profile)
+        for i, (node, inputs) in enumerate(self.steps):
+            slots[k + i] = node.transformer(*[slots[j] for j in inputs])
+        return slots
+
+    def run_profiled(self, slots, profile):
+        k = len(self.sources)
+        key = profile.key(*[None if j is None else slots[j] for j in self.key_slots])
+        seen = set(id(v) for v in slots[:k])
+        for i, (node, inputs) in enumerate(self.steps):
+            t = time.time()
+            slots[k + i] = node.transformer(*[slots[j] for j in inputs])
+            profile.record(node.name, key, time.time() - t, value_bytes(slots[k + i], seen))
+        return slots
+
+    def run_threaded(self, slots, profile=None):
+        # every step starts as soon as the steps it reads are done; the kernels of
+        # features_base release the GIL, so steps of one pair share the cores
+        k = len(self.sources)
+        if profile is not None:
+            key = profile.key(*[None if j is None else slots[j] for j in self.key_slots])
+            seen = set(id(v) for v in slots[:k])
+        pool = step_pool(self.threads)
+        done = Queue.Queue()
+        waits = list(self.waits)
+        def start(i):
+            node, inputs = self.steps[i]
+            pool.apply_async(run_step, [(i, node.transformer, [slots[j] for j in inputs])], callback=done.put)
+        for i, w in enumerate(waits):
+            if w == 0:
+                start(i)
+        for _ in xrange(len(self.steps)):
+            i, value, seconds, error = done.get()
+            if error is not None:
+                raise error[0], error[1], error[2]
+            slots[k + i] = value
+            if profile is not None:
+                profile.record(self.steps[i][0].name, key, seconds, value_bytes(value, seen))
+            for r in self.readers[i]:
+                waits[r] -= 1
+                if waits[r] == 0:
+                    start(r)
+        return slots
+
+    def execute(self, X, profile=None):
+        rows = [self.run(values, profile) for values in zip(*[X[c].values for c in self.sources])]
+        k = len(self.sources)
+        return [(node.name, as_column([r[k + i] for r in rows])) for i, (node, _) in enumerate(self.steps)]
+
+def compile_plan(features, outputs=None, available=()):
+    """Order the feature nodes needed for outputs so every step reads earlier slots.
+
+    Names in available are loaded from existing columns instead of computed.
+    Slots 0..len(sources)-1 hold those columns, the remaining slots hold the steps.
+    """
+    nodes, names = {}, []
+    for fea in features:
+        node = FeatureNode(*fea)
+        names.append(node.name)
+        nodes.setdefault(node.name, node)
+    if outputs is None:
+        outputs = names
+    available = set(available)
+
+    slot = {}
+    sources, order = [], []
+    def visit(name, path):
+        if name in slot:
+            return
+        node = nodes.get(name)
+        if name in available and (node is None or not node.force):
+            slot[name] = ('source', len(sources))
+            sources.append(name)
+            return
+        if node is None:
+            raise ValueError("Unknown feature input: %s" % name)
+        if name in path:
+            raise ValueError("Cyclic feature definition: %s" % name)
+        for inp in node.inputs:
+            visit(inp, path + (name,))
+        slot[name] = ('step', len(order))
+        order.append(node)
+
+    for name in outputs:
+        visit(name, ())
+
+    index = lambda name: slot[name][1] if slot[name][0] == 'source' else len(sources) + slot[name][1]
+    steps = [(node, [index(inp) for inp in node.inputs]) for node in order]
+    return FeaturePlan(sources, steps)
+
+def convert_types(X):
+    X = X.copy()
+    X['A type'] = pd.Series.apply(X['A type'], lambda x: 0 if x == BINARY else 1 if x == CATEGORICAL else 2 if x == NUMERICAL else np.nan)
+    X['B type'] = pd.Series.apply(X['B type'], lambda x: 0 if x == BINARY else 1 if x == CATEGORICAL else 2 if x == NUMERICAL else np.nan)
+    return X
 
-def get_all_features():
+def numerical_type(tp):
+    return int(numerical(tp))
+
+# HSIC over at most maxpnt points of a pair, exact or with an 'rff' or 'nystroem' kernel
+# approximation of n_components features. The models were trained on EXACT_HSIC, and the
+# statistic grows with maxpnt; predict.py sets HSIC_OPTIONS from its --hsic-* options
+EXACT_HSIC = {'maxpnt': 200, 'approx': None, 'n_components': 100}
+HSIC_OPTIONS = dict(EXACT_HSIC)
+
+class HsicTransform(object):
+    # normalized_hsic with other options, named after them so their cached values are kept apart
+    def __init__(self, maxpnt, approx, n_components):
+        self.maxpnt, self.approx, self.n_components = maxpnt, approx, n_components
+        self.__name__ = 'normalized_hsic[%s,%d,%d]' % (approx, maxpnt, n_components)
+
+    def __call__(self, x, tx, y, ty, h=None, sx=None, sy=None):
+        return normalized_hsic(x, tx, y, ty, h, sx, sy, maxpnt=self.maxpnt, approx=self.approx, n_components=self.n_components)
+
+def hsic_transformer(options):
+    return normalized_hsic if options == EXACT_HSIC else HsicTransform(**options)
+
+# directional features computed together return (A->B, B->A); these pick one side
+def forward_value(*args):
+    return args[-1][0]
+
+def backward_value(*args):
+    return args[-1][1]
+
+# bump the number of a feature when its extractor changes, so cached values are recomputed;
+# features reading it are invalidated too
+FEATURE_VERSIONS = {}
+
+def get_all_features(hsic=None):
+    if hsic is None:
+        hsic = HSIC_OPTIONS
     all_features = [
         ('Max', 'A', SimpleTransform(max)),
         ('Max', 'B', SimpleTransform(max)),
         ('Min', 'A', SimpleTransform(min)),
         ('Min', 'B', SimpleTransform(min)),
-        ('Numerical', 'A type', SimpleTransform(lambda x: int(numerical(x)))),
-        ('Numerical', 'B type', SimpleTransform(lambda x: int(numerical(x)))),
+        ('Numerical', 'A type', SimpleTransform(numerical_type)),
+        ('Numerical', 'B type', SimpleTransform(numerical_type)),
         ('Sub', ['Numerical[A type]','Numerical[B type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Numerical[A type],Numerical[B type]]', SimpleTransform(abs)),
 
         ('Number of Samples', 'A', SimpleTransform(len)),
         ('Log', 'Number of Samples[A]', SimpleTransform(np.log)),
 
-        ('Number of Unique Samples', 'A', SimpleTransform(count_unique)),
-        ('Number of Unique Samples', 'B', SimpleTransform(count_unique)),
+        ('Summary', ['A','A type'], MultiColumnTransform(univariate_summary)),
+        ('Summary', ['B','B type'], MultiColumnTransform(univariate_summary)),
+
+        ('Number of Unique Samples', 'A', MultiColumnTransform(count_unique), ['Summary[A,A type]']),
+        ('Number of Unique Samples', 'B', MultiColumnTransform(count_unique), ['Summary[B,B type]']),
         ('Max', ['Number of Unique Samples[A]','Number of Unique Samples[B]'], MultiColumnTransform(max)),
         ('Min', ['Number of Unique Samples[A]','Number of Unique Samples[B]'], MultiColumnTransform(min)),
         ('Sub', ['Number of Unique Samples[A]','Number of Unique Samples[B]'], MultiColumnTransform(operator.sub)),
@@ -77,50 +431,53 @@ def get_all_features():
         ('Sub', ['Log[Number of Unique Samples[A]]','Log[Number of Unique Samples[B]]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Log[Number of Unique Samples[A]],Log[Number of Unique Samples[B]]]', SimpleTransform(abs)),
 
-        ('Ratio of Unique Samples', 'A', SimpleTransform(count_unique_ratio)),
-        ('Ratio of Unique Samples', 'B', SimpleTransform(count_unique_ratio)),
+        ('Ratio of Unique Samples', 'A', MultiColumnTransform(count_unique_ratio), ['Summary[A,A type]']),
+        ('Ratio of Unique Samples', 'B', MultiColumnTransform(count_unique_ratio), ['Summary[B,B type]']),
         ('Max', ['Ratio of Unique Samples[A]','Ratio of Unique Samples[B]'], MultiColumnTransform(max)),
         ('Min', ['Ratio of Unique Samples[A]','Ratio of Unique Samples[B]'], MultiColumnTransform(min)),
         ('Sub', ['Ratio of Unique Samples[A]','Ratio of Unique Samples[B]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Ratio of Unique Samples[A],Ratio of Unique Samples[B]]', SimpleTransform(abs)),
 
-        ('Normalized Value', ['A','A type'], MultiColumnTransform(normalize)),
-        ('Normalized Value', ['B','B type'], MultiColumnTransform(normalize)),
-        ('Count Value', ['A','A type'], MultiColumnTransform(count_value), ['Normalized Value[A,A type]']),
-        ('Count Value', ['B','B type'], MultiColumnTransform(count_value), ['Normalized Value[B,B type]']),
-        ('DisSeq', ['A','A type'], MultiColumnTransform(discrete_seq)),
-        ('DisSeq', ['B','B type'], MultiColumnTransform(discrete_seq)),
-        ('DisProb', ['A','A type'], MultiColumnTransform(discrete_probability), ['DisSeq[A,A type]']),
-        ('DisProb', ['B','B type'], MultiColumnTransform(discrete_probability), ['DisSeq[B,B type]']),
-
-        ('Normalized Entropy Baseline', ['A','A type'], MultiColumnTransform(normalized_entropy_baseline), ['Normalized Value[A,A type]']),
-        ('Normalized Entropy Baseline', ['B','B type'], MultiColumnTransform(normalized_entropy_baseline), ['Normalized Value[B,B type]']),
+        ('Normalized Value', ['A','A type'], MultiColumnTransform(normalize), ['Summary[A,A type]']),
+        ('Normalized Value', ['B','B type'], MultiColumnTransform(normalize), ['Summary[B,B type]']),
+        ('Count Value', ['A','A type'], MultiColumnTransform(count_value), ['Summary[A,A type]', 'Normalized Value[A,A type]']),
+        ('Count Value', ['B','B type'], MultiColumnTransform(count_value), ['Summary[B,B type]', 'Normalized Value[B,B type]']),
+        ('DisSeq', ['A','A type'], MultiColumnTransform(discrete_seq), ['Summary[A,A type]']),
+        ('DisSeq', ['B','B type'], MultiColumnTransform(discrete_seq), ['Summary[B,B type]']),
+        ('DisJoint', ['A','A type','B','B type'], MultiColumnTransform(discrete_joint_histogram), ['DisSeq[A,A type]', 'DisSeq[B,B type]']),
+        ('DisJoint', ['B','B type','A','A type'], MultiColumnTransform(discrete_joint_histogram), ['DisSeq[B,B type]', 'DisSeq[A,A type]', 'DisJoint[A,A type,B,B type]']),
+        ('DisProb', ['A','A type'], MultiColumnTransform(discrete_probability), ['DisSeq[A,A type]', 'DisJoint[A,A type,B,B type]']),
+        ('DisProb', ['B','B type'], MultiColumnTransform(discrete_probability), ['DisSeq[B,B type]', 'DisJoint[B,B type,A,A type]']),
+
+        ('Normalized Entropy Baseline', ['A','A type'], MultiColumnTransform(normalized_entropy_baseline), ['Summary[A,A type]']),
+        ('Normalized Entropy Baseline', ['B','B type'], MultiColumnTransform(normalized_entropy_baseline), ['Summary[B,B type]']),
         ('Max', ['Normalized Entropy Baseline[A,A type]','Normalized Entropy Baseline[B,B type]'], MultiColumnTransform(max)),
         ('Min', ['Normalized Entropy Baseline[A,A type]','Normalized Entropy Baseline[B,B type]'], MultiColumnTransform(min)),
         ('Sub', ['Normalized Entropy Baseline[A,A type]','Normalized Entropy Baseline[B,B type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Normalized Entropy Baseline[A,A type],Normalized Entropy Baseline[B,B type]]', SimpleTransform(abs)),
 
-        ('Normalized Entropy', ['A','A type'], MultiColumnTransform(normalized_entropy), ['Count Value[A,A type]']),
-        ('Normalized Entropy', ['B','B type'], MultiColumnTransform(normalized_entropy), ['Count Value[B,B type]']),
+        ('Normalized Entropy', ['A','A type'], MultiColumnTransform(normalized_entropy), ['Summary[A,A type]']),
+        ('Normalized Entropy', ['B','B type'], MultiColumnTransform(normalized_entropy), ['Summary[B,B type]']),
         ('Max', ['Normalized Entropy[A,A type]','Normalized Entropy[B,B type]'], MultiColumnTransform(max)),
         ('Min', ['Normalized Entropy[A,A type]','Normalized Entropy[B,B type]'], MultiColumnTransform(min)),
         ('Sub', ['Normalized Entropy[A,A type]','Normalized Entropy[B,B type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Normalized Entropy[A,A type],Normalized Entropy[B,B type]]', SimpleTransform(abs)),
 
-        ('IGCI', ['A','A type','B','B type'], MultiColumnTransform(igci), ['Normalized Value[A,A type]', 'Normalized Value[B,B type]']),
-        ('IGCI', ['B','B type','A','A type'], MultiColumnTransform(igci), ['Normalized Value[B,B type]', 'Normalized Value[A,A type]']),
+        ('IGCI Pair', ['A','A type','B','B type'], MultiColumnTransform(igci_pair), ['Summary[A,A type]', 'Summary[B,B type]']),
+        ('IGCI', ['A','A type','B','B type'], MultiColumnTransform(forward_value), ['IGCI Pair[A,A type,B,B type]']),
+        ('IGCI', ['B','B type','A','A type'], MultiColumnTransform(backward_value), ['IGCI Pair[A,A type,B,B type]']),
         ('Sub', ['IGCI[A,A type,B,B type]','IGCI[B,B type,A,A type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[IGCI[A,A type,B,B type],IGCI[B,B type,A,A type]]', SimpleTransform(abs)),
 
-        ('Gaussian Divergence', ['A','A type'], MultiColumnTransform(gaussian_divergence), ['Count Value[A,A type]']),
-        ('Gaussian Divergence', ['B','B type'], MultiColumnTransform(gaussian_divergence), ['Count Value[B,B type]']),
+        ('Gaussian Divergence', ['A','A type'], MultiColumnTransform(gaussian_divergence), ['Summary[A,A type]']),
+        ('Gaussian Divergence', ['B','B type'], MultiColumnTransform(gaussian_divergence), ['Summary[B,B type]']),
         ('Max', ['Gaussian Divergence[A,A type]','Gaussian Divergence[B,B type]'], MultiColumnTransform(max)),
         ('Min', ['Gaussian Divergence[A,A type]','Gaussian Divergence[B,B type]'], MultiColumnTransform(min)),
         ('Sub', ['Gaussian Divergence[A,A type]','Gaussian Divergence[B,B type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Gaussian Divergence[A,A type],Gaussian Divergence[B,B type]]', SimpleTransform(abs)),
 
-        ('Uniform Divergence', ['A','A type'], MultiColumnTransform(uniform_divergence), ['Count Value[A,A type]']),
-        ('Uniform Divergence', ['B','B type'], MultiColumnTransform(uniform_divergence), ['Count Value[B,B type]']),
+        ('Uniform Divergence', ['A','A type'], MultiColumnTransform(uniform_divergence), ['Summary[A,A type]']),
+        ('Uniform Divergence', ['B','B type'], MultiColumnTransform(uniform_divergence), ['Summary[B,B type]']),
         ('Max', ['Uniform Divergence[A,A type]','Uniform Divergence[B,B type]'], MultiColumnTransform(max)),
         ('Min', ['Uniform Divergence[A,A type]','Uniform Divergence[B,B type]'], MultiColumnTransform(min)),
         ('Sub', ['Uniform Divergence[A,A type]','Uniform Divergence[B,B type]'], MultiColumnTransform(operator.sub)),
@@ -140,51 +497,61 @@ def get_all_features():
         ('Sub', ['Normalized Discrete Entropy[A,A type]','Normalized Discrete Entropy[B,B type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Normalized Discrete Entropy[A,A type],Normalized Discrete Entropy[B,B type]]', SimpleTransform(abs)),
 
-        ('Discrete Joint Entropy', ['A','A type','B','B type'], MultiColumnTransform(discrete_joint_entropy), ['DisSeq[A,A type]', 'DisSeq[B,B type]']),
-        ('Normalized Discrete Joint Entropy', ['A','A type','B','B type'], MultiColumnTransform(normalized_discrete_joint_entropy), ['Discrete Joint Entropy[A,A type,B,B type]']),
+        ('Discrete Joint Entropy', ['A','A type','B','B type'], MultiColumnTransform(discrete_joint_entropy), ['DisSeq[A,A type]', 'DisSeq[B,B type]', 'DisJoint[A,A type,B,B type]']),
+        ('Normalized Discrete Joint Entropy', ['A','A type','B','B type'], MultiColumnTransform(normalized_discrete_joint_entropy), ['Discrete Joint Entropy[A,A type,B,B type]', 'DisJoint[A,A type,B,B type]']),
         ('Discrete Conditional Entropy', ['A','A type','B','B type'], MultiColumnTransform(discrete_conditional_entropy), ['Discrete Joint Entropy[A,A type,B,B type]', 'Discrete Entropy[B,B type]']),
         ('Discrete Conditional Entropy', ['B','B type','A','A type'], MultiColumnTransform(discrete_conditional_entropy), ['Discrete Joint Entropy[A,A type,B,B type]', 'Discrete Entropy[A,A type]']),
         ('Discrete Mutual Information', ['A','A type','B','B type'], MultiColumnTransform(discrete_mutual_information), ['Discrete Joint Entropy[A,A type,B,B type]', 'Discrete Entropy[A,A type]', 'Discrete Entropy[B,B type]']),
         ('Normalized Discrete Mutual Information', ['Discrete Mutual Information[A,A type,B,B type]','Min[Discrete Entropy[A,A type],Discrete Entropy[B,B type]]'], MultiColumnTransform(operator.div)),
         ('Normalized Discrete Mutual Information', ['Discrete Mutual Information[A,A type,B,B type]','Discrete Joint Entropy[A,A type,B,B type]'], MultiColumnTransform(operator.div)),
-        ('Adjusted Mutual Information', ['A','A type','B','B type'], MultiColumnTransform(adjusted_mutual_information), ['DisSeq[A,A type]', 'DisSeq[B,B type]']),
+        ('Adjusted Mutual Information', ['A','A type','B','B type'], MultiColumnTransform(adjusted_mutual_information), ['DisSeq[A,A type]', 'DisSeq[B,B type]', 'DisJoint[A,A type,B,B type]']),
 
-        ('Polyfit', ['A','A type','B','B type'], MultiColumnTransform(fit)),
-        ('Polyfit', ['B','B type','A','A type'], MultiColumnTransform(fit)),
+        ('Polyfit Sums', ['A','A type','B','B type'], MultiColumnTransform(polyfit_sums), ['Summary[A,A type]', 'Summary[B,B type]']),
+        ('Polyfit Pair', ['A','A type','B','B type'], MultiColumnTransform(polyfit_pair), ['Summary[A,A type]', 'Summary[B,B type]', 'Polyfit Sums[A,A type,B,B type]']),
+        ('Polyfit', ['A','A type','B','B type'], MultiColumnTransform(forward_value), ['Polyfit Pair[A,A type,B,B type]']),
+        ('Polyfit', ['B','B type','A','A type'], MultiColumnTransform(backward_value), ['Polyfit Pair[A,A type,B,B type]']),
         ('Sub', ['Polyfit[A,A type,B,B type]','Polyfit[B,B type,A,A type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Polyfit[A,A type,B,B type],Polyfit[B,B type,A,A type]]', SimpleTransform(abs)),
 
-        ('Polyfit Error', ['A','A type','B','B type'], MultiColumnTransform(fit_error)),
-        ('Polyfit Error', ['B','B type','A','A type'], MultiColumnTransform(fit_error)),
+        ('Polyfit Error Pair', ['A','A type','B','B type'], MultiColumnTransform(polyfit_error_pair), ['Polyfit Sums[A,A type,B,B type]']),
+        ('Polyfit Error', ['A','A type','B','B type'], MultiColumnTransform(forward_value), ['Polyfit Error Pair[A,A type,B,B type]']),
+        ('Polyfit Error', ['B','B type','A','A type'], MultiColumnTransform(backward_value), ['Polyfit Error Pair[A,A type,B,B type]']),
         ('Sub', ['Polyfit Error[A,A type,B,B type]','Polyfit Error[B,B type,A,A type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Polyfit Error[A,A type,B,B type],Polyfit Error[B,B type,A,A type]]', SimpleTransform(abs)),
 
-        ('Normalized Error Probability', ['A','A type','B','B type'], MultiColumnTransform(normalized_error_probability), ['DisSeq[A,A type]', 'DisSeq[B,B type]', 'DisProb[A,A type]', 'DisProb[B,B type]']),
-        ('Normalized Error Probability', ['B','B type','A','A type'], MultiColumnTransform(normalized_error_probability), ['DisSeq[B,B type]', 'DisSeq[A,A type]', 'DisProb[B,B type]', 'DisProb[A,A type]']),
+        ('Normalized Error Probability Pair', ['A','A type','B','B type'], MultiColumnTransform(normalized_error_probabilities), ['DisJoint[A,A type,B,B type]']),
+        ('Normalized Error Probability', ['A','A type','B','B type'], MultiColumnTransform(forward_value), ['Normalized Error Probability Pair[A,A type,B,B type]']),
+        ('Normalized Error Probability', ['B','B type','A','A type'], MultiColumnTransform(backward_value), ['Normalized Error Probability Pair[A,A type,B,B type]']),
         ('Sub', ['Normalized Error Probability[A,A type,B,B type]','Normalized Error Probability[B,B type,A,A type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Normalized Error Probability[A,A type,B,B type],Normalized Error Probability[B,B type,A,A type]]', SimpleTransform(abs)),
 
-        ('Conditional Distribution Entropy Variance', ['A','A type','B','B type'], MultiColumnTransform(fit_noise_entropy), ['DisSeq[A,A type]', 'DisSeq[B,B type]', 'DisProb[A,A type]']),
-        ('Conditional Distribution Entropy Variance', ['B','B type','A','A type'], MultiColumnTransform(fit_noise_entropy), ['DisSeq[B,B type]', 'DisSeq[A,A type]', 'DisProb[B,B type]']),
+        ('DisGroups', ['A','A type'], MultiColumnTransform(group_index), ['DisSeq[A,A type]']),
+        ('DisGroups', ['B','B type'], MultiColumnTransform(group_index), ['DisSeq[B,B type]']),
+        ('Conditional Distribution Entropy Variance', ['A','A type','B','B type'], MultiColumnTransform(fit_noise_entropy), ['DisSeq[A,A type]', 'DisSeq[B,B type]', 'DisProb[A,A type]', 'DisJoint[A,A type,B,B type]']),
+        ('Conditional Distribution Entropy Variance', ['B','B type','A','A type'], MultiColumnTransform(fit_noise_entropy), ['DisSeq[B,B type]', 'DisSeq[A,A type]', 'DisProb[B,B type]', 'DisJoint[B,B type,A,A type]']),
         ('Sub', ['Conditional Distribution Entropy Variance[A,A type,B,B type]','Conditional Distribution Entropy Variance[B,B type,A,A type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Conditional Distribution Entropy Variance[A,A type,B,B type],Conditional Distribution Entropy Variance[B,B type,A,A type]]', SimpleTransform(abs)),
 
-        ('Conditional Distribution Skewness Variance', ['A','A type','B','B type'], MultiColumnTransform(fit_noise_skewness), ['DisSeq[A,A type]', 'DisProb[A,A type]']),
-        ('Conditional Distribution Skewness Variance', ['B','B type','A','A type'], MultiColumnTransform(fit_noise_skewness), ['DisSeq[B,B type]', 'DisProb[B,B type]']),
+        ('Conditional Distribution Skewness Variance', ['A','A type','B','B type'], MultiColumnTransform(fit_noise_skewness), ['DisSeq[A,A type]', 'DisProb[A,A type]', 'DisJoint[A,A type,B,B type]', 'DisGroups[A,A type]']),
+        ('Conditional Distribution Skewness Variance', ['B','B type','A','A type'], MultiColumnTransform(fit_noise_skewness), ['DisSeq[B,B type]', 'DisProb[B,B type]', 'DisJoint[B,B type,A,A type]', 'DisGroups[B,B type]']),
         ('Sub', ['Conditional Distribution Skewness Variance[A,A type,B,B type]','Conditional Distribution Skewness Variance[B,B type,A,A type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Conditional Distribution Skewness Variance[A,A type,B,B type],Conditional Distribution Skewness Variance[B,B type,A,A type]]', SimpleTransform(abs)),
 
-        ('Conditional Distribution Kurtosis Variance', ['A','A type','B','B type'], MultiColumnTransform(fit_noise_kurtosis), ['DisSeq[A,A type]', 'DisProb[A,A type]']),
-        ('Conditional Distribution Kurtosis Variance', ['B','B type','A','A type'], MultiColumnTransform(fit_noise_kurtosis), ['DisSeq[B,B type]', 'DisProb[B,B type]']),
+        ('Conditional Distribution Kurtosis Variance', ['A','A type','B','B type'], MultiColumnTransform(fit_noise_kurtosis), ['DisSeq[A,A type]', 'DisProb[A,A type]', 'DisJoint[A,A type,B,B type]', 'DisGroups[A,A type]']),
+        ('Conditional Distribution Kurtosis Variance', ['B','B type','A','A type'], MultiColumnTransform(fit_noise_kurtosis), ['DisSeq[B,B type]', 'DisProb[B,B type]', 'DisJoint[B,B type,A,A type]', 'DisGroups[B,B type]']),
         ('Sub', ['Conditional Distribution Kurtosis Variance[A,A type,B,B type]','Conditional Distribution Kurtosis Variance[B,B type,A,A type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Conditional Distribution Kurtosis Variance[A,A type,B,B type],Conditional Distribution Kurtosis Variance[B,B type,A,A type]]', SimpleTransform(abs)),
 
-        ('DisSeq2', ['A','A type'], MultiColumnTransform(discrete_seq2)),
-        ('DisSeq2', ['B','B type'], MultiColumnTransform(discrete_seq2)),
-        ('DisProb2', ['A','A type'], MultiColumnTransform(discrete_probability2), ['DisSeq2[A,A type]']),
-        ('DisProb2', ['B','B type'], MultiColumnTransform(discrete_probability2), ['DisSeq2[B,B type]']),
-        ('Conditional Distribution Similarity', ['A','A type','B','B type'], MultiColumnTransform(conditional_distribution_similarity), ['DisSeq2[A,A type]','DisProb2[A,A type]','DisProb2[B,B type]']),
-        ('Conditional Distribution Similarity', ['B','B type','A','A type'], MultiColumnTransform(conditional_distribution_similarity), ['DisSeq2[B,B type]','DisProb2[B,B type]','DisProb2[A,A type]']),
+        ('DisSeq2', ['A','A type'], MultiColumnTransform(discrete_seq2), ['Summary[A,A type]']),
+        ('DisSeq2', ['B','B type'], MultiColumnTransform(discrete_seq2), ['Summary[B,B type]']),
+        ('DisJoint2', ['A','A type','B','B type'], MultiColumnTransform(discrete_joint_histogram), ['DisSeq2[A,A type]', 'DisSeq2[B,B type]']),
+        ('DisJoint2', ['B','B type','A','A type'], MultiColumnTransform(discrete_joint_histogram), ['DisSeq2[B,B type]', 'DisSeq2[A,A type]', 'DisJoint2[A,A type,B,B type]']),
+        ('DisProb2', ['A','A type'], MultiColumnTransform(discrete_probability2), ['DisSeq2[A,A type]', 'DisJoint2[A,A type,B,B type]']),
+        ('DisProb2', ['B','B type'], MultiColumnTransform(discrete_probability2), ['DisSeq2[B,B type]', 'DisJoint2[B,B type,A,A type]']),
+        ('DisGroups2', ['A','A type'], MultiColumnTransform(group_index), ['DisSeq2[A,A type]']),
+        ('DisGroups2', ['B','B type'], MultiColumnTransform(group_index), ['DisSeq2[B,B type]']),
+        ('Conditional Distribution Similarity', ['A','A type','B','B type'], MultiColumnTransform(conditional_distribution_similarity), ['DisSeq2[A,A type]','DisProb2[A,A type]','DisProb2[B,B type]','DisJoint2[A,A type,B,B type]','DisGroups2[A,A type]']),
+        ('Conditional Distribution Similarity', ['B','B type','A','A type'], MultiColumnTransform(conditional_distribution_similarity), ['DisSeq2[B,B type]','DisProb2[B,B type]','DisProb2[A,A type]','DisJoint2[B,B type,A,A type]','DisGroups2[B,B type]']),
         ('Sub', ['Conditional Distribution Similarity[A,A type,B,B type]','Conditional Distribution Similarity[B,B type,A,A type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Conditional Distribution Similarity[A,A type,B,B type],Conditional Distribution Similarity[B,B type,A,A type]]', SimpleTransform(abs)),
 
@@ -227,8 +594,8 @@ def get_all_features():
         ('Sub', ['Kurtosis[A,A type]','Kurtosis[B,B type]'], MultiColumnTransform(operator.sub)),
         ('Abs', 'Sub[Kurtosis[A,A type],Kurtosis[B,B type]]', SimpleTransform(abs)),
 
-        ('Pearson R', ['A','A type','B','B type'], MultiColumnTransform(correlation), ['Normalized Error Probability[A,A type,B,B type]','Normalized Error Probability[B,B type,A,A type]']),
-        ('HSIC', ['A','A type','B','B type'], MultiColumnTransform(normalized_hsic), ['Pearson R[A,A type,B,B type]']),
+        ('Pearson R', ['A','A type','B','B type'], MultiColumnTransform(correlation), ['Normalized Error Probability[A,A type,B,B type]','Normalized Error Probability[B,B type,A,A type]', 'Summary[A,A type]', 'Summary[B,B type]']),
+        ('HSIC', ['A','A type','B','B type'], MultiColumnTransform(hsic_transformer(hsic)), ['Pearson R[A,A type,B,B type]', 'Summary[A,A type]', 'Summary[B,B type]']),
         ('Abs', 'Pearson R[A,A type,B,B type]', SimpleTransform(abs))
         ]
 
@@ -238,50 +605,73 @@ def get_all_features():
                              +selected_independence_categorical_features + selected_independence_cn_features + selected_independence_numerical_features
                              +selected_symmetric_categorical_features + selected_symmetric_cn_features + selected_symmetric_numerical_features
                              +selected_onestep_categorical_features + selected_onestep_cn_features + selected_onestep_numerical_features)
-    used_feature_names_add = used_feature_names
-    all_features_clean = []
-    for feature_prefix, column_names, extractor, aux_column_names in reversed(all_features):
-        if not type(column_names) is list:
-            column_names = [column_names]
-
-        feature_name = feature_prefix + '[' + ','.join(column_names) + ']'
-        if len([x for x in used_feature_names_add if feature_name in x]) > 0:
-            used_feature_names_add = set(list(used_feature_names_add) + column_names + aux_column_names)
-
-    for feature_prefix, column_names, extractor, aux_column_names in all_features:
-        if type(column_names) is list:
-            feature_name = feature_prefix + '[' + ','.join(column_names) + ']'
-        else:
-            feature_name = feature_prefix + '[' + column_names + ']'
-
-        if len([x for x in used_feature_names_add if feature_name in x]) > 0:
-            all_features_clean.append((feature_prefix, column_names, extractor, aux_column_names))
+    needed = set(node.name for node, _ in compile_plan(all_features, used_feature_names, RAW_COLUMNS).steps)
+    all_features_clean = [fea for fea in all_features if feature_name(fea[0], fea[1]) in needed]
 
     return all_features_clean, used_feature_names
 
 
-def extract_features(X, features=None, y=None):
+def pair_cost(a, b):
+    n = len(a)
+    return n * np.log(n + 2) + len(np.unique(a)) * len(np.unique(b))
+
+def schedule_pairs(costs, n_jobs, chunks_per_job=4):
+    # largest pairs go out first; small ones are grouped so every task carries similar work
+    order = np.argsort(costs, kind='mergesort')[::-1]
+    target = costs.sum() / float(n_jobs * chunks_per_job)
+    chunks, chunk, total = [], [], 0.
+    for i in order:
+        chunk.append(i)
+        total += costs[i]
+        if total >= target:
+            chunks.append(chunk)
+            chunk, total = [], 0.
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def extract_chunk((extractor, X, features, y, kwargs)):
+    return extractor(X, features, y=y, **kwargs), kwargs.get('profile')
+
+def parallel_extract_features(X, features, y=None, n_jobs=-1, extractor=None, **kwargs):
+    if extractor is None:
+        extractor = extract_features
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count() + 1 + n_jobs
+    costs = np.array([pair_cost(a, b) for a, b in zip(X['A'], X['B'])], dtype=float)
+    chunks = schedule_pairs(costs, n_jobs)
+    if y is not None:
+        y = np.asarray(y)
+    # every task profiles into a fresh PlanProfile, merged back here
+    profile = kwargs.pop('profile', None)
+    tasks = [(extractor, X.iloc[c], features, None if y is None else y[c],
+              dict(kwargs, profile=None if profile is None else PlanProfile())) for c in chunks]
+    pool = multiprocessing.Pool(n_jobs)
+    try:
+        results = pool.map(extract_chunk, tasks, chunksize=1)
+    finally:
+        pool.terminate()
+        pool.join()
+    parts = [part for part, _ in results]
+    if profile is not None:
+        for _, p in results:
+            profile.merge(p)
+    positions = np.concatenate(chunks)
+    result = pd.concat(parts)
+    # an extractor may emit several consecutive rows per pair
+    k = len(result) // len(positions)
+    return result.iloc[(k * np.argsort(positions)[:, np.newaxis] + np.arange(k)).ravel()]
+
+def extract_features(X, features=None, y=None, n_jobs=1, outputs=None, cache=None, profile=None):
     if features is None:
         features, _ = get_all_features()
-    X = X.copy()
-    X['A type'] = pd.Series.apply(X['A type'], lambda x: 0 if x == BINARY else 1 if x == CATEGORICAL else 2 if x == NUMERICAL else np.nan)
-    X['B type'] = pd.Series.apply(X['B type'], lambda x: 0 if x == BINARY else 1 if x == CATEGORICAL else 2 if x == NUMERICAL else np.nan)
-    for feature_name, column_names, extractor, aux_column_names in features:
-        if not type(column_names) is list:
-            column_names = [column_names]
-
-        feature_name = feature_name + '[' + ','.join(column_names) + ']'
-        if (feature_name[0] == '+') or (feature_name not in X.columns):
-            if feature_name[0] == '+':
-                feature_name = feature_name[1:]
-
-            column_names = column_names + aux_column_names
-            if len(column_names) > 1:
-                tmp = extractor.fit_transform(X[column_names], y)
-            else:
-                tmp = extractor.fit_transform(X[column_names[0]], y)
-
-            X[feature_name] = tmp
+    if cache is not None:
+        return cache.extract(X, features, outputs, n_jobs=n_jobs, profile=profile)
+    if n_jobs != 1 and len(X) > 1:
+        return parallel_extract_features(X, features, y, n_jobs, outputs=outputs, profile=profile)
+    X = convert_types(X)
+    for name, values in compile_plan(features, outputs, available=X.columns).execute(X, profile):
+        X[name] = values
 
     return X
 
@@ -291,36 +681,80 @@ def get_sym_col(col):
     col = col.replace(',A,', '<>').replace(',B,', ',A,').replace('<>', ',B,')
     return col
 
-def extract_features2(X, X_inv, features=None, y=None): #, used_feature_names=used_feature_names):
-    symmetric_feature_names = ['HSIC[A,A type,B,B type]', 'Pearson R[A,A type,B,B type]', 'Discrete Joint Entropy[A,A type,B,B type]', 'Adjusted Mutual Information[A,A type,B,B type]']
+SYMMETRIC_FEATURES = ['HSIC[A,A type,B,B type]', 'Pearson R[A,A type,B,B type]', 'Discrete Joint Entropy[A,A type,B,B type]', 'Adjusted Mutual Information[A,A type,B,B type]']
+
+RAW_MIRROR = {'A': 'B', 'A type': 'B type', 'B': 'A', 'B type': 'A type'}
+
+def mirror_map(names, available):
+    # feature of the swapped pair -> column of the original pair holding the same value
+    available = set(available)
+    mirror = {}
+    for name in names:
+        if name in SYMMETRIC_FEATURES:
+            mirror[name] = name
+        elif get_sym_col(name) in available:
+            mirror[name] = get_sym_col(name)
+    return mirror
+
+def extract_features2(X, X_inv, features=None, y=None, profile=None): #, used_feature_names=used_feature_names):
     if features is None:
         features, _ = get_all_features()
-    X = X.copy()
-    X['A type'] = pd.Series.apply(X['A type'], lambda x: 0 if x == BINARY else 1 if x == CATEGORICAL else 2 if x == NUMERICAL else np.nan)
-    X['B type'] = pd.Series.apply(X['B type'], lambda x: 0 if x == BINARY else 1 if x == CATEGORICAL else 2 if x == NUMERICAL else np.nan)
-    for feature_name, column_names, extractor, aux_column_names in features:
-        if not type(column_names) is list:
-            column_names = [column_names]
+    X = convert_types(X)
+    names = [feature_name(fea[0], fea[1]) for fea in features]
+    mirror = mirror_map(names, X_inv.columns)
+    for name in names:
+        if name in mirror:
+            X[name] = X_inv[mirror[name]]
 
-        feature_name = feature_name + '[' + ','.join(column_names) + ']'
-        if feature_name in symmetric_feature_names:
-            X[feature_name] = X_inv[feature_name]
-            continue
+    for name, values in compile_plan(features, available=X.columns).execute(X, profile):
+        X[name] = values
 
-        if get_sym_col(feature_name) in X_inv.columns:
-            X[feature_name] = X_inv[get_sym_col(feature_name)]
-            continue
-
-        if (feature_name[0] == '+') or (feature_name not in X.columns):
-            if feature_name[0] == '+':
-                feature_name = feature_name[1:]
+    return X
 
-            column_names = column_names + aux_column_names
-            if len(column_names) > 1:
-                tmp = extractor.fit_transform(X[column_names], y)
-            else:
-                tmp = extractor.fit_transform(X[column_names[0]], y)
+def swap_pair(X):
+    X_inv = X.copy()
+    for a, b in RAW_MIRROR.items():
+        X_inv[a] = X[b]
+    return X_inv
 
-            X[feature_name] = tmp
+def extract_features_symmetric(X, features=None, outputs=None, y=None, n_jobs=1, cache=None, profile=None):
+    """Features of every pair followed by those of the swapped pair, in one pass.
 
-    return X
+    Same rows as extract_features followed by predict.symmetrize_features, but the
+    swapped row takes every mirrored feature from the slots of the original row and
+    only computes what has no mirror.
+    """
+    if features is None:
+        features, _ = get_all_features()
+    if cache is not None:
+        return cache.extract(X, features, outputs, symmetric=True, n_jobs=n_jobs, profile=profile)
+    if n_jobs != 1 and len(X) > 1:
+        return parallel_extract_features(X, features, y, n_jobs, extract_features_symmetric, outputs=outputs, profile=profile)
+    X = convert_types(X)
+    names = [feature_name(fea[0], fea[1]) for fea in features]
+    if outputs is None:
+        outputs = names
+    mirror = dict((c, c) for c in X.columns)
+    mirror.update(RAW_MIRROR)
+    mirror.update(mirror_map(names, set(names) | set(X.columns)))
+
+    inverse = compile_plan(features, outputs, available=mirror.keys())
+    forward = compile_plan(features, list(outputs) + [mirror[c] for c in inverse.sources], available=X.columns)
+    slot = dict((name, i) for i, name in enumerate(forward.names))
+    perm = [slot[mirror[c]] for c in inverse.sources]
+
+    rows = []
+    for values in zip(*[X[c].values for c in forward.sources]):
+        fwd = forward.run(values, profile)
+        rows.append(fwd)
+        rows.append(inverse.run([fwd[j] for j in perm], profile))
+
+    n = len(X)
+    order = np.arange(2 * n).reshape(2, n).T.ravel()
+    result = pd.concat([X, swap_pair(X)]).iloc[order]
+    inv_slot = dict((name, i) for i, name in enumerate(inverse.names))
+    for name in outputs:
+        i, j = slot[name], inv_slot[name]
+        result[name] = as_column([r[j if k % 2 else i] for k, r in enumerate(rows)])
+    result.index.name = "SampleID"
+    return result
@@ -2,22 +2,23 @@
 cimport numpy as np
 import numpy as np
 import pandas as pd
-from sklearn.metrics import adjusted_mutual_info_score
-from scipy.special import psi
+from scipy.special import psi, gammaln
 from scipy.stats.stats import pearsonr
 from scipy.stats import skew, kurtosis
 from collections import Counter, defaultdict
 import itertools
+cimport cython
+from libc.math cimport exp, log, floor
 
 cdef int BINARY      = 0 #"Binary"
 cdef int CATEGORICAL = 1 #"Categorical"
 cdef int NUMERICAL   = 2 #"Numerical"
 
-def count_unique(x):
-    return len(set(x))
+def count_unique(x, sx=None):
+    return len(sx.levels) if sx is not None else len(np.unique(x))
 
-def count_unique_ratio(x):
-    return len(set(x))/float(len(x))
+def count_unique_ratio(x, sx=None):
+    return count_unique(x, sx)/float(len(x))
 
 def binary(tp):
     #assert type(tp) is str
@@ -37,57 +38,372 @@ def binary_entropy(p, base):
     cdef float factor = 1.0 / np.log(base)
     return h * factor
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def shift_scale(x, double shift, double scale):
+    # (x - shift) * scale in one pass
+    cdef const double[::1] cx = np.ascontiguousarray(x, dtype=float)
+    out = np.empty(cx.shape[0])
+    cdef double[::1] co = out
+    cdef Py_ssize_t i
+    with nogil:
+        for i in range(cx.shape[0]):
+            co[i] = (cx[i] - shift) * scale
+    return out
+
 def standardize(x):
     cdef float factor = np.std(x)
     if factor > 0:
-        x = (x - np.mean(x)) * (1.0 / factor)
+        x = shift_scale(x, np.mean(x), 1.0 / factor)
     else:
-        x = (x - np.mean(x))
+        x = shift_scale(x, np.mean(x), 1.0)
     return x
 
-def discrete_seq(x, tx, ffactor=3, maxdev=3):
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def code_counts(codes, Py_ssize_t minlength=0):
+    # np.bincount of non-negative integer codes
+    cdef const Py_ssize_t[::1] cc = np.ascontiguousarray(codes, dtype=np.intp)
+    cdef Py_ssize_t i, n = minlength
+    with nogil:
+        for i in range(cc.shape[0]):
+            if cc[i] >= n:
+                n = cc[i] + 1
+    out = np.zeros(n, dtype=np.intp)
+    cdef Py_ssize_t[::1] co = out
+    with nogil:
+        for i in range(cc.shape[0]):
+            co[cc[i]] += 1
+    return out
+
+COUNT_RANGE = 1 << 16
+
+def unique_levels(x):
+    # np.unique(x, return_inverse=True, return_counts=True); integer labels over a short range,
+    # as binary and categorical variables and discretized sequences hold, are counted instead of sorted
+    x = np.asarray(x)
+    if len(x) > 0 and x.dtype.kind in 'fi':
+        lo, hi = x.min(), x.max()
+        if hi - lo < COUNT_RANGE:
+            xi = x.astype(np.int64)
+            if (xi == x).all():
+                xi -= xi.min()
+                counts = code_counts(xi)
+                present = np.flatnonzero(counts)
+                index = np.cumsum(counts > 0) - 1
+                return (present + lo).astype(x.dtype), index[xi], counts[present]
+    return np.unique(x, return_inverse=True, return_counts=True)
+
+class UnivariateSummary(object):
+    # one sort of the variable (a count for labels); the standardized and normalized
+    # versions are built on first use
+    def __init__(self, x, tx):
+        self.x, self.tx, self.n = x, tx, len(x)
+        if numerical(tx):
+            self.levels, self.inverse, self.counts = np.unique(x, return_inverse=True, return_counts=True)
+        else:
+            self.levels, self.inverse, self.counts = unique_levels(x)
+        self.cache = {}
+
+    def standardized(self):
+        if 'standardized' not in self.cache:
+            self.cache['standardized'] = standardize(self.x)
+        return self.cache['standardized']
+
+    def trimmed(self, maxdev):
+        # mean and std of the standardized values within maxdev
+        key = ('trimmed', maxdev)
+        if key not in self.cache:
+            x = self.standardized()
+            xf = x[np.abs(x) < maxdev]
+            self.cache[key] = np.mean(xf), np.std(xf)
+        return self.cache[key]
+
+    def level_values(self):
+        # value of each level before normalization: itself, or its frequency rank for labels.
+        # Equal counts are ranked like Counter(x).most_common() ranks them, which follows the
+        # dict order of the labels, so the Counter is filled in order of first occurrence
+        if numerical(self.tx):
+            return self.levels
+        if 'level_values' not in self.cache:
+            first = np.unique(self.inverse, return_index=True)[1]
+            cx = Counter()
+            for j in np.argsort(first, kind='mergesort'):
+                cx[self.levels[j]] = self.counts[j]
+            keys = np.array([k for k, _ in cx.most_common()], dtype=self.levels.dtype)
+            rank = np.empty(len(keys))
+            rank[np.searchsorted(self.levels, keys)] = np.arange(len(keys))
+            self.cache['level_values'] = rank
+        return self.cache['level_values']
+
+    def normalized(self):
+        if 'normalized' not in self.cache:
+            y = self.x if numerical(self.tx) else self.level_values()[self.inverse]
+            shift = np.mean(y)
+            y = (y - shift)
+            factor = normalization_factor(y)
+            if factor > 0:
+                y = y * (1.0 / factor)
+            self.cache['normalized'] = y
+            self.cache['normalization'] = shift, factor
+        return self.cache['normalized']
+
+    def value_counts(self):
+        # sorted distinct normalized values with their counts
+        if 'value_counts' not in self.cache:
+            self.normalized()
+            shift, factor = self.cache['normalization']
+            keys = (self.level_values() - shift)
+            if factor > 0:
+                keys = keys * (1.0 / factor)
+            keys, inverse = np.unique(keys, return_inverse=True)
+            self.cache['value_counts'] = keys, np.bincount(inverse, weights=self.counts)
+            self.cache['value_index'] = inverse
+        return self.cache['value_counts']
+
+    def normalized_groups(self):
+        # distinct normalized values, the index of every sample among them, and their counts
+        if 'normalized_groups' not in self.cache:
+            keys, counts = self.value_counts()
+            self.cache['normalized_groups'] = keys, self.cache['value_index'][self.inverse], counts.astype(int)
+        return self.cache['normalized_groups']
+
+def univariate_summary(x, tx):
+    return UnivariateSummary(x, tx)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def discretize(x, double shift, double scale, int maxthr):
+    # floor((x - shift) * scale) clipped to [-(maxthr + 1), maxthr]
+    cdef const double[::1] cx = np.ascontiguousarray(x, dtype=float)
+    out = np.empty(cx.shape[0])
+    cdef double[::1] co = out
+    cdef Py_ssize_t i
+    cdef double v
+    with nogil:
+        for i in range(cx.shape[0]):
+            v = floor((cx[i] - shift) * scale)
+            if v > maxthr:
+                v = maxthr
+            elif v < -(maxthr + 1):
+                v = -(maxthr + 1)
+            co[i] = v
+    return out
+
+def discrete_seq(x, tx, sx=None, ffactor=3, maxdev=3):
     cdef int maxthr = ffactor * maxdev
-    if numerical(tx) and (len(set(x)) > 2 * (maxthr + 1)):
-        x = standardize(x)
-        xf = x[np.abs(x) < maxdev]
-        x = (x - np.mean(xf)) * (ffactor / np.std(xf))
-        x = np.floor(x)
-        x[x > maxthr] = maxthr
-        x[x < - (maxthr + 1)] = - (maxthr + 1)
+    if numerical(tx) and (count_unique(x, sx) > 2 * (maxthr + 1)):
+        if sx is not None:
+            x = sx.standardized()
+            xf_mean, xf_std = sx.trimmed(maxdev)
+        else:
+            x = standardize(x)
+            xf = x[np.abs(x) < maxdev]
+            xf_mean, xf_std = np.mean(xf), np.std(xf)
+        x = discretize(x, xf_mean, ffactor / xf_std, maxthr)
     return x
 
-def discrete_probability(x, tx, xd=None, ffactor=3, maxdev=3):
+class JointHistogram(object):
+    # counts of two discretized sequences over their sorted levels; tables much larger
+    # than the sample are kept as (row, col, count) triples instead of a dense array
+    def __init__(self, xd, yd, sparse=None):
+        self.xlevels, xc, self.xcount = unique_levels(xd)
+        self.ylevels, yc, self.ycount = unique_levels(yd)
+        nx, ny = len(self.xlevels), len(self.ylevels)
+        self.n = len(xc)
+        cells = xc.astype(np.int64) * ny + yc
+        if sparse is None:
+            sparse = nx * ny > 4 * self.n + 1024
+        if sparse:
+            cells, self.counts = np.unique(cells, return_counts=True)
+            self.rows, self.cols = cells // ny, cells % ny
+            self.dense = None
+        else:
+            self.dense = code_counts(cells, nx * ny).reshape(nx, ny)
+
+    @property
+    def shape(self):
+        return len(self.xlevels), len(self.ylevels)
+
+    def transpose(self):
+        t = JointHistogram.__new__(JointHistogram)
+        t.xlevels, t.ylevels, t.xcount, t.ycount, t.n = self.ylevels, self.xlevels, self.ycount, self.xcount, self.n
+        if self.dense is None:
+            t.dense = None
+            order = np.lexsort((self.rows, self.cols))
+            t.rows, t.cols, t.counts = self.cols[order], self.rows[order], self.counts[order]
+        else:
+            t.dense = self.dense.T
+        return t
+
+    def nonzero(self):
+        if self.dense is None:
+            return self.counts
+        return self.dense[self.dense > 0]
+
+    def cells(self):
+        # nonzero cells as (row, col, count), ordered by row then col
+        if self.dense is None:
+            return self.rows, self.cols, self.counts
+        rows, cols = np.nonzero(self.dense)
+        return rows, cols, self.dense[rows, cols]
+
+    def dense_rows(self, keep):
+        # the rows selected by a boolean mask over xlevels, as a dense array
+        if self.dense is not None:
+            return self.dense[keep]
+        index = np.cumsum(keep) - 1
+        sel = keep[self.rows]
+        out = np.zeros((index[-1] + 1, len(self.ylevels)), dtype=self.counts.dtype)
+        out[index[self.rows[sel]], self.cols[sel]] = self.counts[sel]
+        return out
+
+    def sorted_rows(self, keep):
+        # dense_rows(keep) with every row sorted ascending, placed from the nonzero cells:
+        # a row with k of them is ny - k zeros followed by its k sorted counts
+        rows, cols, counts = self.cells()
+        if 4 * len(counts) >= len(self.xlevels) * len(self.ylevels):
+            return np.sort(self.dense_rows(keep), axis=1)
+        sel = keep[rows]
+        index = np.cumsum(keep) - 1
+        rows, counts = index[rows[sel]], counts[sel]
+        order = np.lexsort((counts, rows))
+        rows, counts = rows[order], counts[order]
+        nnz = np.bincount(rows, minlength=index[-1] + 1)
+        starts = np.cumsum(nnz) - nnz
+        ny = len(self.ylevels)
+        out = np.zeros((index[-1] + 1, ny), dtype=counts.dtype)
+        out[rows, ny - nnz[rows] + np.arange(len(rows)) - starts[rows]] = counts
+        return out
+
+    def row_max(self):
+        if self.dense is None:
+            # cells are sorted by row and every level occurs at least once
+            return np.maximum.reduceat(self.counts, np.searchsorted(self.rows, np.arange(len(self.xlevels))))
+        return self.dense.max(axis=1)
+
+    def col_max(self):
+        if self.dense is None:
+            order = np.lexsort((self.rows, self.cols))
+            cols = self.cols[order]
+            return np.maximum.reduceat(self.counts[order], np.searchsorted(cols, np.arange(len(self.ylevels))))
+        return self.dense.max(axis=0)
+
+    def row_counter(self):
+        return Counter(dict(zip(self.xlevels.tolist(), self.xcount.tolist())))
+
+    def col_counter(self):
+        return Counter(dict(zip(self.ylevels.tolist(), self.ycount.tolist())))
+
+class GroupIndex(object):
+    # one stable sort of a discretized sequence, after which every level is a contiguous
+    # segment; built on first use since some kernels only need it for numerical y
+    def __init__(self, xd):
+        self.xd = xd
+        self.cache = None
+
+    def segments(self):
+        # (order, starts, counts) with starts and counts following the sorted levels
+        if self.cache is None:
+            order = np.argsort(self.xd, kind='mergesort')
+            xs = self.xd[order]
+            starts = np.r_[0, np.nonzero(xs[1:] != xs[:-1])[0] + 1]
+            self.cache = order, starts, np.diff(np.r_[starts, len(xs)])
+        return self.cache
+
+def group_index(x, tx, xd=None, ffactor=3, maxdev=3):
     if xd is None:
-        xd = discrete_seq(x, tx, ffactor, maxdev)
+        xd = discrete_seq(x, tx, None, ffactor, maxdev)
+    return GroupIndex(xd)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def segment_moments(v, starts, w=None):
+    # central moments 2, 3 and 4 of every (non-empty) segment of v, optionally weighted by w
+    cdef const double[::1] cv = np.ascontiguousarray(v, dtype=float)
+    cdef const double[::1] cw = cv if w is None else np.ascontiguousarray(w, dtype=float)
+    cdef bint weighted = w is not None
+    cdef const Py_ssize_t[::1] cs = np.ascontiguousarray(starts, dtype=np.intp)
+    cdef Py_ssize_t k, i, lo, hi, ns = cs.shape[0], n = cv.shape[0]
+    m2, m3, m4 = np.zeros(ns), np.zeros(ns), np.zeros(ns)
+    cdef double[::1] c2 = m2, c3 = m3, c4 = m4
+    cdef double wi, total, mean, d, d2, s2, s3, s4, vmin, vmax
+    with nogil:
+        for k in range(ns):
+            lo = cs[k]
+            hi = cs[k + 1] if k + 1 < ns else n
+            if hi <= lo:
+                continue
+            total, mean = 0, 0
+            vmin, vmax = cv[lo], cv[lo]
+            for i in range(lo, hi):
+                wi = cw[i] if weighted else 1.0
+                total += wi
+                mean += cv[i] * wi
+                vmin = min(vmin, cv[i])
+                vmax = max(vmax, cv[i])
+            mean /= total
+            s2, s3, s4 = 0, 0, 0
+            for i in range(lo, hi):
+                wi = cw[i] if weighted else 1.0
+                d = cv[i] - mean
+                d2 = d * d
+                s2 += wi * d2
+                s3 += wi * (d2 * d)
+                s4 += wi * (d2 * d2)
+            # constant segments have no spread, whatever the rounding of their mean
+            c2[k] = 0 if vmin == vmax else s2 / total
+            c3[k] = s3 / total
+            c4[k] = s4 / total
+    return m2, m3, m4
+
+def discrete_joint_histogram(x, tx, y, ty, xd=None, yd=None, cyx=None, ffactor=3, maxdev=3):
+    if cyx is not None:
+        return cyx.transpose()
+    x = discrete_seq(x, tx, None, ffactor, maxdev) if xd is None else xd
+    y = discrete_seq(y, ty, None, ffactor, maxdev) if yd is None else yd
+    return JointHistogram(x, y)
+
+def discrete_probability(x, tx, xd=None, cxy=None, ffactor=3, maxdev=3):
+    if cxy is not None:
+        return cxy.row_counter()
+    if xd is None:
+        xd = discrete_seq(x, tx, None, ffactor, maxdev)
     return Counter(xd)
 
 def discretized_sequences(x, tx, y, ty, ffactor=3, maxdev=3):
-    x = discrete_seq(x, tx, ffactor, maxdev)
-    y = discrete_seq(y, ty, ffactor, maxdev)
+    x = discrete_seq(x, tx, None, ffactor, maxdev)
+    y = discrete_seq(y, ty, None, ffactor, maxdev)
     return x, y
 
-def normalized_error_probability(x, tx, y, ty, xd=None, yd=None, cx=None, cy=None, ffactor=3, maxdev=3):
-    x = discrete_seq(x, tx, ffactor, maxdev) if xd is None else xd
-    y = discrete_seq(y, ty, ffactor, maxdev) if yd is None else yd
-    if cx is None:
-        cx = Counter(x)
-    if cy is None:
-        cy = Counter(y)
-    pxy = defaultdict(lambda: 0)
-    for p in itertools.izip(x, y):
-        pxy[p] += 1
-    pxy = np.array([[pxy[(a,b)] for b in cy] for a in cx], dtype = float)
-    pxy = pxy/min(len(x), len(y))
-    perr = 1 - np.sum(pxy.max(axis=1))
-    max_perr = 1 - np.max(pxy.sum(axis=0))
+def error_probability_ratio(n, row_max, ycount):
+    # counted in integers so an x that never beats the best constant guess gives exactly 1
+    perr = np.float64(n - np.sum(row_max))
+    max_perr = np.float64(n - np.max(ycount))
     pnorm = perr/max_perr
     assert (pnorm <= 1)
     return pnorm
 
+def normalized_error_probability(x, tx, y, ty, xd=None, yd=None, cx=None, cy=None, cxy=None, ffactor=3, maxdev=3):
+    if cxy is None:
+        x = discrete_seq(x, tx, None, ffactor, maxdev) if xd is None else xd
+        y = discrete_seq(y, ty, None, ffactor, maxdev) if yd is None else yd
+        n = min(len(x), len(y))
+        cxy = JointHistogram(x[:n], y[:n])
+    return error_probability_ratio(cxy.n, cxy.row_max(), cxy.ycount)
+
+def normalized_error_probabilities(x, tx, y, ty, cxy=None, ffactor=3, maxdev=3):
+    # both directions from one table: (x predicting y, y predicting x)
+    if cxy is None:
+        cxy = discrete_joint_histogram(x, tx, y, ty, None, None, None, ffactor, maxdev)
+    return (error_probability_ratio(cxy.n, cxy.row_max(), cxy.ycount),
+            error_probability_ratio(cxy.n, cxy.col_max(), cxy.xcount))
+
 def discrete_entropy(x, tx, c=None, ffactor=3, maxdev=3, bias_factor=0.7):
     if c is None:
-        c = discrete_probability(x, tx, None, ffactor, maxdev)
-    pk = np.array(c.values(), dtype=float)
+        c = discrete_probability(x, tx, None, None, ffactor, maxdev)
+    pk = np.array(c.values() if isinstance(c, dict) else c, dtype=float)
     pk = pk/pk.sum()
     vec = pk*np.log(pk)
     S = -np.sum(vec, axis=0)
@@ -106,17 +422,18 @@ def discrete_divergence(cx, cy):
         sum += px*np.log(px/py)
     return sum
 
-def discrete_joint_entropy(x, tx, y, ty, xd=None, yd=None, ffactor=3, maxdev=3):
-    x = discrete_seq(x, tx, ffactor, maxdev) if xd is None else xd
-    y = discrete_seq(y, ty, ffactor, maxdev) if yd is None else yd
-    return discrete_entropy(zip(x,y), CATEGORICAL)
+def discrete_joint_entropy(x, tx, y, ty, xd=None, yd=None, cxy=None, ffactor=3, maxdev=3):
+    if cxy is None:
+        cxy = discrete_joint_histogram(x, tx, y, ty, xd, yd, None, ffactor, maxdev)
+    return discrete_entropy(x, CATEGORICAL, cxy.nonzero())
 
-def normalized_discrete_joint_entropy(x, tx, y, ty, e=None, ffactor=3, maxdev=3):
-    x, y = discretized_sequences(x, tx, y, ty, ffactor, maxdev)
+def normalized_discrete_joint_entropy(x, tx, y, ty, e=None, cxy=None, ffactor=3, maxdev=3):
+    if cxy is None:
+        cxy = discrete_joint_histogram(x, tx, y, ty, None, None, None, ffactor, maxdev)
     if e is None:
-        e = discrete_entropy(zip(x,y), CATEGORICAL)
-    nx = 2*(ffactor*maxdev+1) if numerical(tx) else count_unique(x)
-    ny = 2*(ffactor*maxdev+1) if numerical(ty) else count_unique(y)
+        e = discrete_joint_entropy(x, tx, y, ty, None, None, cxy)
+    nx = 2*(ffactor*maxdev+1) if numerical(tx) else cxy.shape[0]
+    ny = 2*(ffactor*maxdev+1) if numerical(ty) else cxy.shape[1]
     if nx*ny>0: e = e/np.log(nx*ny)
     return e
 
@@ -127,10 +444,86 @@ def discrete_conditional_entropy(x, tx, y, ty, exy=None, ey=None):
         ey = discrete_entropy(y, ty)
     return exy - ey
 
-def adjusted_mutual_information(x, tx, y, ty, xd=None, yd=None, ffactor=3, maxdev=3):
-    x = discrete_seq(x, tx, ffactor, maxdev) if xd is None else xd
-    y = discrete_seq(y, ty, ffactor, maxdev) if yd is None else yd
-    return adjusted_mutual_info_score(x, y)
+LOG_FACTORIAL = np.zeros(1)
+
+def log_factorial(n):
+    # log(k!) for k = 0..n, grown on demand and shared by all pairs
+    global LOG_FACTORIAL
+    if len(LOG_FACTORIAL) <= n:
+        LOG_FACTORIAL = gammaln(np.arange(max(n + 1, 2 * len(LOG_FACTORIAL)), dtype=float) + 1)
+    return LOG_FACTORIAL
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double emi_sum(const double[:] av, const double[:] am, const double[:] bv, const double[:] bm, long n, const double[:] lf) nogil:
+    cdef Py_ssize_t i, j
+    cdef long ai, bj, nij
+    cdef double N = n, lfixed, s, total = 0
+    for i in range(av.shape[0]):
+        ai = <long>av[i]
+        for j in range(bv.shape[0]):
+            bj = <long>bv[j]
+            lfixed = lf[ai] + lf[bj] + lf[n - ai] + lf[n - bj] - lf[n]
+            s = 0
+            for nij in range(max(1, ai + bj - n), min(ai, bj) + 1):
+                s += (nij / N) * (log(N) + log(nij) - log(ai) - log(bj)) * \
+                     exp(lfixed - lf[nij] - lf[ai - nij] - lf[bj - nij] - lf[n - ai - bj + nij])
+            total += am[i] * bm[j] * s
+    return total
+
+def emi_sums(const double[:] av, const double[:] am, const double[:] bv, const double[:] bm, long n, const double[:] lf):
+    cdef double emi
+    with nogil:
+        emi = emi_sum(av, am, bv, bm, n, lf)
+    return emi
+
+EMI_CACHE = {}
+EMI_CACHE_SIZE = 100000
+
+def expected_mutual_information(a, b, n):
+    # E[MI] over tables with row sums a and column sums b (hypergeometric model). Only
+    # the multisets of the sums matter, so levels of equal size are summed once and
+    # the result is memoized; binary and categorical pairs repeat marginals a lot.
+    a, b = tuple(sorted(a)), tuple(sorted(b))
+    key = (a, b, n) if a <= b else (b, a, n)
+    if key in EMI_CACHE:
+        return EMI_CACHE[key]
+    if len(a) == 1 or len(b) == 1:
+        emi = 0.0
+    else:
+        av, am = np.unique(a, return_counts=True)
+        bv, bm = np.unique(b, return_counts=True)
+        emi = emi_sums(av.astype(float), am.astype(float), bv.astype(float), bm.astype(float), n, log_factorial(n))
+    if len(EMI_CACHE) >= EMI_CACHE_SIZE:
+        EMI_CACHE.clear()
+    EMI_CACHE[key] = emi
+    return emi
+
+def label_entropy(c):
+    c = c.astype(float)
+    return -np.sum((c / c.sum()) * (np.log(c) - np.log(c.sum())))
+
+def adjusted_mutual_information(x, tx, y, ty, xd=None, yd=None, cxy=None, ffactor=3, maxdev=3):
+    # same value as sklearn's adjusted_mutual_info_score with the 'max' normalization
+    if cxy is None:
+        x = discrete_seq(x, tx, None, ffactor, maxdev) if xd is None else xd
+        y = discrete_seq(y, ty, None, ffactor, maxdev) if yd is None else yd
+        cxy = JointHistogram(x, y)
+    if len(cxy.xlevels) == len(cxy.ylevels) == 1:
+        return 1.0
+    n = cxy.n
+    rows, cols, counts = cxy.cells()
+    outer = cxy.xcount[rows].astype(np.int64) * cxy.ycount[cols].astype(np.int64)
+    p = counts / float(n)
+    mi = np.sum(p * (np.log(counts) - np.log(n)) + p * (-np.log(outer) + np.log(n) + np.log(n)))
+    emi = expected_mutual_information(cxy.xcount.tolist(), cxy.ycount.tolist(), n)
+    denominator = max(label_entropy(cxy.xcount), label_entropy(cxy.ycount)) - emi
+    # keep the sign when rounding puts emi above the entropy
+    if denominator < 0:
+        denominator = min(denominator, -np.finfo('float64').eps)
+    else:
+        denominator = max(denominator, np.finfo('float64').eps)
+    return (mi - emi) / denominator
 
 def discrete_mutual_information(x, tx, y, ty, exy=None, ex=None, ey=None):
     if ex is None:
@@ -154,17 +547,20 @@ def normalized_discrete_entropy(x, tx, e=None, uni=None, ffactor=3, maxdev=3):
     return e
 
 # Continuous information measures
-def to_numerical(x, y):
-    dx = defaultdict(lambda: np.zeros(2))
-    for i, a in enumerate(x):
-        dx[a][0] += y[i]
-        dx[a][1] += 1
-    for a in dx.keys():
-        dx[a][0] /= dx[a][1]
-    x = np.array([dx[a][0] for a in x], dtype=float)
-    return x
+def to_numerical(x, y, sx=None):
+    # every label replaced by the mean of y over it, summed in sample order per label
+    if sx is not None:
+        return to_numerical_levels(sx, y)[0]
+    levels, inverse, counts = unique_levels(x)
+    return (np.bincount(inverse, weights=y) / counts)[inverse]
+
+def normalization_factor(y):
+    cdef float factor = np.std(y)
+    return factor
 
-def normalize(x, tx):
+def normalize(x, tx, sx=None):
+    if sx is not None:
+        return sx.normalized()
     if not numerical(tx): # reassign labels according to its frequency
         cx = Counter(x)
         xmap = dict()
@@ -175,76 +571,108 @@ def normalize(x, tx):
         y = x
 
     y = (y - np.mean(y))
-    cdef float factor = np.std(y)
+    factor = normalization_factor(y)
     if factor > 0:
         y = y * (1.0 / factor)
     return y
 
-def normalized_entropy_baseline(x, tx, xd=None):
-    if len(set(x)) < 2:
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def spacing_log_sum(xs, counts=None, double m=1):
+    # sum of log(delta / m / c) over the nonzero spacings delta of the sorted values xs,
+    # each weighted by the count c of its upper value (1 without counts), and their number
+    cdef const double[::1] cx = np.ascontiguousarray(xs, dtype=float)
+    cdef const double[::1] cc = cx if counts is None else np.ascontiguousarray(counts, dtype=float)
+    cdef bint weighted = counts is not None
+    cdef Py_ssize_t i, k = 0
+    cdef double delta, c, total = 0
+    with nogil:
+        for i in range(1, cx.shape[0]):
+            delta = cx[i] - cx[i-1]
+            if delta != 0:
+                c = cc[i] if weighted else 1.0
+                total += c * log(delta / m / c)
+                k += 1
+    return total, k
+
+def normalized_entropy_baseline(x, tx, sx=None, xd=None):
+    if count_unique(x, sx) < 2:
         return 0
-    x = normalize(x, tx) if xd is None else xd
-    xs = np.sort(x)
-    delta = xs[1:] - xs[:-1]
-    delta = delta[delta != 0]
-    hx = np.mean(np.log(delta))
-    hx += psi(len(delta))
+    if sx is not None:
+        xs = sx.value_counts()[0]
+    else:
+        x = normalize(x, tx) if xd is None else xd
+        xs = np.sort(x)
+    total, k = spacing_log_sum(xs)
+    hx = total / k if k > 0 else np.nan
+    hx += psi(k)
     hx -= psi(1)
     return hx
 
 
-def count_value(x, tx, xd=None):
+def count_value(x, tx, sx=None, xd=None):
+    if sx is not None:
+        return Counter(dict(zip(*[v.tolist() for v in sx.value_counts()])))
     x = normalize(x, tx) if xd is None else xd
     cx = Counter(x)
     return cx
 
-def normalized_entropy(x, tx, cx=None, m=2):
+def sorted_value_counts(x, tx, sx=None, cx=None):
+    if sx is not None:
+        return sx.value_counts()
     if cx is None:
         cx = count_value(x, tx)
-    if len(cx) < 2:
-        return 0
     xk = np.array(cx.keys(), dtype=float)
     xk.sort()
-    delta = (xk[1:] - xk[:-1])/m
-    counter = np.array([cx[i] for i in xk], dtype=float)
-    hx = np.sum(counter[1:]*np.log(delta/counter[1:]))/len(x)
-    hx += (psi(len(delta)) - np.log(len(delta)))
+    return xk, np.array([cx[i] for i in xk], dtype=float)
+
+def normalized_entropy(x, tx, sx=None, cx=None, m=2):
+    xk, counter = sorted_value_counts(x, tx, sx, cx)
+    if len(xk) < 2:
+        return 0
+    # distinct sorted values have no zero spacing
+    total, k = spacing_log_sum(xk, counter, m)
+    hx = total/len(x)
+    hx += (psi(k) - np.log(k))
     hx += np.log(len(x))
     hx -= (psi(m) - np.log(m))
     return hx
 
+def igci_score(xs, inverse, counts, y):
+    # xs: sorted distinct values of x with their counts, inverse: index of each sample in xs
+    means = np.bincount(inverse, weights=y) / counts
+    dx = np.diff(xs)
+    dy = np.diff(means)
+    selec = dy != 0
+    counter = np.minimum(counts[1:], counts[:-1])[selec]
+    return np.sum(counter*np.log(dx[selec]/np.abs(dy[selec]))) / len(y)
+
 def igci(x, tx, y, ty, xd=None, yd=None):
-    if len(set(x)) < 2:
-        hxy = 0
-    else:
-        x = normalize(x, tx) if xd is None else xd
-        y = normalize(y, ty) if yd is None else yd
-        len_x = len(x)
-        if len_x != len(set(x)):
-            dx = defaultdict(lambda: np.zeros(2))
-            for a, b in itertools.izip(x, y):
-                dx[a][0] += b
-                dx[a][1] += 1
-            xy = np.array([[a, dx[a][0]] for a in sorted(dx.keys())], dtype=float)
-            counter = np.array([dx[a][1] for a in xy[:,0]], dtype=int)
-            xy[:, 1] /= counter
+    if count_unique(x) < 2:
+        return 0
+    x = normalize(x, tx) if xd is None else xd
+    y = normalize(y, ty) if yd is None else yd
+    xs, inverse, counts = np.unique(x, return_inverse=True, return_counts=True)
+    return igci_score(xs, inverse, counts, y)
+
+def igci_pair(x, tx, y, ty, sx=None, sy=None):
+    # (x -> y, y -> x) from the sorted summaries of both variables
+    if sx is None:
+        sx = univariate_summary(x, tx)
+    if sy is None:
+        sy = univariate_summary(y, ty)
+    scores = []
+    for s, t in ((sx, sy), (sy, sx)):
+        if len(s.levels) < 2:
+            scores.append(0)
         else:
-            xy = pd.DataFrame({'x': x, 'y': y}).sort('x').values
-            counter = np.ones(len_x)
-
-        delta = np.diff(xy, axis=0)
-        selec = delta[:,1] != 0
-        delta = delta[selec]
-        counter = np.min([counter[1:], counter[:-1]], axis=0)
-        counter = counter[selec]
-        hxy = np.sum(counter*np.log(delta[:,0]/np.abs(delta[:,1])))/ len_x
-    return hxy
-
-def gaussian_divergence(x, tx, cx=None, m=2):
-    if cx is None:
-        cx = count_value(x, tx)
-    xk = np.array(cx.keys(), dtype=float)
-    xk.sort()
+            xs, inverse, counts = s.normalized_groups()
+            scores.append(igci_score(xs, inverse, counts, t.normalized()))
+    return tuple(scores)
+
+def gaussian_divergence(x, tx, sx=None, cx=None, m=2):
+    xk, counter = sorted_value_counts(x, tx, sx, cx)
     delta = np.zeros(len(xk))
     if len(xk) > 1:
         delta[0] = xk[1] - xk[0]
@@ -252,7 +680,6 @@ def gaussian_divergence(x, tx, cx=None, m=2):
         delta[-1] = xk[-1] - xk[-2]
     else:
         delta = np.array(np.sqrt(12))
-    counter = np.array([cx[i] for i in xk], dtype=float)
     boundaries = np.zeros(len(xk) + 1)
     boundaries[0] = xk[0] - delta[0]*0.5
     boundaries[1:-1] = (xk[:-1] + xk[1:])*0.5
@@ -263,11 +690,8 @@ def gaussian_divergence(x, tx, cx=None, m=2):
     hx += (psi(m) - np.log(m))
     return hx
 
-def uniform_divergence(x, tx, cx=None, m=2):
-    if cx is None:
-        cx = count_value(x, tx)
-    xk = np.array(cx.keys(), dtype=float)
-    xk.sort()
+def uniform_divergence(x, tx, sx=None, cx=None, m=2):
+    xk, counter = sorted_value_counts(x, tx, sx, cx)
     delta = np.zeros(len(xk))
     if len(xk) > 1:
         delta[0] = xk[1]-xk[0]
@@ -275,7 +699,6 @@ def uniform_divergence(x, tx, cx=None, m=2):
         delta[-1] = xk[-1]-xk[-2]
     else:
         delta = np.array(np.sqrt(12))
-    counter = np.array([cx[i] for i in xk], dtype=float)
     delta = delta/np.sum(delta)
     hx = np.sum(counter*np.log(counter/delta))/len(x)
     hx -= np.log(len(x))
@@ -301,134 +724,225 @@ def moment21(x, tx, y, ty, xd=None, yd=None):
 def moment31(x, tx, y, ty, xd=None, yd=None):
     return normalized_moment(x, tx, y, ty, 3, 1, xd, yd)
 
-def fit(x, tx, y, ty):
-    if (not numerical(tx)) or (not numerical(ty)):
-        return 0
-    if (len(set(x)) <= 2) or (len(set(y)) <= 2):
-        return 0
-    x = (x - np.mean(x))/np.std(x)
-    y = (y - np.mean(y))/np.std(y)
-    xy1 = np.polyfit(x, y, 1)
-    xy2 = np.polyfit(x, y, 2)
-    return abs(2*xy2[0]) + abs(xy2[1]-xy1[0])
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def power_sums(u, v, int order, int cross):
+    # sum(u**k), sum(v**k) for k <= order and sum(u**k * v), sum(v**k * u) for k <= cross, in one pass
+    cdef const double[:] cu = np.ascontiguousarray(u, dtype=float)
+    cdef const double[:] cv = np.ascontiguousarray(v, dtype=float)
+    su, sv = np.zeros(order + 1), np.zeros(order + 1)
+    tuv, tvu = np.zeros(cross + 1), np.zeros(cross + 1)
+    cdef double[:] csu = su, csv = sv, ctuv = tuv, ctvu = tvu
+    cdef Py_ssize_t i
+    cdef int k
+    cdef double a, b, pa, pb
+    with nogil:
+        for i in range(cu.shape[0]):
+            a, b = cu[i], cv[i]
+            pa, pb = 1.0, 1.0
+            for k in range(order + 1):
+                csu[k] += pa
+                csv[k] += pb
+                if k <= cross:
+                    ctuv[k] += pa * b
+                    ctvu[k] += pb * a
+                pa *= a
+                pb *= b
+    return su, sv, tuv, tvu
 
-def fit_error(x, tx, y, ty, m=2):
+def poly_coefficients(s, t, int deg):
+    # least squares polynomial from its normal equations, highest order first like np.polyfit
+    a = np.array([[s[j + k] for k in xrange(deg + 1)] for j in xrange(deg + 1)])
+    return np.linalg.solve(a, t[:deg + 1])[::-1]
+
+class PolyfitSums(object):
+    # standardized pair (u, v) with its power sums, shared by both directions of Polyfit
+    # and Polyfit Error; cu and cv count the distinct values of u and v
+    def __init__(self, u, v, cu, cv, int m=2):
+        self.u = (u - np.mean(u))/np.std(u)
+        self.v = (v - np.mean(v))/np.std(v)
+        self.cu, self.cv = cu, cv
+        self.su, self.sv, self.tuv, self.tvu = power_sums(self.u, self.v, max(2*m, 4), max(m, 2))
+
+    def oriented(self, reverse):
+        if reverse:
+            return self.v, self.u, self.sv, self.tvu
+        return self.u, self.v, self.su, self.tuv
+
+    def curvature(self, reverse=False):
+        # what Polyfit measures: 2 * quadratic term plus the change of the slope
+        s, t = self.oriented(reverse)[2:]
+        xy1 = poly_coefficients(s, t, 1)
+        xy2 = poly_coefficients(s, t, 2)
+        return abs(2*xy2[0]) + abs(xy2[1]-xy1[0])
+
+    def error(self, reverse=False, m=2):
+        x, y, s, t = self.oriented(reverse)
+        deg = m if min(self.cu, self.cv) > m else min(self.cu, self.cv)-1
+        return np.std(y - np.polyval(poly_coefficients(s, t, deg), x))
+
+def to_numerical_levels(sx, y):
+    # to_numerical from the summary of x: the mean of y over each level, and its distinct values
+    means = np.bincount(sx.inverse, weights=y) / sx.counts
+    return means[sx.inverse], count_unique(means)
+
+def polyfit_sums(x, tx, y, ty, sx=None, sy=None, m=2):
+    if sx is None:
+        sx = univariate_summary(x, tx)
+    if sy is None:
+        sy = univariate_summary(y, ty)
+    cx, cy = len(sx.levels), len(sy.levels)
     if categorical(tx) and categorical(ty):
-        x = normalize(x, tx)
-        y = normalize(y, ty)
+        x, y = sx.normalized(), sy.normalized()
     elif categorical(tx) and numerical(ty):
-        x = to_numerical(x, y)
+        x, cx = to_numerical_levels(sx, y)
     elif numerical(tx) and categorical(ty):
-        y = to_numerical(y, x)
-    x = (x - np.mean(x))/np.std(x)
-    y = (y - np.mean(y))/np.std(y)
-    if (count_unique(x) <= m) or (count_unique(y) <= m):
-        xy = np.polyfit(x, y, min(count_unique(x), count_unique(y))-1)
-    else:
-        xy = np.polyfit(x, y, m)
-    return np.std(y - np.polyval(xy, x))
+        y, cy = to_numerical_levels(sy, x)
+    return PolyfitSums(x, y, cx, cy, m)
 
-def fit_noise_entropy(x, tx, y, ty, xd=None, yd=None, cx=None, ffactor=3, maxdev=3, minc=10):
-    x = discrete_seq(x, tx, ffactor, maxdev) if xd is None else xd
-    y = discrete_seq(y, ty, ffactor, maxdev) if yd is None else yd
-    if cx is None:
-        cx = Counter(xd)
-    entyx = []
-    for a in cx.iterkeys():
-        if cx[a] > minc:
-            entyx.append(discrete_entropy(y[x==a], CATEGORICAL))
+def polyfit_pair(x, tx, y, ty, sx=None, sy=None, ps=None):
+    if (not numerical(tx)) or (not numerical(ty)):
+        return 0, 0
+    cx = count_unique(x, sx) if ps is None else ps.cu
+    cy = count_unique(y, sy) if ps is None else ps.cv
+    if (cx <= 2) or (cy <= 2):
+        return 0, 0
+    if ps is None:
+        ps = polyfit_sums(x, tx, y, ty, sx, sy)
+    return ps.curvature(), ps.curvature(True)
+
+def polyfit_error_pair(x, tx, y, ty, ps=None, m=2):
+    if ps is None:
+        ps = polyfit_sums(x, tx, y, ty, None, None, m)
+    return ps.error(False, m), ps.error(True, m)
+
+def fit(x, tx, y, ty):
+    return polyfit_pair(x, tx, y, ty)[0]
+
+def fit_error(x, tx, y, ty, m=2):
+    return polyfit_error_pair(x, tx, y, ty, None, m)[0]
+
+def fit_noise_entropy(x, tx, y, ty, xd=None, yd=None, cx=None, cxy=None, ffactor=3, maxdev=3, minc=10):
+    if cxy is None:
+        x = discrete_seq(x, tx, None, ffactor, maxdev) if xd is None else xd
+        y = discrete_seq(y, ty, None, ffactor, maxdev) if yd is None else yd
+        cxy = JointHistogram(x, y)
+    # entropy of y within every level of x, from the rows of the joint table
+    rows, cols, counts = cxy.cells()
+    starts = np.searchsorted(rows, np.arange(len(cxy.xlevels)))
+    pk = counts / cxy.xcount[rows].astype(float)
+    entyx = -np.add.reduceat(pk*np.log(pk), starts)
+    entyx += 0.7*(np.diff(np.r_[starts, len(rows)]) - 1)/(2.0*cxy.xcount)
+    entyx = entyx[cxy.xcount > minc]
     if len(entyx) == 0: return 0
-    n = 2*(ffactor*maxdev+1) if numerical(ty) else len(set(y))
+    n = 2*(ffactor*maxdev+1) if numerical(ty) else len(cxy.ylevels)
     return np.std(entyx)/np.log(n)
 
-def fit_noise_skewness(x, tx, y, ty, xd=None, cx=None, ffactor=3, maxdev=3, minc=8):
+def conditional_moments(y, ty, xd, cxy=None, gx=None, minc=8):
+    # central moments of y normalized within every level of xd holding at least minc samples
+    if numerical(ty):
+        if gx is None:
+            gx = GroupIndex(xd)
+        order, starts, counts = gx.segments()
+        m2, m3, m4 = segment_moments(y[order].astype(float), starts)
+    else:
+        # labels are replaced by their frequency rank within the level
+        if cxy is None:
+            cxy = JointHistogram(xd, y)
+        rows, cols, counts = cxy.cells()
+        order = np.lexsort((-counts, rows))
+        rows = rows[order]
+        starts = np.searchsorted(rows, np.arange(len(cxy.xlevels)))
+        rank = np.arange(len(rows)) - starts[rows]
+        m2, m3, m4 = segment_moments(rank.astype(float), starts, counts[order].astype(float))
+        counts = cxy.xcount
+    keep = counts >= minc
+    return m2[keep], m3[keep], m4[keep]
+
+def fit_noise_skewness(x, tx, y, ty, xd=None, cx=None, cxy=None, gx=None, ffactor=3, maxdev=3, minc=8):
     if xd is None:
-        xd = discrete_seq(x, tx, ffactor, maxdev)
-    if cx is None:
-        cx = Counter(xd)
-    skewyx = []
-    for a in cx.iterkeys():
-        if cx[a] >= minc:
-            skewyx.append(normalized_skewness(y[xd==a], ty))
+        xd = discrete_seq(x, tx, None, ffactor, maxdev)
+    m2, m3, m4 = conditional_moments(y, ty, xd, cxy, gx, minc)
+    skewyx = m3 / np.where(m2 > 0, m2, 1)**1.5
+    skewyx[m2 == 0] = 0
     return np.std(skewyx) if len(skewyx) > 0 else 0
 
-def fit_noise_kurtosis(x, tx, y, ty, xd=None, cx=None, ffactor=3, maxdev=3, minc=8):
-    xd = discrete_seq(x, tx, ffactor, maxdev) if xd is None else xd
-    if cx is None:
-        cx = Counter(xd)
-    kurtyx = []
-    for a in cx.iterkeys():
-        if cx[a] >= minc:
-            kurtyx.append(normalized_kurtosis(y[xd==a], ty))
+def fit_noise_kurtosis(x, tx, y, ty, xd=None, cx=None, cxy=None, gx=None, ffactor=3, maxdev=3, minc=8):
+    xd = discrete_seq(x, tx, None, ffactor, maxdev) if xd is None else xd
+    m2, m3, m4 = conditional_moments(y, ty, xd, cxy, gx, minc)
+    kurtyx = m4 / np.where(m2 > 0, m2, 1)**2
+    kurtyx[m2 == 0] = 0
+    kurtyx -= 3
     return np.std(kurtyx) if len(kurtyx) > 0 else 0
 
-def discrete_seq2(x, tx, ffactor=2, maxdev=3):
+def discrete_seq2(x, tx, sx=None, ffactor=2, maxdev=3):
     cdef int maxthr = ffactor * maxdev
-    if numerical(tx) and (len(set(x)) > 2 * (maxthr + 1)):
-        x = standardize(x)
-        xf = x[np.abs(x) < maxdev]
-        x = (x - np.mean(xf)) * (ffactor / np.std(xf))
-        x = np.floor(x)
-        x[x > maxthr] = maxthr
-        x[x < - (maxthr + 1)] = - (maxthr + 1)
+    if numerical(tx) and (count_unique(x, sx) > 2 * (maxthr + 1)):
+        if sx is not None:
+            x = sx.standardized()
+            xf_mean, xf_std = sx.trimmed(maxdev)
+        else:
+            x = standardize(x)
+            xf = x[np.abs(x) < maxdev]
+            xf_mean, xf_std = np.mean(xf), np.std(xf)
+        x = discretize(x, xf_mean, ffactor / xf_std, maxthr)
     return x
 
-def discrete_probability2(x, tx, xd=None, ffactor=2, maxdev=3):
+def discrete_probability2(x, tx, xd=None, cxy=None, ffactor=2, maxdev=3):
+    if cxy is not None:
+        return cxy.row_counter()
     if xd is None:
-        xd = discrete_seq(x, tx, ffactor, maxdev)
+        xd = discrete_seq(x, tx, None, ffactor, maxdev)
     return Counter(xd)
 
-def conditional_distribution_similarity(x, tx, y, ty, xd=None, cx=None, cy=None, ffactor=2, maxdev=3, minc=12):
+def cross_correlation(rows, c):
+    # full cross-correlation of every row with c, lag -(ny-1) first; counts stay integers,
+    # so equal correlations compare equal and argmax takes the first of them
+    cdef int ny = len(c)
+    if ny <= 64:
+        padded = np.zeros((len(rows), 3*ny-2), dtype=np.int64)
+        padded[:, ny-1:2*ny-1] = rows
+        windows = np.arange(2*ny-1)[:, np.newaxis] + np.arange(ny)
+        return np.dot(padded[:, windows], c)
+    size = 1 << int(np.ceil(np.log2(2*ny-1)))
+    xcorr = np.fft.irfft(np.fft.rfft(rows, size) * np.fft.rfft(c[::-1], size), size)
+    return np.rint(xcorr[:, :2*ny-1]).astype(np.int64)
+
+def conditional_distribution_similarity(x, tx, y, ty, xd=None, cx=None, cy=None, cxy=None, gx=None, ffactor=2, maxdev=3, minc=12):
     if xd is None:
-        xd = discrete_seq(x, tx, ffactor, maxdev)
-    if cx is None:
-        cx = Counter(xd)
-    if cy is None:
-        yd = discrete_seq(y, ty, ffactor, maxdev)
-        cy = Counter(yd)
-    yrange = sorted(cy.keys())
-    ny = len(yrange)
-    py = np.array([cy[i] for i in yrange], dtype=float)
-    py = py/py.sum()
-    pyx = []
+        xd = discrete_seq(x, tx, None, ffactor, maxdev)
+    if cxy is None:
+        yd = discrete_seq(y, ty, None, ffactor, maxdev)
+        cxy = JointHistogram(xd, yd)
+    ny = len(cxy.ylevels)
+    cnt = cxy.xcount
+    keep = cnt > minc
+    if not keep.any(): return 0
+    cnt = cnt[keep].astype(float)[:, np.newaxis]
     if not numerical(ty):
-        for a in cx.iterkeys():
-            if cx[a] > minc:
-                cyx = Counter(y[xd==a])
-                pyxa = np.array([cyx[i] for i in yrange], dtype=float)
-                pyxa.sort()
-                pyxa = pyxa/cx[a]
-                pyx.append(pyxa)
-    elif len(set(y)) > 2*(ffactor*maxdev+1):
-        for a in cx.iterkeys():
-            if cx[a] > minc:
-                yx = y[xd==a]
-                yx = (yx - np.mean(yx))
-                yx = np.floor(yx*ffactor)
-                yx[yx > ffactor*maxdev] = ffactor*maxdev
-                yx[yx < -(ffactor*maxdev+1)] = -(ffactor*maxdev+1)
-                cyx = Counter(yx.astype(int))
-                pyxa = np.array([cyx[i] for i in xrange(-(ffactor*maxdev+1), (ffactor*maxdev+1))], dtype=float)
-                pyxa = pyxa/cx[a]
-                pyx.append(pyxa)
+        pyx = cxy.sorted_rows(keep)/cnt
+    elif count_unique(y) > 2*(ffactor*maxdev+1):
+        # y centered within every level of x, then binned
+        if gx is None:
+            gx = GroupIndex(xd)
+        order, starts, counts = gx.segments()
+        ys = y[order]
+        ys = ys - np.repeat(np.add.reduceat(ys, starts)/counts, counts)
+        ys = discretize(ys, 0, ffactor, ffactor*maxdev)
+        nb = 2*(ffactor*maxdev+1)
+        cells = np.repeat(np.arange(len(starts)), counts)*nb + (ys + (ffactor*maxdev+1)).astype(int)
+        pyx = code_counts(cells, len(starts)*nb).reshape(-1, nb)[keep]/cnt
     else:
-        for a in cx.iterkeys():
-            if cx[a] > minc:
-                cyx = Counter(y[xd==a])
-                pyxa = [cyx[i] for i in yrange]
-                pyxax = np.array([0]*(ny-1) + pyxa + [0]*(ny-1), dtype=float)
-                xcorr = [sum(py*pyxax[i:i+ny]) for i in xrange(2*ny-1)]
-                imax = xcorr.index(max(xcorr))
-                pyxa = np.array([0]*(2*ny-2-imax) + pyxa + [0]*imax, dtype=float)
-                pyxa = pyxa/cx[a]
-                pyx.append(pyxa)
-
-    if len(pyx)==0: return 0
-    pyx = np.array(pyx)
+        # align every conditional histogram to py at its best cross-correlation lag
+        rows = cxy.dense_rows(keep)
+        imax = np.argmax(cross_correlation(rows, cxy.ycount), axis=1)
+        pyx = np.zeros((len(rows), 3*ny-2))
+        pyx[np.arange(len(rows))[:, np.newaxis], (2*ny-2-imax)[:, np.newaxis] + np.arange(ny)] = rows/cnt
+
     pyx = pyx - pyx.mean(axis=0)
     return np.std(pyx)
 
-def correlation(x, tx, y, ty, nepxy=None, nepyx=None):
+def correlation(x, tx, y, ty, nepxy=None, nepyx=None, sx=None, sy=None):
     if categorical(tx) and categorical(ty):
         if nepxy is None:
             nepxy = normalized_error_probability(x, tx, y, ty)
@@ -438,30 +952,102 @@ def correlation(x, tx, y, ty, nepxy=None, nepyx=None):
         r = 1 - nperr
     else:
         if categorical(tx) and numerical(ty):
-            x = to_numerical(x, y)
+            x = to_numerical(x, y, sx)
         elif numerical(tx) and categorical(ty):
-            y = to_numerical(y, x)
+            y = to_numerical(y, x, sy)
         x = (x-np.mean(x))/np.std(x)
         y = (y-np.mean(y))/np.std(y)
         r = pearsonr(x, y)[0]
     return r
 
 ################################ HSIC ######################################
+def median(v):
+    # partial selection instead of a full sort
+    cdef int n = len(v)
+    cdef int k = n // 2
+    if n == 0:
+        return np.nan
+    if n % 2:
+        return np.partition(v, k)[k]
+    v = np.partition(v, [k-1, k])
+    return 0.5*(v[k-1] + v[k])
+
+def sq_dists(X, Y):
+    G = np.sum(X*X, axis=1)[:, np.newaxis]
+    F = np.sum(Y*Y, axis=1)[np.newaxis, :]
+    return G + F - 2.0*np.dot(X, Y.T)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def sq_dists1(x):
+    # sq_dists of a one dimensional sample, from the differences themselves
+    cdef const double[::1] cx = np.ascontiguousarray(x, dtype=float)
+    cdef Py_ssize_t i, j, m = cx.shape[0]
+    H = np.empty((m, m))
+    cdef double[:, ::1] ch = H
+    cdef double d
+    with nogil:
+        for i in range(m):
+            ch[i, i] = 0
+            for j in range(i + 1, m):
+                d = cx[i] - cx[j]
+                ch[i, j] = d * d
+                ch[j, i] = d * d
+    return H
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def gaussian_kernel(H, double deg):
+    # exp(-H/(2 deg**2)), in place over the squared distances H
+    cdef double[:, ::1] ch = H
+    cdef double width = 2.0*deg*deg
+    cdef Py_ssize_t i, j
+    with nogil:
+        for i in range(ch.shape[0]):
+            for j in range(ch.shape[1]):
+                ch[i, j] = exp(-ch[i, j]/width)
+    return H
+
+def median_width(H):
+    # kernel size from the median squared distance between distinct points
+    d = H[np.triu_indices(H.shape[0], 1)]
+    return np.sqrt(0.5*median(d[d>0]))
+
 def rbf_dot(X, deg):
 #Set kernel size to median distance between points, if no kernel specified
+    if X.ndim == 1 or X.shape[1] == 1:
+        H = sq_dists1(X.ravel())
+    else:
+        H = sq_dists(X, X)
+    if deg == -1:
+        deg = median_width(H)
+    return gaussian_kernel(H, deg)
+
+def rbf_features(X, deg, n_components, approx, rng):
+#Explicit features Z with Z Z' approximating the rbf kernel matrix of X
     if X.ndim == 1:
         X = X[:, np.newaxis]
-    G = np.sum(X*X, axis=1)[:, np.newaxis]
-    H = G + G.T - 2.0*np.dot(X, X.T)
+    m = X.shape[0]
     if deg == -1:
-        dists = (H - np.tril(H)).flatten()
-        deg = np.sqrt(0.5*np.median(dists[dists>0]))
-    H = np.exp(-H/(2.0*deg**2))
-
-    return H
+        indx = rng.permutation(m)[:WIDTH_PNT]
+        deg = median_width(sq_dists(X[indx], X[indx]))
+    if approx == 'rff':
+        W = rng.normal(scale=1.0/deg, size=(X.shape[1], n_components))
+        b = rng.uniform(0, 2*np.pi, n_components)
+        return np.sqrt(2.0/n_components)*np.cos(np.dot(X, W) + b)
+    elif approx == 'nystroem':
+        C = X[rng.permutation(m)[:n_components]]
+        Kmm = np.exp(-sq_dists(C, C)/(2.0*deg**2))
+        s, U = np.linalg.eigh(Kmm)
+        keep = s > 1e-10*s.max()
+        Knm = np.exp(-sq_dists(X, C)/(2.0*deg**2))
+        return np.dot(Knm, U[:, keep]/np.sqrt(s[keep]))
+    raise ValueError("Unknown kernel approximation: %s" % approx)
 
+WIDTH_PNT = 1000
 
-def FastHsicTestGamma(X, Y, sig=[-1,-1]):
+def FastHsicTestGamma(X, Y, sig=[-1,-1], maxpnt=200, approx=None, n_components=100, random_state=0):
 #This function implements the HSIC independence test using a Gamma approximation
 #to the test threshold
 #Inputs:
@@ -469,12 +1055,15 @@ def FastHsicTestGamma(X, Y, sig=[-1,-1]):
 #        Y contains dy columns, m rows. Each row is an i.i.d sample
 #        sig[0] is kernel size for x (set to median distance if -1)
 #        sig[1] is kernel size for y (set to median distance if -1)
+#        maxpnt is the number of points used, evenly spaced over the sample
+#        approx is None for exact kernels, 'rff' (random Fourier features) or
+#            'nystroem', both with n_components features, so maxpnt can be
+#            raised to thousands of points (the statistic grows with the number
+#            of points, so models trained on one maxpnt need features with the same)
 #Outputs:
 #        testStat: test statistic
 #
 #Use at most 200 points to save time.
-    maxpnt = 200
-
     m = X.shape[0]
     if m>maxpnt:
         indx = np.floor(np.r_[0:m:float(m-1)/(maxpnt-1)]).astype(int)
@@ -485,30 +1074,34 @@ def FastHsicTestGamma(X, Y, sig=[-1,-1]):
         Xm = X.astype(float)
         Ym = Y.astype(float)
 
-    H = np.eye(m) - 1.0/m*np.ones((m,m))
-
-    K = rbf_dot(Xm,sig[0])
-    L = rbf_dot(Ym,sig[1])
-
-    Kc = np.dot(H, np.dot(K, H))
-    Lc = np.dot(H, np.dot(L, H))
-
-    testStat = (1.0/m)*(Kc.T*Lc).sum()
+    if approx is None:
+        K = rbf_dot(Xm,sig[0])
+        L = rbf_dot(Ym,sig[1])
+        # trace(HKHHLH) = sum((HKH)*L) with H = I - 1/m, and HKH only needs the means of K
+        Km = K.mean(axis=0)
+        Kc = K - Km[:, np.newaxis] - Km[np.newaxis, :] + Km.mean()
+        testStat = (1.0/m)*(Kc*L).sum()
+    else:
+        rng = np.random.RandomState(random_state)
+        Zx = rbf_features(Xm, sig[0], n_components, approx, rng)
+        Zy = rbf_features(Ym, sig[1], n_components, approx, rng)
+        C = np.dot((Zx - Zx.mean(axis=0)).T, Zy - Zy.mean(axis=0))
+        testStat = (1.0/m)*(C*C).sum()
     if ~np.isfinite(testStat):
         testStat = 0
 
     return testStat
 
-def normalized_hsic(x, tx, y, ty, h=None):
+def normalized_hsic(x, tx, y, ty, h=None, sx=None, sy=None, maxpnt=200, approx=None, n_components=100, random_state=0):
     if categorical(tx) and categorical(ty):
         if h is None:
             h = correlation(x, tx, y, ty)
     else:
         if categorical(tx) and numerical(ty):
-            x = to_numerical(x, y)
+            x = to_numerical(x, y, sx)
         elif numerical(tx) and categorical(ty):
-            y = to_numerical(y, x)
+            y = to_numerical(y, x, sy)
         x = (x-np.mean(x))/np.std(x)
         y = (y-np.mean(y))/np.std(y)
-        h = FastHsicTestGamma(x, y)
+        h = FastHsicTestGamma(x, y, maxpnt=maxpnt, approx=approx, n_components=n_components, random_state=random_state)
     return h
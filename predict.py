@@ -3,26 +3,47 @@ import os
 import csv
 import cPickle as pickle
 import glob
+import argparse
+import json
+import BaseHTTPServer
+import threading
+import Queue
 
 import numpy as np
 import pandas as pd
 
-from features import extract_features, extract_features2, get_all_features
+from features import extract_features, extract_features2, extract_features_symmetric, get_all_features, feature_matrix, PlanProfile, FeaturePlan, HSIC_OPTIONS
+from data_io import read_pairs, iter_pairs, load_pair_store, object_array, TYPE_NAMES
+from feature_cache import FeatureCache
+from estimator import consumed_features
+
+DEFAULT_PORT = 8765
+
+# models scoring the rows of a pair, by whether A and B are numerical, besides the
+# amodel and mymodel that score every row; the swapped row of a cn pair is an nc
+# row, which takes the negated cn prediction
+GLOBAL_MODELS = ['amodel', 'mymodel']
+PAIR_MODELS = {(False, False): ['ccmodel'], (False, True): ['cnmodel'], (True, False): ['cnmodel'], (True, True): ['nnmodel']}
+
+# stream mode: bytes held per sample value while a batch is extracted, and
+# batches alive at once (one per stage and one per queue between stages)
+BYTES_PER_VALUE = 8 * 16
+BATCHES_IN_FLIGHT = 6
+# seconds a blocked stage waits before checking whether the stream was stopped
+STAGE_POLL = 0.1
 
 def load_model(model_dir, verbose=True):
     with open(model_dir, 'rb') as fi:
         m = pickle.load(fi)
     return m
 
-def parse_dataframe(df):
-    parse_cell = lambda cell: np.fromstring(cell, dtype=np.float, sep=" ")
-    df = df.applymap(parse_cell)
-    return df
-
-def read_data(filename_pairs, filename_info, symmetrize=True):
-    df_pairs = parse_dataframe(pd.read_csv(filename_pairs, index_col="SampleID"))
-    df_info = pd.read_csv(filename_info, index_col="SampleID")
-    features = pd.concat([df_pairs, df_info], axis=1)
+def read_data(filename_pairs, filename_info, symmetrize=True, n_jobs=1, store_dir=None):
+    if store_dir is not None:
+        features = load_pair_store(filename_pairs, filename_info, store_dir, n_jobs).to_frame()
+    else:
+        df_pairs = read_pairs(filename_pairs, n_jobs)
+        df_info = pd.read_csv(filename_info, index_col="SampleID")
+        features = pd.concat([df_pairs, df_info], axis=1)
     if symmetrize:
         features_inverse = features.copy()
         features_inverse['A'] = features['B']
@@ -60,98 +81,400 @@ def write_predictions(pred_dir, test, predictions):
     writer.writerow(("SampleID", "Target"))
     writer.writerows(rows)
 
-def main():
-    if len(sys.argv) < 3:
-        print "USAGE: python predict.py input_dir output_dir"
-        return -1
-
-    input_dir = sys.argv[1]
-    output_dir = sys.argv[2]
-    symmetrize = True
-
+def find_input_files(input_dir):
     # Get the file names
     filename_pairs = glob.glob(os.path.join(input_dir, '*_pairs.csv'))
     if len(filename_pairs)!=1:
-        print('No or multiple pairs.csv files')
-        exit(1)
+        raise ValueError('No or multiple pairs.csv files')
     filename_pairs = filename_pairs[0]
     filename_info = glob.glob(os.path.join(input_dir, '*_publicinfo.csv'))
     if len(filename_info)!=1:
-        print('No or multiple publicinfo.scv files')
-        exit(1)
+        raise ValueError('No or multiple publicinfo.scv files')
     filename_info = filename_info[0]
     basename = filename_pairs[:-filename_pairs[::-1].index('_')-1]
     if  filename_info[:-filename_info[::-1].index('_')-1] != basename:
-        print('Different basenames in publicinfo.csv and pairs.csv files')
-        exit(1)
+        raise ValueError('Different basenames in publicinfo.csv and pairs.csv files')
 
     # Remove the path name
     try:
         dataset = basename[-basename[::-1].index(os.sep):]
     except:
         dataset = basename
+    return filename_pairs, filename_info, dataset
 
-    test_ori = read_data(filename_pairs, filename_info, False)
-
-    print "Loading the classifier"
-    prog_dir = os.path.dirname(os.path.abspath(__file__))
-    amodel  = load_model(os.path.join(prog_dir, 'models', "model2.pkl"))
+def load_models(symmetrize=True, model_dir=None, n_jobs=1):
+    if model_dir is None:
+        model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+    models = {}
+    models['amodel'] = load_model(os.path.join(model_dir, "model2.pkl"))
     if symmetrize:
-        ccmodel = load_model(os.path.join(prog_dir, 'models', "ccmodel.pkl"))
-        cnmodel = load_model(os.path.join(prog_dir, 'models', "cnmodel.pkl"))
-        nnmodel = load_model(os.path.join(prog_dir, 'models', "nnmodel.pkl"))
+        models['ccmodel'] = load_model(os.path.join(model_dir, "ccmodel.pkl"))
+        models['cnmodel'] = load_model(os.path.join(model_dir, "cnmodel.pkl"))
+        models['nnmodel'] = load_model(os.path.join(model_dir, "nnmodel.pkl"))
     else:
-        for m in amodel.systems:
+        for m in models['amodel'].systems:
             m.symmetrize = symmetrize
 
-    mymodel  = load_model(os.path.join(prog_dir, 'models', "model_t.pkl"))
+    mymodel  = load_model(os.path.join(model_dir, "model_t.pkl"))
     mymodel.weights = [0.17275686, 0.1424602, 0.14824986, 0.45374324, 0.08278984]
     mymodel.weights = np.array(mymodel.weights) / sum(mymodel.weights)
+    models['mymodel'] = mymodel
+    for m in models.values():
+        m.n_jobs = n_jobs
+    return models
 
+def predict_pairs(models, test_ori, symmetrize=True, n_jobs=1, cache=None, profile=None):
+    """Score the pairs of test_ori (as returned by read_data with symmetrize=False).
+
+    Returns the rows the predictions belong to and the predictions themselves,
+    one per pair in the order of test_ori.
+    """
+    test = extract_test(test_ori, symmetrize, n_jobs, cache, profile, models)
+    return score_test(models, test, symmetrize)
+
+def pair_outputs(models, symmetrize=True):
+    """Features read by the models scoring a pair, by whether A and B are numerical."""
+    common = set().union(*[consumed_features(models[m]) for m in GLOBAL_MODELS])
+    outputs = {}
+    for key, names in PAIR_MODELS.items():
+        features = set(common)
+        if symmetrize:
+            for m in names:
+                features |= consumed_features(models[m])
+        outputs[key] = sorted(features - set(['A type', 'B type']))
+    return outputs
+
+def extract_test(test_ori, symmetrize=True, n_jobs=1, cache=None, profile=None, models=None):
+    """Feature matrix of test_ori, rows interleaved with the swapped pairs if symmetrize.
+
+    With models, every type combination only computes the features its models read.
+    """
     print "Extracting features"
     all_features_clean, used_feature_names = get_all_features()
-    test = extract_features(test_ori, all_features_clean)
-    test = symmetrize_features(test_ori, test, all_features_clean)
-    test = test[['A type', 'B type'] + list(used_feature_names)]
+    if models is None:
+        groups = [(sorted(used_feature_names), np.arange(len(test_ori)))]
+    else:
+        outputs = pair_outputs(models, symmetrize)
+        numerical = np.array([[t == "Numerical" for t in test_ori[c]] for c in ('A type', 'B type')], dtype=bool).T
+        keys = [tuple(k) for k in numerical]
+        groups = [(outputs[key], np.array([i for i, k in enumerate(keys) if k == key])) for key in sorted(set(keys))]
+
+    parts, positions = [], []
+    for names, rows in groups:
+        if symmetrize:
+            part = extract_features_symmetric(test_ori.iloc[rows], all_features_clean, names, n_jobs=n_jobs, cache=cache, profile=profile)
+        else:
+            part = extract_features(test_ori.iloc[rows], all_features_clean, n_jobs=n_jobs, outputs=names, cache=cache, profile=profile)
+        parts.append(part)
+        positions.extend(rows)
+    k = 2 if symmetrize else 1
+    order = np.argsort(positions, kind='mergesort')
+    test = pd.concat(parts).iloc[(k * order[:, np.newaxis] + np.arange(k)).ravel()]
+    columns = sorted(set().union(*[names for names, rows in groups]))
+    # one float64 matrix shared by every model; the per-type subsets only select rows,
+    # and a column absent from a group is never read by the models of its rows
+    return feature_matrix(test, ['A type', 'B type'] + columns)
+
+def predict_subset(model, test, rows):
+    # a stream batch may hold no pair of some type combination
+    if len(rows) == 0:
+        return np.zeros(0)
+    return model.predict(test.take(rows))
+
+def mirrored_rows(first, second):
+    # rows of the pair models: every row followed by the row of its swapped pair, as the
+    # symmetrized models expect them
+    return np.c_[first, second].ravel()
 
+def score_test(models, test, symmetrize=True):
     print "Making predictions"
 
-    aptest  =  amodel.predict(test)
-    myptest  =  mymodel.predict(test)
+    aptest  =  models['amodel'].predict(test)
+    myptest  =  models['mymodel'].predict(test)
     if symmetrize:
-        BINARY      = 0 #"Binary"
-        CATEGORICAL = 1 #"Categorical"
         NUMERICAL   = 2 #"Numerical"
-        ccfilter = ((test['A type'] != NUMERICAL) & (test['B type'] != NUMERICAL))
-        cnfilter = ((test['A type'] != NUMERICAL) & (test['B type'] == NUMERICAL))
-        ncfilter = ((test['A type'] == NUMERICAL) & (test['B type'] != NUMERICAL))
-        nnfilter = ((test['A type'] == NUMERICAL) & (test['B type'] == NUMERICAL))
+        # test holds every pair followed by its swapped pair
+        anum = test['A type'][0::2] == NUMERICAL
+        bnum = test['B type'][0::2] == NUMERICAL
+        rows = 2 * np.arange(len(anum))
+        ccrows = mirrored_rows(rows[~anum & ~bnum], rows[~anum & ~bnum] + 1)
+        nnrows = mirrored_rows(rows[anum & bnum], rows[anum & bnum] + 1)
+        # the cn row of a mixed pair is its original row if A is categorical, else the swapped
+        # one; the cn model scores it against its own mirror, the nc row
+        mixed = anum != bnum
+        cnrows = mirrored_rows(rows[mixed] + anum[mixed], rows[mixed] + 1 - anum[mixed])
 
         ptest = np.zeros((4,test.shape[0]))
-        ccptest = ccmodel.predict(test[ccfilter])
-        cnptest = cnmodel.predict(test[cnfilter])
-        nnptest = nnmodel.predict(test[nnfilter])
-
-        ptest[0, ccfilter] = ccptest
-        ptest[0, cnfilter] = cnptest
-        ptest[0, ncfilter] = -cnptest
-        ptest[1, nnfilter] = nnptest
+        ptest[0, ccrows] = predict_subset(models['ccmodel'], test, ccrows)
+        ptest[0, cnrows] = predict_subset(models['cnmodel'], test, cnrows)
+        ptest[1, nnrows] = predict_subset(models['nnmodel'], test, nnrows)
         ptest[2, :] = aptest
         ptest[3, :] = myptest
 
         wopt = [0.80, 1.00, 1.75, 1.75]
         print 'wopt = ', wopt
         predictions = np.dot(wopt, ptest)
+        return test.take(slice(0, None, 2)), predictions[0::2]
     else:
         predictions = aptest
+        return test, predictions
+
+def predict_dir(models, input_dir, output_dir, symmetrize=True, n_jobs=1, store_dir=None, cache=None, profile=None):
+    filename_pairs, filename_info, dataset = find_input_files(input_dir)
+    test_ori = read_data(filename_pairs, filename_info, False, n_jobs, store_dir)
+    test, predictions = predict_pairs(models, test_ori, symmetrize, n_jobs, cache, profile)
 
     output_filename = dataset + "_predict.csv"
     print("Writing predictions to " + output_filename)
     submission_dir = os.path.join(output_dir, output_filename)
-    if symmetrize:
-        write_predictions(submission_dir, test[0::2], predictions[0::2])
+    write_predictions(submission_dir, test, predictions)
+    return submission_dir, test, predictions
+
+def iter_batches(filename_pairs, filename_info, batch_size, max_bytes, n_jobs=1, store_dir=None):
+    # a batch closes at batch_size pairs or when its samples reach max_bytes, whichever comes first
+    info = pd.read_csv(filename_info, index_col="SampleID")
+    if store_dir is not None:
+        pairs = iter(load_pair_store(filename_pairs, filename_info, store_dir, n_jobs))
     else:
-        write_predictions(submission_dir, test, predictions)
+        pairs = iter_pairs(filename_pairs, n_jobs)
+    ids, A, B, size = [], [], [], 0
+    for sid, a, b in pairs:
+        ids.append(sid)
+        A.append(a)
+        B.append(b)
+        size += (len(a) + len(b)) * BYTES_PER_VALUE
+        if len(ids) >= batch_size or size >= max_bytes:
+            yield batch_frame(ids, A, B, info)
+            ids, A, B, size = [], [], [], 0
+    if ids:
+        yield batch_frame(ids, A, B, info)
+
+def batch_frame(ids, A, B, info):
+    df = pd.DataFrame({'A': object_array(A), 'B': object_array(B)}, index=ids, columns=['A', 'B'])
+    df = pd.concat([df, info.reindex(ids)], axis=1)
+    df.index.name = "SampleID"
+    return df
+
+class StageFailure(object):
+    def __init__(self):
+        self.exc_info = sys.exc_info()
+
+    def reraise(self):
+        raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+
+def queue_items(queue, stop):
+    # the stage feeding queue returns without an end marker once stop is set
+    while True:
+        try:
+            item = queue.get(timeout=STAGE_POLL)
+        except Queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if item is None:
+            return
+        if isinstance(item, StageFailure):
+            item.reraise()
+        yield item
+
+def start_stage(func, items, stop, threads):
+    # func runs on its own thread over items; its results wait in a queue of one,
+    # so a fast stage blocks instead of piling batches up in memory
+    results = Queue.Queue(1)
+    def put(item):
+        # a stage blocked on a full queue gives up its item once stop is set
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=STAGE_POLL)
+                return True
+            except Queue.Full:
+                pass
+        return False
+    def work():
+        try:
+            for item in items:
+                if stop.is_set() or not put(func(item)):
+                    return
+        except Exception:
+            put(StageFailure())
+            return
+        put(None)
+    thread = threading.Thread(target=work)
+    thread.daemon = True
+    thread.start()
+    threads.append(thread)
+    return results
+
+def predict_stream(models, filename_pairs, filename_info, output_path, symmetrize=True, n_jobs=1,
+                   batch_size=1000, max_memory=1 << 30, store_dir=None, cache=None, profile=None):
+    """predict_dir in batches: parsing, extraction, scoring and writing overlap.
+
+    Each batch is appended to output_path and flushed before the next one is
+    written, so a crash loses at most the batches still in flight.
+    """
+    batches = iter_batches(filename_pairs, filename_info, batch_size, max_memory // BATCHES_IN_FLIGHT, n_jobs, store_dir)
+    stop = threading.Event()
+    threads = []
+    parsed = start_stage(lambda batch: batch, batches, stop, threads)
+    extracted = start_stage(lambda batch: extract_test(batch, symmetrize, n_jobs, cache, profile, models), queue_items(parsed, stop), stop, threads)
+    scored = start_stage(lambda test: score_test(models, test, symmetrize), queue_items(extracted, stop), stop, threads)
+    n = 0
+    try:
+        with open(output_path, "w") as fo:
+            writer = csv.writer(fo, lineterminator="\n")
+            writer.writerow(("SampleID", "Target"))
+            for test, predictions in queue_items(scored, stop):
+                writer.writerows(zip(test.index, predictions))
+                fo.flush()
+                os.fsync(fo.fileno())
+                n += len(predictions)
+                print "%d pairs written" % n
+    finally:
+        # the stages still running finish their batch and exit, none outlives the call
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return n
+
+def pairs_frame(pairs):
+    # inline pairs of a daemon job: dicts with SampleID, A, B, A type and B type
+    if not isinstance(pairs, list) or len(pairs) == 0:
+        raise ValueError("pairs must be a non-empty list")
+    for p in pairs:
+        for c in ('A type', 'B type'):
+            if p[c] not in TYPE_NAMES:
+                raise ValueError("%s of pair %s must be one of %s" % (c, p['SampleID'], ', '.join(TYPE_NAMES)))
+    df = pd.DataFrame({'A': object_array([np.asarray(p['A'], dtype=float) for p in pairs]),
+                       'B': object_array([np.asarray(p['B'], dtype=float) for p in pairs]),
+                       'A type': [p['A type'] for p in pairs],
+                       'B type': [p['B type'] for p in pairs]},
+                      index=[str(p['SampleID']) for p in pairs], columns=['A', 'B', 'A type', 'B type'])
+    df.index.name = "SampleID"
+    return df
+
+class PredictionHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Jobs are JSON objects POSTed to /predict, one of
+
+        {"input_dir": ..., "output_dir": ...}   same as a predict.py run
+        {"pairs_file": ..., "info_file": ...}  scores of the pairs in the two CSV files
+        {"pairs": [{"SampleID": ..., "A": [...], "B": [...], "A type": ..., "B type": ...}]}
+
+    and are answered with {"SampleID": [...], "Target": [...]} (plus "output" for the
+    first form) or with {"error": ...}.
+    """
+    def do_GET(self):
+        if self.path != '/status':
+            return self.reply(404, {'error': 'unknown path %s' % self.path})
+        self.reply(200, {'status': 'ready', 'jobs': self.server.jobs})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            return self.reply(404, {'error': 'unknown path %s' % self.path})
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.getheader('content-length', 0))))
+            result = self.server.run(job)
+        except (ValueError, KeyError, IOError, OSError), e:
+            return self.reply(400, {'error': '%s: %s' % (type(e).__name__, e)})
+        except Exception, e:
+            return self.reply(500, {'error': '%s: %s' % (type(e).__name__, e)})
+        self.reply(200, result)
+
+    def reply(self, code, body):
+        body = json.dumps(body)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class PredictionServer(BaseHTTPServer.HTTPServer):
+    # jobs are served one at a time with the models loaded once
+    def __init__(self, address, models, symmetrize=True, n_jobs=1, store_dir=None, cache=None):
+        BaseHTTPServer.HTTPServer.__init__(self, address, PredictionHandler)
+        self.models, self.symmetrize, self.n_jobs, self.store_dir = models, symmetrize, n_jobs, store_dir
+        self.cache = cache
+        self.jobs = 0
+
+    def run(self, job):
+        result = {}
+        if 'input_dir' in job:
+            result['output'], test, predictions = predict_dir(self.models, job['input_dir'], job['output_dir'],
+                                                              self.symmetrize, self.n_jobs, self.store_dir, self.cache)
+        else:
+            if 'pairs' in job:
+                test_ori = pairs_frame(job['pairs'])
+            else:
+                test_ori = read_data(job['pairs_file'], job['info_file'], False, self.n_jobs, self.store_dir)
+            test, predictions = predict_pairs(self.models, test_ori, self.symmetrize, self.n_jobs, self.cache)
+        self.jobs += 1
+        result['SampleID'] = list(test.index)
+        result['Target'] = [float(p) for p in predictions]
+        return result
+
+def serve(port=DEFAULT_PORT, symmetrize=True, n_jobs=1, store_dir=None, cache=None):
+    print "Loading the classifier"
+    models = load_models(symmetrize, n_jobs=n_jobs)
+    server = PredictionServer(('127.0.0.1', port), models, symmetrize, n_jobs, store_dir, cache)
+    print "Serving predictions on http://127.0.0.1:%d/predict" % port
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(usage="python predict.py input_dir output_dir\n       python predict.py --serve [--port PORT]")
+    parser.add_argument('input_dir', nargs='?')
+    parser.add_argument('output_dir', nargs='?')
+    parser.add_argument('--n-jobs', type=int, default=1, help="workers used to parse the pairs file, extract features and score the model pipelines")
+    parser.add_argument('--threads', type=int, default=1, help="threads running the independent feature steps of one large pair")
+    parser.add_argument('--hsic-approx', choices=['rff', 'nystroem'], default=None, help="approximate the HSIC kernels, so --hsic-points can be raised")
+    parser.add_argument('--hsic-points', type=int, default=HSIC_OPTIONS['maxpnt'], help="points of a pair HSIC is computed on (the models were trained on 200)")
+    parser.add_argument('--hsic-components', type=int, default=HSIC_OPTIONS['n_components'], help="features of the HSIC kernel approximation")
+    parser.add_argument('--store', default=None, help="binary pair store directory, built from the CSV files when missing or stale")
+    parser.add_argument('--cache', default=None, help="feature cache directory; features of pairs seen before are reused")
+    parser.add_argument('--cache-size', type=int, default=1024, help="size cap of the feature cache in MB")
+    parser.add_argument('--batch-size', type=int, default=None, help="stream the pairs in batches of at most this many, writing each batch as it is scored")
+    parser.add_argument('--max-memory', type=int, default=1024, help="memory ceiling in MB the stream batches are sized to")
+    parser.add_argument('--profile', default=None, help="time every feature step and write the JSON profile to this file")
+    parser.add_argument('--serve', action='store_true', help="keep the models loaded and answer jobs over localhost HTTP")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port of the --serve daemon")
+    args = parser.parse_args()
+    symmetrize = True
+    FeaturePlan.threads = args.threads
+    HSIC_OPTIONS.update(maxpnt=args.hsic_points, approx=args.hsic_approx, n_components=args.hsic_components)
+    cache = None
+    if args.cache is not None:
+        cache = FeatureCache(args.cache, args.cache_size << 20)
+
+    if args.serve:
+        serve(args.port, symmetrize, args.n_jobs, args.store, cache)
+        return
+    if args.output_dir is None:
+        parser.error("input_dir and output_dir are required")
+
+    try:
+        find_input_files(args.input_dir)
+    except ValueError, e:
+        print(e)
+        exit(1)
+
+    profile = None
+    if args.profile is not None:
+        profile = PlanProfile()
+
+    print "Loading the classifier"
+    models = load_models(symmetrize, n_jobs=args.n_jobs)
+    if args.batch_size is not None:
+        filename_pairs, filename_info, dataset = find_input_files(args.input_dir)
+        predict_stream(models, filename_pairs, filename_info, os.path.join(args.output_dir, dataset + "_predict.csv"),
+                       symmetrize, args.n_jobs, args.batch_size, args.max_memory << 20, args.store, cache, profile)
+    else:
+        predict_dir(models, args.input_dir, args.output_dir, symmetrize, args.n_jobs, args.store, cache, profile)
+
+    if profile is not None:
+        print profile.report()
+        profile.dump(args.profile)
 
 
 
@@ -0,0 +1,33 @@
+import os
+import sys
+import json
+import urllib2
+import argparse
+
+DEFAULT_PORT = 8765
+
+def post(url, job):
+    request = urllib2.Request(url, json.dumps(job), {'Content-Type': 'application/json'})
+    try:
+        return json.loads(urllib2.urlopen(request).read())
+    except urllib2.HTTPError, e:
+        return json.loads(e.read())
+
+def main():
+    parser = argparse.ArgumentParser(usage="python predict_client.py input_dir output_dir [--port PORT]")
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port of the predict.py --serve daemon")
+    args = parser.parse_args()
+
+    result = post('http://127.0.0.1:%d/predict' % args.port,
+                  {'input_dir': os.path.abspath(args.input_dir), 'output_dir': os.path.abspath(args.output_dir)})
+    if 'error' in result:
+        print(result['error'])
+        exit(1)
+    print("Predictions written to " + result['output'])
+
+
+
+if __name__=="__main__":
+    main()
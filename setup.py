@@ -1,13 +1,14 @@
-
 from distutils.core import setup
 from distutils.extension import Extension
-from Cython.Distutils import build_ext
+from Cython.Build import cythonize
 import numpy as np
 
-ext_modules=[Extension('features_base',['features_base.pyx'], include_dirs=[np.get_include()])]
+# the C sources are generated from the .pyx files and not kept in the tree, so a build
+# never compiles C that is older than its .pyx
+ext_modules=[Extension('features_base',['features_base.pyx'], include_dirs=[np.get_include()]),
+             Extension('tree_base',['tree_base.pyx'])]
 
 setup(
     name='features_base',
-    cmdclass={'build_ext':build_ext},
-    ext_modules=ext_modules
+    ext_modules=cythonize(ext_modules)
 )
@@ -0,0 +1,78 @@
+"""Small synthetic cause-effect pairs for the tests."""
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_io import object_array
+from features import RAW_COLUMNS
+
+TYPE_NAMES = ["Binary", "Categorical", "Numerical"]
+TYPE_CODES = {"Binary": 0, "Categorical": 1, "Numerical": 2}
+
+def tied_labels(rng, n, levels):
+    # labels whose counts are all equal, in shuffled order
+    return rng.permutation(np.arange(n) % levels).astype(float)
+
+def variable(rng, v, tp, levels):
+    if tp == "Binary":
+        return (v > np.median(v)).astype(float)
+    if tp == "Categorical":
+        ranks = np.argsort(np.argsort(v, kind='mergesort'), kind='mergesort')
+        return np.floor(ranks * levels / float(len(v)))
+    return np.round(v, 2)
+
+def typed_pair(rng, n, a_type, b_type, levels=5):
+    a = variable(rng, rng.standard_normal(n), a_type, levels)
+    b = variable(rng, np.tanh(a - a.mean()) + 0.5 * rng.standard_normal(n), b_type, levels)
+    return a, b
+
+def edge_pairs(rng, n):
+    # categorical labels with tied counts, negative labels, non-integer labels and many labels
+    yield 'tied_cat', tied_labels(rng, n, 6), "Categorical", np.round(rng.standard_normal(n), 2), "Numerical"
+    yield 'tied_cat_cat', tied_labels(rng, n, 4), "Categorical", tied_labels(rng, n, 3), "Categorical"
+    yield 'negative_cat', tied_labels(rng, n, 5) - 7, "Categorical", tied_labels(rng, n, 2), "Binary"
+    yield 'noninteger_cat', tied_labels(rng, n, 7) * 0.37 + 0.1, "Categorical", np.round(rng.standard_normal(n), 2), "Numerical"
+    # joint tables large enough to be kept sparse, with a few frequent labels among many rare ones
+    a = np.where(rng.uniform(size=n) < 0.5, rng.randint(0, 4, n), rng.randint(4, n // 2, n)).astype(float)
+    b = np.where(rng.uniform(size=n) < 0.5, a % 3, rng.randint(3, n // 3, n)).astype(float)
+    yield 'many_levels', a, "Categorical", b, "Categorical"
+
+def pairs_frame(pairs):
+    # pairs: (id, a, a type, b, b type)
+    ids, a, at, b, bt = zip(*pairs)
+    X = pd.DataFrame({'A': object_array(list(a)), 'B': object_array(list(b)),
+                      'A type': list(at), 'B type': list(bt)}, index=list(ids), columns=RAW_COLUMNS)
+    X.index.name = "SampleID"
+    return X
+
+def sample_pairs(n=300, seed=0):
+    """One pair of every type combination, followed by the edge cases."""
+    rng = np.random.RandomState(seed)
+    pairs = []
+    for a_type in TYPE_NAMES:
+        for b_type in TYPE_NAMES:
+            a, b = typed_pair(rng, n, a_type, b_type)
+            pairs.append(('%s-%s' % (a_type, b_type), a, a_type, b, b_type))
+    pairs.extend(edge_pairs(rng, n))
+    return pairs_frame(pairs)
+
+def coded_pairs(n=300, seed=0):
+    """The sample pairs in both orientations as (id, a, a type code, b, b type code), for the kernels."""
+    pairs = []
+    for pair_id, row in sample_pairs(n, seed).iterrows():
+        a, ta, b, tb = row['A'], TYPE_CODES[row['A type']], row['B'], TYPE_CODES[row['B type']]
+        pairs.append((pair_id, a, ta, b, tb))
+        pairs.append((pair_id + ' swapped', b, tb, a, ta))
+    return pairs
+
+def write_pairs_csv(X, dirname, basename='test'):
+    """X as the pairs and public info CSV files of a dataset, returns their names."""
+    filename_pairs = os.path.join(dirname, basename + '_pairs.csv')
+    filename_info = os.path.join(dirname, basename + '_publicinfo.csv')
+    with open(filename_pairs, 'w') as fo:
+        fo.write('SampleID,A,B\n')
+        for sid, a, b in zip(X.index, X['A'], X['B']):
+            fo.write('%s, %s, %s\n' % (sid, ' '.join(repr(v) for v in a), ' '.join(repr(v) for v in b)))
+    X[['A type', 'B type']].to_csv(filename_info)
+    return filename_pairs, filename_info
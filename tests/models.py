@@ -0,0 +1,64 @@
+"""Small models with the layout of the trained ones, fitted on synthetic pairs."""
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestRegressor
+
+import estimator
+from estimator_base import *
+from features import extract_features_symmetric, feature_matrix, get_all_features
+from tests.data import sample_pairs, pairs_frame
+
+GBC_PARAMS = {'n_estimators': 5, 'max_depth': 3, 'random_state': 1}
+RFR_PARAMS = {'n_estimators': 5, 'min_samples_split': 8, 'random_state': 1}
+
+def combination(direction, independence, symmetric, onestep, weights=None):
+    m = estimator.CauseEffectSystemCombination()
+    m.extractor = None
+    m.systems = [
+        estimator.CauseEffectEstimatorID(features_direction=direction, features_independence=independence,
+                                         regressor=GradientBoostingClassifier, params=GBC_PARAMS),
+        estimator.CauseEffectEstimatorSymmetric(features=symmetric, regressor=GradientBoostingClassifier, params=GBC_PARAMS),
+        estimator.CauseEffectEstimatorOneStep(features=onestep, regressor=RandomForestRegressor, params=RFR_PARAMS),
+        estimator.CauseEffectEstimatorSymmetric(features=symmetric, regressor=RandomForestRegressor, params=RFR_PARAMS),
+    ]
+    m.weights = np.ones(len(m.systems)) / len(m.systems) if weights is None else weights
+    return m
+
+def untrained_models():
+    """The models of predict.load_models; the pair models read the features of their trained counterparts."""
+    return {
+        'ccmodel': combination(selected_direction_categorical_features, selected_independence_categorical_features,
+                               selected_symmetric_categorical_features, selected_onestep_categorical_features),
+        'cnmodel': combination(selected_direction_cn_features, selected_independence_cn_features,
+                               selected_symmetric_cn_features, selected_onestep_cn_features),
+        'nnmodel': combination(selected_direction_numerical_features, selected_independence_numerical_features,
+                               selected_symmetric_numerical_features, selected_onestep_numerical_features),
+        # narrower than the trained global model, so that every type combination
+        # extracts a different set of features
+        'amodel': combination(selected_direction_categorical_features, selected_independence_cn_features,
+                              selected_symmetric_categorical_features, selected_onestep_cn_features),
+        'mymodel': combination(
+            ['A type', 'B type'] + selected_direction_numerical_features, ['A type', 'B type'] + selected_independence_numerical_features,
+            ['A type', 'B type'] + selected_symmetric_cn_features, ['A type', 'B type'] + selected_onestep_categorical_features,
+            np.array([0.4, 0.3, 0.2, 0.1])),
+    }
+
+def training_set(seeds=(10, 11, 12), n=100):
+    """Features of synthetic pairs and their swapped pairs, with targets that flip with the swap."""
+    X = pairs_frame([(pair_id + '-%d' % seed, row['A'], row['A type'], row['B'], row['B type'])
+                     for seed in seeds for pair_id, row in sample_pairs(n, seed).iterrows()])
+    features, used = get_all_features()
+    train = extract_features_symmetric(X, features, sorted(used))
+    y = np.random.RandomState(0).randint(-1, 2, len(X))
+    return feature_matrix(train, ['A type', 'B type'] + sorted(used)), np.c_[y, -y].ravel()
+
+MODELS = None
+
+def small_models():
+    # fitted once and shared by the tests, which only read them
+    global MODELS
+    if MODELS is None:
+        X, y = training_set()
+        MODELS = untrained_models()
+        for m in MODELS.values():
+            m.fit(X, y)
+    return MODELS
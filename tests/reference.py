@@ -0,0 +1,578 @@
+"""The feature extractors of the original release, in plain Python.
+
+Every fast path of features_base is checked against these. They are kept as
+they were (Counter tie order, float32 scale factors) since the trained models
+saw their values.
+"""
+import itertools
+import operator
+from collections import Counter, defaultdict
+
+import numpy as np
+from scipy.special import psi
+from scipy.stats.stats import pearsonr
+from scipy.stats import skew, kurtosis
+from sklearn.metrics import adjusted_mutual_info_score
+
+BINARY, CATEGORICAL, NUMERICAL = 0, 1, 2
+
+def float32(v):
+    # the original stored these factors in a cdef float
+    return float(np.float32(v))
+
+def count_unique(x):
+    return len(set(x))
+
+def count_unique_ratio(x):
+    return len(set(x))/float(len(x))
+
+def numerical(tp):
+    return tp == NUMERICAL
+
+def categorical(tp):
+    return tp == CATEGORICAL
+
+def standardize(x):
+    factor = float32(np.std(x))
+    if factor > 0:
+        x = (x - np.mean(x)) * (1.0 / factor)
+    else:
+        x = (x - np.mean(x))
+    return x
+
+def discrete_seq(x, tx, ffactor=3, maxdev=3):
+    maxthr = ffactor * maxdev
+    if numerical(tx) and (len(set(x)) > 2 * (maxthr + 1)):
+        x = standardize(x)
+        xf = x[np.abs(x) < maxdev]
+        x = (x - np.mean(xf)) * (ffactor / np.std(xf))
+        x = np.floor(x)
+        x[x > maxthr] = maxthr
+        x[x < - (maxthr + 1)] = - (maxthr + 1)
+    return x
+
+def discrete_seq2(x, tx):
+    return discrete_seq(x, tx, 2, 3)
+
+def discrete_probability(x, tx, xd=None, ffactor=3, maxdev=3):
+    if xd is None:
+        xd = discrete_seq(x, tx, ffactor, maxdev)
+    return Counter(xd)
+
+discrete_probability2 = discrete_probability
+
+def normalized_error_probability(x, tx, y, ty, xd=None, yd=None, cx=None, cy=None, ffactor=3, maxdev=3):
+    x = discrete_seq(x, tx, ffactor, maxdev) if xd is None else xd
+    y = discrete_seq(y, ty, ffactor, maxdev) if yd is None else yd
+    if cx is None:
+        cx = Counter(x)
+    if cy is None:
+        cy = Counter(y)
+    pxy = defaultdict(lambda: 0)
+    for p in itertools.izip(x, y):
+        pxy[p] += 1
+    pxy = np.array([[pxy[(a,b)] for b in cy] for a in cx], dtype=float)
+    pxy = pxy/min(len(x), len(y))
+    perr = 1 - np.sum(pxy.max(axis=1))
+    max_perr = 1 - np.max(pxy.sum(axis=0))
+    return perr/max_perr
+
+def discrete_entropy(x, tx, c=None, ffactor=3, maxdev=3, bias_factor=0.7):
+    if c is None:
+        c = discrete_probability(x, tx, None, ffactor, maxdev)
+    pk = np.array(c.values(), dtype=float)
+    pk = pk/pk.sum()
+    vec = pk*np.log(pk)
+    S = -np.sum(vec, axis=0)
+    return S + bias_factor*(len(pk) - 1)/float(2*len(x))
+
+def discrete_joint_entropy(x, tx, y, ty, xd=None, yd=None, ffactor=3, maxdev=3):
+    x = discrete_seq(x, tx, ffactor, maxdev) if xd is None else xd
+    y = discrete_seq(y, ty, ffactor, maxdev) if yd is None else yd
+    return discrete_entropy(zip(x,y), CATEGORICAL)
+
+def normalized_discrete_joint_entropy(x, tx, y, ty, e=None, ffactor=3, maxdev=3):
+    x, y = discrete_seq(x, tx, ffactor, maxdev), discrete_seq(y, ty, ffactor, maxdev)
+    if e is None:
+        e = discrete_entropy(zip(x,y), CATEGORICAL)
+    nx = 2*(ffactor*maxdev+1) if numerical(tx) else count_unique(x)
+    ny = 2*(ffactor*maxdev+1) if numerical(ty) else count_unique(y)
+    if nx*ny>0: e = e/np.log(nx*ny)
+    return e
+
+def discrete_conditional_entropy(x, tx, y, ty, exy, ey):
+    return exy - ey
+
+def adjusted_mutual_information(x, tx, y, ty, xd, yd):
+    return adjusted_mutual_info_score(xd, yd)
+
+def discrete_mutual_information(x, tx, y, ty, exy, ex, ey):
+    return max((ex + ey) - exy, 0)
+
+def normalized_discrete_entropy(x, tx, e, uni, ffactor=3, maxdev=3):
+    n = 2*(ffactor*maxdev+1) if numerical(tx) else uni
+    if n>0:
+        e = e*(1.0/np.log(n))
+    return e
+
+def to_numerical(x, y):
+    dx = defaultdict(lambda: np.zeros(2))
+    for i, a in enumerate(x):
+        dx[a][0] += y[i]
+        dx[a][1] += 1
+    for a in dx.keys():
+        dx[a][0] /= dx[a][1]
+    return np.array([dx[a][0] for a in x], dtype=float)
+
+def normalize(x, tx):
+    if not numerical(tx): # reassign labels according to its frequency
+        cx = Counter(x)
+        xmap = dict()
+        for i, k in enumerate(cx.most_common()):
+            xmap[k[0]] = i
+        y = np.array([xmap[a] for a in x], dtype = float)
+    else:
+        y = x
+    y = (y - np.mean(y))
+    factor = float32(np.std(y))
+    if factor > 0:
+        y = y * (1.0 / factor)
+    return y
+
+def normalized_entropy_baseline(x, tx, xd):
+    if len(set(x)) < 2:
+        return 0
+    xs = np.sort(xd)
+    delta = xs[1:] - xs[:-1]
+    delta = delta[delta != 0]
+    hx = np.mean(np.log(delta))
+    hx += psi(len(delta))
+    hx -= psi(1)
+    return hx
+
+def count_value(x, tx, xd):
+    return Counter(xd)
+
+def normalized_entropy(x, tx, cx, m=2):
+    if len(cx) < 2:
+        return 0
+    xk = np.array(cx.keys(), dtype=float)
+    xk.sort()
+    delta = (xk[1:] - xk[:-1])/m
+    counter = np.array([cx[i] for i in xk], dtype=float)
+    hx = np.sum(counter[1:]*np.log(delta/counter[1:]))/len(x)
+    hx += (psi(len(delta)) - np.log(len(delta)))
+    hx += np.log(len(x))
+    hx -= (psi(m) - np.log(m))
+    return hx
+
+def igci(x, tx, y, ty, xd, yd):
+    if len(set(x)) < 2:
+        return 0
+    x, y = xd, yd
+    len_x = len(x)
+    if len_x != len(set(x)):
+        dx = defaultdict(lambda: np.zeros(2))
+        for a, b in itertools.izip(x, y):
+            dx[a][0] += b
+            dx[a][1] += 1
+        xy = np.array([[a, dx[a][0]] for a in sorted(dx.keys())], dtype=float)
+        counter = np.array([dx[a][1] for a in xy[:,0]], dtype=int)
+        xy[:, 1] /= counter
+    else:
+        # the values of x are distinct, so any sort gives the frame sort of the original
+        order = np.argsort(x)
+        xy = np.c_[x[order], y[order]]
+        counter = np.ones(len_x)
+    delta = np.diff(xy, axis=0)
+    selec = delta[:,1] != 0
+    delta = delta[selec]
+    counter = np.min([counter[1:], counter[:-1]], axis=0)
+    counter = counter[selec]
+    return np.sum(counter*np.log(delta[:,0]/np.abs(delta[:,1])))/ len_x
+
+def spacings(cx, m):
+    xk = np.array(cx.keys(), dtype=float)
+    xk.sort()
+    delta = np.zeros(len(xk))
+    if len(xk) > 1:
+        delta[0] = xk[1] - xk[0]
+        delta[1:-1] = (xk[m:] - xk[:-m])/m
+        delta[-1] = xk[-1] - xk[-2]
+    else:
+        delta = np.array(np.sqrt(12))
+    return xk, delta, np.array([cx[i] for i in xk], dtype=float)
+
+def gaussian_divergence(x, tx, cx, m=2):
+    xk, delta, counter = spacings(cx, m)
+    boundaries = np.zeros(len(xk) + 1)
+    boundaries[0] = xk[0] - delta[0]*0.5
+    boundaries[1:-1] = (xk[:-1] + xk[1:])*0.5
+    boundaries[-1] = xk[-1] + delta[-1]*0.5
+    refvalues = np.diff(boundaries**3) * (1.0/(6.0*delta))
+    hx = np.sum(counter*(refvalues - np.log(delta/counter)))/len(x) + np.log(np.sqrt(2*np.pi))
+    hx -= np.log(len(x))
+    hx += (psi(m) - np.log(m))
+    return hx
+
+def uniform_divergence(x, tx, cx, m=2):
+    xk, delta, counter = spacings(cx, m)
+    delta = delta/np.sum(delta)
+    hx = np.sum(counter*np.log(counter/delta))/len(x)
+    hx -= np.log(len(x))
+    hx += (psi(m) - np.log(m))
+    return hx
+
+def normalized_skewness(x, tx, xd=None):
+    return skew(normalize(x, tx) if xd is None else xd)
+
+def normalized_kurtosis(x, tx, xd=None):
+    return kurtosis(normalize(x, tx) if xd is None else xd)
+
+def moment21(x, tx, y, ty, xd, yd):
+    return np.mean((xd**2)*yd)
+
+def moment31(x, tx, y, ty, xd, yd):
+    return np.mean((xd**3)*yd)
+
+def fit(x, tx, y, ty):
+    if (not numerical(tx)) or (not numerical(ty)):
+        return 0
+    if (len(set(x)) <= 2) or (len(set(y)) <= 2):
+        return 0
+    x = (x - np.mean(x))/np.std(x)
+    y = (y - np.mean(y))/np.std(y)
+    xy1 = np.polyfit(x, y, 1)
+    xy2 = np.polyfit(x, y, 2)
+    return abs(2*xy2[0]) + abs(xy2[1]-xy1[0])
+
+def fit_error(x, tx, y, ty, m=2):
+    if categorical(tx) and categorical(ty):
+        x = normalize(x, tx)
+        y = normalize(y, ty)
+    elif categorical(tx) and numerical(ty):
+        x = to_numerical(x, y)
+    elif numerical(tx) and categorical(ty):
+        y = to_numerical(y, x)
+    x = (x - np.mean(x))/np.std(x)
+    y = (y - np.mean(y))/np.std(y)
+    if (count_unique(x) <= m) or (count_unique(y) <= m):
+        xy = np.polyfit(x, y, min(count_unique(x), count_unique(y))-1)
+    else:
+        xy = np.polyfit(x, y, m)
+    return np.std(y - np.polyval(xy, x))
+
+def fit_noise_entropy(x, tx, y, ty, xd, yd, cx, ffactor=3, maxdev=3, minc=10):
+    x, y = xd, yd
+    entyx = []
+    for a in cx.iterkeys():
+        if cx[a] > minc:
+            entyx.append(discrete_entropy(y[x==a], CATEGORICAL))
+    if len(entyx) == 0: return 0
+    n = 2*(ffactor*maxdev+1) if numerical(ty) else len(set(y))
+    return np.std(entyx)/np.log(n)
+
+def fit_noise_moment(moment, x, tx, y, ty, xd, cx, minc=8):
+    values = []
+    for a in cx.iterkeys():
+        if cx[a] >= minc:
+            values.append(moment(y[xd==a], ty))
+    return np.std(values) if len(values) > 0 else 0
+
+def fit_noise_skewness(x, tx, y, ty, xd, cx):
+    return fit_noise_moment(normalized_skewness, x, tx, y, ty, xd, cx)
+
+def fit_noise_kurtosis(x, tx, y, ty, xd, cx):
+    return fit_noise_moment(normalized_kurtosis, x, tx, y, ty, xd, cx)
+
+def conditional_distribution_similarity(x, tx, y, ty, xd, cx, cy, ffactor=2, maxdev=3, minc=12):
+    yrange = sorted(cy.keys())
+    ny = len(yrange)
+    py = np.array([cy[i] for i in yrange], dtype=float)
+    py = py/py.sum()
+    pyx = []
+    if not numerical(ty):
+        for a in cx.iterkeys():
+            if cx[a] > minc:
+                cyx = Counter(y[xd==a])
+                pyxa = np.array([cyx[i] for i in yrange], dtype=float)
+                pyxa.sort()
+                pyx.append(pyxa/cx[a])
+    elif len(set(y)) > 2*(ffactor*maxdev+1):
+        for a in cx.iterkeys():
+            if cx[a] > minc:
+                yx = y[xd==a]
+                yx = (yx - np.mean(yx))
+                yx = np.floor(yx*ffactor)
+                yx[yx > ffactor*maxdev] = ffactor*maxdev
+                yx[yx < -(ffactor*maxdev+1)] = -(ffactor*maxdev+1)
+                cyx = Counter(yx.astype(int))
+                pyxa = np.array([cyx[i] for i in xrange(-(ffactor*maxdev+1), (ffactor*maxdev+1))], dtype=float)
+                pyx.append(pyxa/cx[a])
+    else:
+        for a in cx.iterkeys():
+            if cx[a] > minc:
+                cyx = Counter(y[xd==a])
+                pyxa = [cyx[i] for i in yrange]
+                pyxax = np.array([0]*(ny-1) + pyxa + [0]*(ny-1), dtype=float)
+                xcorr = [sum(py*pyxax[i:i+ny]) for i in xrange(2*ny-1)]
+                imax = xcorr.index(max(xcorr))
+                pyxa = np.array([0]*(2*ny-2-imax) + pyxa + [0]*imax, dtype=float)
+                pyx.append(pyxa/cx[a])
+    if len(pyx)==0: return 0
+    pyx = np.array(pyx)
+    pyx = pyx - pyx.mean(axis=0)
+    return np.std(pyx)
+
+def correlation(x, tx, y, ty, nepxy=None, nepyx=None):
+    if categorical(tx) and categorical(ty):
+        if nepxy is None:
+            nepxy = normalized_error_probability(x, tx, y, ty)
+        if nepyx is None:
+            nepyx = normalized_error_probability(y, ty, x, tx)
+        return 1 - min(nepxy, nepyx)
+    if categorical(tx) and numerical(ty):
+        x = to_numerical(x, y)
+    elif numerical(tx) and categorical(ty):
+        y = to_numerical(y, x)
+    x = (x-np.mean(x))/np.std(x)
+    y = (y-np.mean(y))/np.std(y)
+    return pearsonr(x, y)[0]
+
+def rbf_dot(X, deg):
+    if X.ndim == 1:
+        X = X[:, np.newaxis]
+    G = np.sum(X*X, axis=1)[:, np.newaxis]
+    H = G + G.T - 2.0*np.dot(X, X.T)
+    if deg == -1:
+        dists = (H - np.tril(H)).flatten()
+        deg = np.sqrt(0.5*np.median(dists[dists>0]))
+    return np.exp(-H/(2.0*deg**2))
+
+def hsic(X, Y, maxpnt=200):
+    m = X.shape[0]
+    if m>maxpnt:
+        indx = np.floor(np.r_[0:m:float(m-1)/(maxpnt-1)]).astype(int)
+        Xm, Ym = X[indx].astype(float), Y[indx].astype(float)
+        m = Xm.shape[0]
+    else:
+        Xm, Ym = X.astype(float), Y.astype(float)
+    H = np.eye(m) - 1.0/m*np.ones((m,m))
+    Kc = np.dot(H, np.dot(rbf_dot(Xm, -1), H))
+    Lc = np.dot(H, np.dot(rbf_dot(Ym, -1), H))
+    testStat = (1.0/m)*(Kc.T*Lc).sum()
+    if ~np.isfinite(testStat):
+        testStat = 0
+    return testStat
+
+def normalized_hsic(x, tx, y, ty, h):
+    if categorical(tx) and categorical(ty):
+        return h
+    if categorical(tx) and numerical(ty):
+        x = to_numerical(x, y)
+    elif numerical(tx) and categorical(ty):
+        y = to_numerical(y, x)
+    x = (x-np.mean(x))/np.std(x)
+    y = (y-np.mean(y))/np.std(y)
+    return hsic(x, y)
+
+def numerical_type(tp):
+    return int(numerical(tp))
+
+# the feature table of the original release
+FEATURES = [
+    ('Max', 'A', max),
+    ('Max', 'B', max),
+    ('Min', 'A', min),
+    ('Min', 'B', min),
+    ('Numerical', 'A type', numerical_type),
+    ('Numerical', 'B type', numerical_type),
+    ('Sub', ['Numerical[A type]','Numerical[B type]'], operator.sub),
+    ('Abs', 'Sub[Numerical[A type],Numerical[B type]]', abs),
+
+    ('Number of Samples', 'A', len),
+    ('Log', 'Number of Samples[A]', np.log),
+
+    ('Number of Unique Samples', 'A', count_unique),
+    ('Number of Unique Samples', 'B', count_unique),
+    ('Max', ['Number of Unique Samples[A]','Number of Unique Samples[B]'], max),
+    ('Min', ['Number of Unique Samples[A]','Number of Unique Samples[B]'], min),
+    ('Sub', ['Number of Unique Samples[A]','Number of Unique Samples[B]'], operator.sub),
+    ('Abs', 'Sub[Number of Unique Samples[A],Number of Unique Samples[B]]', abs),
+
+    ('Log', 'Number of Unique Samples[A]', np.log),
+    ('Log', 'Number of Unique Samples[B]', np.log),
+    ('Max', ['Log[Number of Unique Samples[A]]','Log[Number of Unique Samples[B]]'], max),
+    ('Min', ['Log[Number of Unique Samples[A]]','Log[Number of Unique Samples[B]]'], min),
+    ('Sub', ['Log[Number of Unique Samples[A]]','Log[Number of Unique Samples[B]]'], operator.sub),
+    ('Abs', 'Sub[Log[Number of Unique Samples[A]],Log[Number of Unique Samples[B]]]', abs),
+
+    ('Ratio of Unique Samples', 'A', count_unique_ratio),
+    ('Ratio of Unique Samples', 'B', count_unique_ratio),
+    ('Max', ['Ratio of Unique Samples[A]','Ratio of Unique Samples[B]'], max),
+    ('Min', ['Ratio of Unique Samples[A]','Ratio of Unique Samples[B]'], min),
+    ('Sub', ['Ratio of Unique Samples[A]','Ratio of Unique Samples[B]'], operator.sub),
+    ('Abs', 'Sub[Ratio of Unique Samples[A],Ratio of Unique Samples[B]]', abs),
+
+    ('Normalized Value', ['A','A type'], normalize),
+    ('Normalized Value', ['B','B type'], normalize),
+    ('Count Value', ['A','A type'], count_value, ['Normalized Value[A,A type]']),
+    ('Count Value', ['B','B type'], count_value, ['Normalized Value[B,B type]']),
+    ('DisSeq', ['A','A type'], discrete_seq),
+    ('DisSeq', ['B','B type'], discrete_seq),
+    ('DisProb', ['A','A type'], discrete_probability, ['DisSeq[A,A type]']),
+    ('DisProb', ['B','B type'], discrete_probability, ['DisSeq[B,B type]']),
+
+    ('Normalized Entropy Baseline', ['A','A type'], normalized_entropy_baseline, ['Normalized Value[A,A type]']),
+    ('Normalized Entropy Baseline', ['B','B type'], normalized_entropy_baseline, ['Normalized Value[B,B type]']),
+    ('Max', ['Normalized Entropy Baseline[A,A type]','Normalized Entropy Baseline[B,B type]'], max),
+    ('Min', ['Normalized Entropy Baseline[A,A type]','Normalized Entropy Baseline[B,B type]'], min),
+    ('Sub', ['Normalized Entropy Baseline[A,A type]','Normalized Entropy Baseline[B,B type]'], operator.sub),
+    ('Abs', 'Sub[Normalized Entropy Baseline[A,A type],Normalized Entropy Baseline[B,B type]]', abs),
+
+    ('Normalized Entropy', ['A','A type'], normalized_entropy, ['Count Value[A,A type]']),
+    ('Normalized Entropy', ['B','B type'], normalized_entropy, ['Count Value[B,B type]']),
+    ('Max', ['Normalized Entropy[A,A type]','Normalized Entropy[B,B type]'], max),
+    ('Min', ['Normalized Entropy[A,A type]','Normalized Entropy[B,B type]'], min),
+    ('Sub', ['Normalized Entropy[A,A type]','Normalized Entropy[B,B type]'], operator.sub),
+    ('Abs', 'Sub[Normalized Entropy[A,A type],Normalized Entropy[B,B type]]', abs),
+
+    ('IGCI', ['A','A type','B','B type'], igci, ['Normalized Value[A,A type]', 'Normalized Value[B,B type]']),
+    ('IGCI', ['B','B type','A','A type'], igci, ['Normalized Value[B,B type]', 'Normalized Value[A,A type]']),
+    ('Sub', ['IGCI[A,A type,B,B type]','IGCI[B,B type,A,A type]'], operator.sub),
+    ('Abs', 'Sub[IGCI[A,A type,B,B type],IGCI[B,B type,A,A type]]', abs),
+
+    ('Gaussian Divergence', ['A','A type'], gaussian_divergence, ['Count Value[A,A type]']),
+    ('Gaussian Divergence', ['B','B type'], gaussian_divergence, ['Count Value[B,B type]']),
+    ('Max', ['Gaussian Divergence[A,A type]','Gaussian Divergence[B,B type]'], max),
+    ('Min', ['Gaussian Divergence[A,A type]','Gaussian Divergence[B,B type]'], min),
+    ('Sub', ['Gaussian Divergence[A,A type]','Gaussian Divergence[B,B type]'], operator.sub),
+    ('Abs', 'Sub[Gaussian Divergence[A,A type],Gaussian Divergence[B,B type]]', abs),
+
+    ('Uniform Divergence', ['A','A type'], uniform_divergence, ['Count Value[A,A type]']),
+    ('Uniform Divergence', ['B','B type'], uniform_divergence, ['Count Value[B,B type]']),
+    ('Max', ['Uniform Divergence[A,A type]','Uniform Divergence[B,B type]'], max),
+    ('Min', ['Uniform Divergence[A,A type]','Uniform Divergence[B,B type]'], min),
+    ('Sub', ['Uniform Divergence[A,A type]','Uniform Divergence[B,B type]'], operator.sub),
+    ('Abs', 'Sub[Uniform Divergence[A,A type],Uniform Divergence[B,B type]]', abs),
+
+    ('Discrete Entropy', ['A','A type'], discrete_entropy, ['DisProb[A,A type]']),
+    ('Discrete Entropy', ['B','B type'], discrete_entropy, ['DisProb[B,B type]']),
+    ('Max', ['Discrete Entropy[A,A type]','Discrete Entropy[B,B type]'], max),
+    ('Min', ['Discrete Entropy[A,A type]','Discrete Entropy[B,B type]'], min),
+    ('Sub', ['Discrete Entropy[A,A type]','Discrete Entropy[B,B type]'], operator.sub),
+    ('Abs', 'Sub[Discrete Entropy[A,A type],Discrete Entropy[B,B type]]', abs),
+
+    ('Normalized Discrete Entropy', ['A','A type'], normalized_discrete_entropy, ['Discrete Entropy[A,A type]', 'Number of Unique Samples[A]']),
+    ('Normalized Discrete Entropy', ['B','B type'], normalized_discrete_entropy, ['Discrete Entropy[B,B type]', 'Number of Unique Samples[B]']),
+    ('Max', ['Normalized Discrete Entropy[A,A type]','Normalized Discrete Entropy[B,B type]'], max),
+    ('Min', ['Normalized Discrete Entropy[A,A type]','Normalized Discrete Entropy[B,B type]'], min),
+    ('Sub', ['Normalized Discrete Entropy[A,A type]','Normalized Discrete Entropy[B,B type]'], operator.sub),
+    ('Abs', 'Sub[Normalized Discrete Entropy[A,A type],Normalized Discrete Entropy[B,B type]]', abs),
+
+    ('Discrete Joint Entropy', ['A','A type','B','B type'], discrete_joint_entropy, ['DisSeq[A,A type]', 'DisSeq[B,B type]']),
+    ('Normalized Discrete Joint Entropy', ['A','A type','B','B type'], normalized_discrete_joint_entropy, ['Discrete Joint Entropy[A,A type,B,B type]']),
+    ('Discrete Conditional Entropy', ['A','A type','B','B type'], discrete_conditional_entropy, ['Discrete Joint Entropy[A,A type,B,B type]', 'Discrete Entropy[B,B type]']),
+    ('Discrete Conditional Entropy', ['B','B type','A','A type'], discrete_conditional_entropy, ['Discrete Joint Entropy[A,A type,B,B type]', 'Discrete Entropy[A,A type]']),
+    ('Discrete Mutual Information', ['A','A type','B','B type'], discrete_mutual_information, ['Discrete Joint Entropy[A,A type,B,B type]', 'Discrete Entropy[A,A type]', 'Discrete Entropy[B,B type]']),
+    ('Normalized Discrete Mutual Information', ['Discrete Mutual Information[A,A type,B,B type]','Min[Discrete Entropy[A,A type],Discrete Entropy[B,B type]]'], operator.div),
+    ('Normalized Discrete Mutual Information', ['Discrete Mutual Information[A,A type,B,B type]','Discrete Joint Entropy[A,A type,B,B type]'], operator.div),
+    ('Adjusted Mutual Information', ['A','A type','B','B type'], adjusted_mutual_information, ['DisSeq[A,A type]', 'DisSeq[B,B type]']),
+
+    ('Polyfit', ['A','A type','B','B type'], fit),
+    ('Polyfit', ['B','B type','A','A type'], fit),
+    ('Sub', ['Polyfit[A,A type,B,B type]','Polyfit[B,B type,A,A type]'], operator.sub),
+    ('Abs', 'Sub[Polyfit[A,A type,B,B type],Polyfit[B,B type,A,A type]]', abs),
+
+    ('Polyfit Error', ['A','A type','B','B type'], fit_error),
+    ('Polyfit Error', ['B','B type','A','A type'], fit_error),
+    ('Sub', ['Polyfit Error[A,A type,B,B type]','Polyfit Error[B,B type,A,A type]'], operator.sub),
+    ('Abs', 'Sub[Polyfit Error[A,A type,B,B type],Polyfit Error[B,B type,A,A type]]', abs),
+
+    ('Normalized Error Probability', ['A','A type','B','B type'], normalized_error_probability, ['DisSeq[A,A type]', 'DisSeq[B,B type]', 'DisProb[A,A type]', 'DisProb[B,B type]']),
+    ('Normalized Error Probability', ['B','B type','A','A type'], normalized_error_probability, ['DisSeq[B,B type]', 'DisSeq[A,A type]', 'DisProb[B,B type]', 'DisProb[A,A type]']),
+    ('Sub', ['Normalized Error Probability[A,A type,B,B type]','Normalized Error Probability[B,B type,A,A type]'], operator.sub),
+    ('Abs', 'Sub[Normalized Error Probability[A,A type,B,B type],Normalized Error Probability[B,B type,A,A type]]', abs),
+
+    ('Conditional Distribution Entropy Variance', ['A','A type','B','B type'], fit_noise_entropy, ['DisSeq[A,A type]', 'DisSeq[B,B type]', 'DisProb[A,A type]']),
+    ('Conditional Distribution Entropy Variance', ['B','B type','A','A type'], fit_noise_entropy, ['DisSeq[B,B type]', 'DisSeq[A,A type]', 'DisProb[B,B type]']),
+    ('Sub', ['Conditional Distribution Entropy Variance[A,A type,B,B type]','Conditional Distribution Entropy Variance[B,B type,A,A type]'], operator.sub),
+    ('Abs', 'Sub[Conditional Distribution Entropy Variance[A,A type,B,B type],Conditional Distribution Entropy Variance[B,B type,A,A type]]', abs),
+
+    ('Conditional Distribution Skewness Variance', ['A','A type','B','B type'], fit_noise_skewness, ['DisSeq[A,A type]', 'DisProb[A,A type]']),
+    ('Conditional Distribution Skewness Variance', ['B','B type','A','A type'], fit_noise_skewness, ['DisSeq[B,B type]', 'DisProb[B,B type]']),
+    ('Sub', ['Conditional Distribution Skewness Variance[A,A type,B,B type]','Conditional Distribution Skewness Variance[B,B type,A,A type]'], operator.sub),
+    ('Abs', 'Sub[Conditional Distribution Skewness Variance[A,A type,B,B type],Conditional Distribution Skewness Variance[B,B type,A,A type]]', abs),
+
+    ('Conditional Distribution Kurtosis Variance', ['A','A type','B','B type'], fit_noise_kurtosis, ['DisSeq[A,A type]', 'DisProb[A,A type]']),
+    ('Conditional Distribution Kurtosis Variance', ['B','B type','A','A type'], fit_noise_kurtosis, ['DisSeq[B,B type]', 'DisProb[B,B type]']),
+    ('Sub', ['Conditional Distribution Kurtosis Variance[A,A type,B,B type]','Conditional Distribution Kurtosis Variance[B,B type,A,A type]'], operator.sub),
+    ('Abs', 'Sub[Conditional Distribution Kurtosis Variance[A,A type,B,B type],Conditional Distribution Kurtosis Variance[B,B type,A,A type]]', abs),
+
+    ('DisSeq2', ['A','A type'], discrete_seq2),
+    ('DisSeq2', ['B','B type'], discrete_seq2),
+    ('DisProb2', ['A','A type'], discrete_probability2, ['DisSeq2[A,A type]']),
+    ('DisProb2', ['B','B type'], discrete_probability2, ['DisSeq2[B,B type]']),
+    ('Conditional Distribution Similarity', ['A','A type','B','B type'], conditional_distribution_similarity, ['DisSeq2[A,A type]','DisProb2[A,A type]','DisProb2[B,B type]']),
+    ('Conditional Distribution Similarity', ['B','B type','A','A type'], conditional_distribution_similarity, ['DisSeq2[B,B type]','DisProb2[B,B type]','DisProb2[A,A type]']),
+    ('Sub', ['Conditional Distribution Similarity[A,A type,B,B type]','Conditional Distribution Similarity[B,B type,A,A type]'], operator.sub),
+    ('Abs', 'Sub[Conditional Distribution Similarity[A,A type,B,B type],Conditional Distribution Similarity[B,B type,A,A type]]', abs),
+
+    ('Moment21', ['A','A type','B','B type'], moment21, ['Normalized Value[A,A type]', 'Normalized Value[B,B type]']),
+    ('Moment21', ['B','B type','A','A type'], moment21, ['Normalized Value[B,B type]', 'Normalized Value[A,A type]']),
+    ('Sub', ['Moment21[A,A type,B,B type]','Moment21[B,B type,A,A type]'], operator.sub),
+    ('Abs', 'Sub[Moment21[A,A type,B,B type],Moment21[B,B type,A,A type]]', abs),
+
+    ('Abs', 'Moment21[A,A type,B,B type]', abs),
+    ('Abs', 'Moment21[B,B type,A,A type]', abs),
+    ('Sub', ['Abs[Moment21[A,A type,B,B type]]','Abs[Moment21[B,B type,A,A type]]'], operator.sub),
+    ('Abs', 'Sub[Abs[Moment21[A,A type,B,B type]],Abs[Moment21[B,B type,A,A type]]]', abs),
+
+    ('Moment31', ['A','A type','B','B type'], moment31, ['Normalized Value[A,A type]', 'Normalized Value[B,B type]']),
+    ('Moment31', ['B','B type','A','A type'], moment31, ['Normalized Value[B,B type]', 'Normalized Value[A,A type]']),
+    ('Sub', ['Moment31[A,A type,B,B type]','Moment31[B,B type,A,A type]'], operator.sub),
+    ('Abs','Sub[Moment31[A,A type,B,B type],Moment31[B,B type,A,A type]]', abs),
+
+    ('Abs','Moment31[A,A type,B,B type]', abs),
+    ('Abs','Moment31[B,B type,A,A type]', abs),
+    ('Sub', ['Abs[Moment31[A,A type,B,B type]]','Abs[Moment31[B,B type,A,A type]]'], operator.sub),
+    ('Abs','Sub[Abs[Moment31[A,A type,B,B type]],Abs[Moment31[B,B type,A,A type]]]', abs),
+
+    ('Skewness', ['A','A type'], normalized_skewness, ['Normalized Value[A,A type]']),
+    ('Skewness', ['B','B type'], normalized_skewness, ['Normalized Value[B,B type]']),
+    ('Sub', ['Skewness[A,A type]','Skewness[B,B type]'], operator.sub),
+    ('Abs', 'Sub[Skewness[A,A type],Skewness[B,B type]]', abs),
+
+    ('Abs', 'Skewness[A,A type]', abs),
+    ('Abs', 'Skewness[B,B type]', abs),
+    ('Max', ['Abs[Skewness[A,A type]]','Abs[Skewness[B,B type]]'], max),
+    ('Min', ['Abs[Skewness[A,A type]]','Abs[Skewness[B,B type]]'], min),
+    ('Sub', ['Abs[Skewness[A,A type]]','Abs[Skewness[B,B type]]'], operator.sub),
+    ('Abs', 'Sub[Abs[Skewness[A,A type]],Abs[Skewness[B,B type]]]', abs),
+
+    ('Kurtosis', ['A','A type'], normalized_kurtosis, ['Normalized Value[A,A type]']),
+    ('Kurtosis', ['B','B type'], normalized_kurtosis, ['Normalized Value[B,B type]']),
+    ('Max', ['Kurtosis[A,A type]','Kurtosis[B,B type]'], max),
+    ('Min', ['Kurtosis[A,A type]','Kurtosis[B,B type]'], min),
+    ('Sub', ['Kurtosis[A,A type]','Kurtosis[B,B type]'], operator.sub),
+    ('Abs', 'Sub[Kurtosis[A,A type],Kurtosis[B,B type]]', abs),
+
+    ('Pearson R', ['A','A type','B','B type'], correlation, ['Normalized Error Probability[A,A type,B,B type]','Normalized Error Probability[B,B type,A,A type]']),
+    ('HSIC', ['A','A type','B','B type'], normalized_hsic, ['Pearson R[A,A type,B,B type]']),
+    ('Abs', 'Pearson R[A,A type,B,B type]', abs)
+    ]
+
+def feature_name(prefix, columns):
+    if not isinstance(columns, list):
+        columns = [columns]
+    return prefix + '[' + ','.join(columns) + ']'
+
+def reference_features(a, ta, b, tb):
+    """Every feature of the original table for one pair, by name."""
+    values = {'A': a, 'A type': ta, 'B': b, 'B type': tb}
+    for fea in FEATURES:
+        prefix, columns, f = fea[:3]
+        aux = fea[3] if len(fea) > 3 else []
+        columns = columns if isinstance(columns, list) else [columns]
+        values[feature_name(prefix, columns)] = f(*[values[c] for c in columns + aux])
+    return values
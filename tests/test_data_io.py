@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from data_io import split_ranges, iter_pairs, read_pairs, load_pair_store, store_is_current
+from tests.data import sample_pairs, write_pairs_csv
+
+class PairsReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.X = sample_pairs(n=50)
+        self.filename = write_pairs_csv(self.X, self.tmp)[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def assertPairs(self, rows, X):
+        self.assertEqual([sid for sid, a, b in rows], list(X.index))
+        for (sid, a, b), (_, row) in zip(rows, X.iterrows()):
+            np.testing.assert_array_equal(a, row['A'])
+            np.testing.assert_array_equal(b, row['B'])
+
+    def test_split_ranges(self):
+        # ranges cover the rows after the header without gaps, each ending after a newline
+        size = os.path.getsize(self.filename)
+        with open(self.filename, 'rb') as fi:
+            header = len(fi.readline())
+            content = fi.read()
+        for chunk_bytes in (1, 7, 100, 1000, size):
+            columns, ranges = split_ranges(self.filename, chunk_bytes)
+            self.assertEqual(columns, ['SampleID', 'A', 'B'])
+            self.assertEqual(ranges[0][0], header)
+            self.assertEqual(ranges[-1][1], size)
+            for (s, e), (s2, e2) in zip(ranges, ranges[1:]):
+                self.assertEqual(e, s2)
+            for s, e in ranges:
+                self.assertEqual(content[e - header - 1], '\n')
+
+    def test_boundaries_inside_rows(self):
+        # chunk sizes that end most chunks in the middle of a row
+        for chunk_bytes in (1, 7, 100, 1000):
+            self.assertPairs(list(iter_pairs(self.filename, 1, chunk_bytes)), self.X)
+        self.assertPairs(list(iter_pairs(self.filename, 2, 100)), self.X)
+
+    def test_read_pairs(self):
+        df = read_pairs(self.filename, 2, 100)
+        self.assertEqual(df.index.name, 'SampleID')
+        self.assertPairs(zip(df.index, df['A'], df['B']), self.X)
+
+    def test_no_final_newline(self):
+        with open(self.filename, 'rb') as fi:
+            content = fi.read()
+        with open(self.filename, 'wb') as fo:
+            fo.write(content.rstrip('\n').replace('\n', '\r\n'))
+        for chunk_bytes in (1, 100):
+            self.assertPairs(list(iter_pairs(self.filename, 1, chunk_bytes)), self.X)
+
+class PairStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = os.path.join(self.tmp, 'store')
+        self.X = sample_pairs(n=50)
+        self.files = write_pairs_csv(self.X, self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def assertFrame(self, df, X):
+        self.assertEqual(list(df.index), list(X.index))
+        self.assertEqual(list(df['A type']), list(X['A type']))
+        self.assertEqual(list(df['B type']), list(X['B type']))
+        for a, b in zip(df['A'], X['A']):
+            np.testing.assert_array_equal(a, b)
+        for a, b in zip(df['B'], X['B']):
+            np.testing.assert_array_equal(a, b)
+
+    def set_mtime(self, t):
+        for f in self.files:
+            os.utime(f, (t, t))
+
+    def test_round_trip(self):
+        store = load_pair_store(self.files[0], self.files[1], self.store)
+        self.assertFrame(store.to_frame(), self.X)
+        self.assertEqual(len(store), len(self.X))
+        np.testing.assert_array_equal(store[self.X.index[3]][1], self.X['B'].iloc[3])
+        self.assertTrue(store_is_current(self.store, *self.files))
+
+    def test_reused_after_csv_change(self):
+        self.set_mtime(1000000000.25)
+        self.assertFrame(load_pair_store(self.files[0], self.files[1], self.store).to_frame(), self.X)
+        # fewer pairs and a changed type
+        X = self.X.iloc[2:].copy()
+        X['B type'] = X['B type'].replace('Numerical', 'Categorical')
+        write_pairs_csv(X, self.tmp)
+        self.assertFalse(store_is_current(self.store, *self.files))
+        self.assertFrame(load_pair_store(self.files[0], self.files[1], self.store).to_frame(), X)
+        # an edit that keeps the size of the file, within the same second
+        self.set_mtime(1000000000.25)
+        load_pair_store(self.files[0], self.files[1], self.store)
+        a = X['B'].iloc[0]
+        self.assertFalse((a == a[::-1]).all())
+        X['B'].iloc[0] = a[::-1].copy()
+        size = os.path.getsize(self.files[0])
+        write_pairs_csv(X, self.tmp)
+        self.set_mtime(1000000000.75)
+        self.assertEqual(os.path.getsize(self.files[0]), size)
+        self.assertFrame(load_pair_store(self.files[0], self.files[1], self.store).to_frame(), X)
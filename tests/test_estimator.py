@@ -0,0 +1,57 @@
+import copy
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import estimator
+from tests.models import small_models, training_set, untrained_models
+
+class FitTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        cls.X, cls.y = training_set()
+
+    def test_default_is_serial(self):
+        self.assertEqual(estimator.CauseEffectSystemCombination.fit_jobs, 1)
+
+    def test_parallel_fit(self):
+        # leaf pipelines fitted on worker processes over the memory-mapped matrix predict
+        # like the ones fitted in this process
+        for name in ('cnmodel', 'mymodel'):
+            serial, parallel = untrained_models()[name], untrained_models()[name]
+            serial.fit(self.X, self.y)
+            parallel.fit_jobs = 2
+            parallel.fit(self.X, self.y)
+            np.testing.assert_array_equal(parallel.predict(self.X), serial.predict(self.X), err_msg=name)
+
+    def test_parallel_fit_frame(self):
+        # a frame is converted to the shared matrix first
+        serial, parallel = untrained_models()['ccmodel'], untrained_models()['ccmodel']
+        serial.fit(self.X, self.y)
+        parallel.fit_jobs = 2
+        parallel.fit(pd.DataFrame(self.X.values, columns=self.X.columns), self.y)
+        np.testing.assert_array_equal(parallel.predict(self.X), serial.predict(self.X))
+
+class PredictTest(unittest.TestCase):
+    """Leaf pipelines scored on a worker pool against the serial scores."""
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        cls.X, cls.y = training_set(seeds=(20,), n=60)
+
+    def test_predict_pipelines(self):
+        for executor in ('thread', 'process'):
+            for name in ('ccmodel', 'mymodel'):
+                serial = small_models()[name]
+                parallel = copy.deepcopy(serial)
+                parallel.n_jobs, parallel.executor = 2, executor
+                for X in (self.X, self.X.take(slice(1, None, 2))):
+                    expected = serial.predict_pipelines(X)
+                    result = parallel.predict_pipelines(X)
+                    self.assertEqual(len(result), len(expected))
+                    for a, b in zip(result, expected):
+                        np.testing.assert_array_equal(a, b, err_msg='%s %s' % (executor, name))
+                    np.testing.assert_array_equal(parallel.predict(X), serial.predict(X), err_msg='%s %s' % (executor, name))
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+
+from features import extract_features, extract_features_symmetric, get_all_features
+from feature_cache import FeatureCache
+from tests.data import sample_pairs
+
+def cache_files(cache_dir):
+    return sorted(os.path.join(d, n) for d, _, names in os.walk(cache_dir) for n in names)
+
+class FeatureCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        cls.features, used = get_all_features()
+        cls.used = sorted(used)
+        cls.X = sample_pairs(n=200)
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def assertFramesEqual(self, a, b, names):
+        self.assertEqual(list(a.index), list(b.index))
+        for name in names:
+            np.testing.assert_array_equal(a[name].values.astype(float), b[name].values.astype(float), name)
+
+    def test_cold_and_warm(self):
+        expected = extract_features(self.X, self.features, outputs=self.used)
+        cold = extract_features(self.X, self.features, outputs=self.used, cache=FeatureCache(self.cache_dir))
+        self.assertFramesEqual(cold, expected, self.used)
+        files = cache_files(self.cache_dir)
+        warm = extract_features(self.X, self.features, outputs=self.used, cache=FeatureCache(self.cache_dir))
+        self.assertFramesEqual(warm, expected, self.used)
+        self.assertEqual(cache_files(self.cache_dir), files)
+
+    def test_symmetric_cold_and_warm(self):
+        expected = extract_features_symmetric(self.X, self.features, self.used)
+        for run in xrange(2):
+            result = extract_features_symmetric(self.X, self.features, self.used, cache=FeatureCache(self.cache_dir))
+            self.assertFramesEqual(result, expected, self.used)
+
+    def test_writers_of_different_features(self):
+        # two processes adding different features to the same pairs both keep their values,
+        # even when the second read the pairs before the first stored them
+        first, second = self.used[:10], self.used[10:20]
+        extract_features(self.X, self.features, outputs=first, cache=FeatureCache(self.cache_dir))
+        cache = FeatureCache(self.cache_dir)
+        cache.load = lambda key, versions: {}
+        extract_features(self.X, self.features, outputs=second, cache=cache)
+        cache = FeatureCache(self.cache_dir)
+        cache.store = lambda key, entry: self.fail("recomputed %s" % sorted(entry))
+        result = extract_features(self.X, self.features, outputs=first + second, cache=cache)
+        self.assertFramesEqual(result, extract_features(self.X, self.features, outputs=first + second), first + second)
+
+    def test_store_replaces(self):
+        cache = FeatureCache(self.cache_dir)
+        versions = {'f': 'v1'}
+        cache.store('ab' * 20, {'f': ('v1', 1.0)})
+        cache.store('ab' * 20, {'f': ('v1', 2.0)})
+        self.assertEqual(cache.load('ab' * 20, versions), {'f': ('v1', 2.0)})
+        self.assertEqual(cache.load('ab' * 20, {'f': 'v2'}), {})
+
+    def test_update_nan(self):
+        # a NaN read back from the pair's file is not stored again, changed values are
+        cache = FeatureCache(self.cache_dir)
+        versions = {'f': 'v1', 'g': 'v1'}
+        cache.store('ab' * 20, {'f': ('v1', np.nan), 'g': ('v1', 1.0)})
+        entry = cache.load('ab' * 20, versions)
+        stored = []
+        cache.store = lambda key, new: stored.append(new)
+        cache.update('ab' * 20, entry, {'f': np.float64(np.nan), 'g': 1.0}, ['f', 'g'], versions)
+        self.assertEqual(stored, [])
+        cache.update('ab' * 20, entry, {'f': 2.0, 'g': 1.0}, ['f', 'g'], versions)
+        self.assertEqual(stored, [{'f': ('v1', 2.0)}])
+
+    def test_evict(self):
+        cache = FeatureCache(self.cache_dir, max_bytes=2000)
+        for i in xrange(40):
+            cache.store('%040x' % i, {'f': ('v1', float(i))})
+        cache.evict()
+        total = sum(os.path.getsize(p) for p in cache_files(self.cache_dir))
+        self.assertLessEqual(total, 2000)
+        self.assertEqual(cache.size, total)
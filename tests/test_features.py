@@ -0,0 +1,299 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+
+from features import (extract_features, extract_features_symmetric, get_all_features, schedule_pairs, compile_plan,
+                      convert_types, step_pool, feature_matrix, size_bucket, FeatureMapper, FeaturePlan, MultiColumnTransform,
+                      PlanProfile, EXACT_HSIC)
+from feature_cache import feature_versions
+from data_io import load_pair_store
+from predict import symmetrize_features, read_data
+from tests.data import sample_pairs, write_pairs_csv, TYPE_CODES
+from tests.reference import reference_features
+
+def assert_features_close(test, result, expected, names, rtol=1e-9, atol=1e-12):
+    for name in names:
+        a, b = float(result[name]), float(expected[name])
+        test.assertTrue(np.isclose(a, b, rtol=rtol, atol=atol, equal_nan=True), "%s: %r != %r" % (name, a, b))
+
+def assert_features_equal(test, result, expected, names):
+    test.assertEqual(list(result.index), list(expected.index))
+    for name in names:
+        np.testing.assert_array_equal(result[name].values.astype(float), expected[name].values.astype(float), err_msg=name)
+
+class ReferenceTest(unittest.TestCase):
+    """Every used feature against the extractors of the original release."""
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        cls.features, cls.used = get_all_features()
+        cls.X = sample_pairs()
+
+    def test_extract_features(self):
+        result = extract_features(self.X, self.features)
+        for i, (pair_id, row) in enumerate(self.X.iterrows()):
+            expected = reference_features(row['A'], TYPE_CODES[row['A type']], row['B'], TYPE_CODES[row['B type']])
+            assert_features_close(self, result.iloc[i], expected, sorted(self.used))
+
+class SymmetricTest(unittest.TestCase):
+    """Both orientations in one pass against extract_features followed by symmetrize_features."""
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        cls.features, cls.used = get_all_features()
+        cls.X = sample_pairs()
+
+    def test_extract_features_symmetric(self):
+        expected = symmetrize_features(self.X, extract_features(self.X, self.features), self.features)
+        result = extract_features_symmetric(self.X, self.features)
+        assert_features_equal(self, result, expected, sorted(self.used))
+        np.testing.assert_array_equal(result['A type'].values, expected['A type'].values)
+
+    def test_outputs(self):
+        outputs = sorted(self.used)[::5]
+        expected = extract_features_symmetric(self.X, self.features)
+        result = extract_features_symmetric(self.X, self.features, outputs=outputs)
+        assert_features_equal(self, result, expected, outputs)
+
+def failing_step(a, ta):
+    raise ArithmeticError("step failed")
+
+class ThreadedPlanTest(unittest.TestCase):
+    """The steps of every pair on threads against the serial plan."""
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        cls.features, cls.used = get_all_features()
+        cls.X = sample_pairs(n=200)
+
+    def setUp(self):
+        self.defaults = FeaturePlan.threads, FeaturePlan.parallel_size
+        FeaturePlan.threads, FeaturePlan.parallel_size = 3, 0
+
+    def tearDown(self):
+        FeaturePlan.threads, FeaturePlan.parallel_size = self.defaults
+
+    def serial(self, f, *args, **kwargs):
+        FeaturePlan.threads = 1
+        try:
+            return f(*args, **kwargs)
+        finally:
+            FeaturePlan.threads = 3
+
+    def test_extract_features(self):
+        expected = self.serial(extract_features, self.X, self.features)
+        assert_features_equal(self, extract_features(self.X, self.features), expected, sorted(self.used))
+
+    def test_extract_features_symmetric(self):
+        expected = self.serial(extract_features_symmetric, self.X, self.features)
+        assert_features_equal(self, extract_features_symmetric(self.X, self.features), expected, sorted(self.used))
+
+    def test_step_error(self):
+        # the error of a step is raised by run, and the shared pool keeps serving later pairs
+        X = convert_types(self.X)
+        features = self.features + [('Failing', ['A', 'A type'], MultiColumnTransform(failing_step))]
+        plan = compile_plan(features, ['Failing[A,A type]', 'Pearson R[A,A type,B,B type]'], available=X.columns)
+        self.assertRaises(ArithmeticError, plan.run, [X[c].values[0] for c in plan.sources])
+        plan = compile_plan(self.features, ['Pearson R[A,A type,B,B type]'], available=X.columns)
+        values = [X[c].values[0] for c in plan.sources]
+        self.assertEqual(plan.run(values)[-1], self.serial(plan.run, values)[-1])
+
+    def test_step_pool_replaced(self):
+        # a changed thread count stops the workers of the previous pool
+        old = step_pool(3)
+        self.assertIs(step_pool(3), old)
+        new = step_pool(2)
+        self.assertIsNot(new, old)
+        self.assertFalse(any(w.is_alive() for w in old._pool))
+        self.assertEqual(new.map(abs, [-1, -2]), [1, 2])
+
+class PairStoreTest(unittest.TestCase):
+    """Features of the read-only arrays mapped from a pair store."""
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        cls.features, cls.used = get_all_features()
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.files = write_pairs_csv(sample_pairs(n=200), self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_extract_features(self):
+        expected = extract_features(read_data(self.files[0], self.files[1], False), self.features)
+        X = load_pair_store(self.files[0], self.files[1], self.tmp + '/store').to_frame()
+        self.assertFalse(X['A'].values[0].flags.writeable)
+        assert_features_equal(self, extract_features(X, self.features), expected, sorted(self.used))
+        assert_features_equal(self, extract_features_symmetric(X, self.features),
+                              extract_features_symmetric(read_data(self.files[0], self.files[1], False), self.features),
+                              sorted(self.used))
+
+class HsicOptionsTest(unittest.TestCase):
+    def test_approximate_hsic(self):
+        warnings.simplefilter('ignore')
+        X = sample_pairs(n=1000)
+        options = dict(EXACT_HSIC, maxpnt=1000)
+        exact = extract_features(X, get_all_features(options)[0], outputs=['HSIC[A,A type,B,B type]'])
+        features = get_all_features(dict(options, approx='nystroem'))[0]
+        approx = extract_features(X, features, outputs=['HSIC[A,A type,B,B type]'])
+        np.testing.assert_allclose(approx['HSIC[A,A type,B,B type]'].values.astype(float),
+                                   exact['HSIC[A,A type,B,B type]'].values.astype(float), rtol=0.05)
+        # cached values of the exact statistic are not reused for the approximate one
+        self.assertNotEqual(feature_versions(features)['HSIC[A,A type,B,B type]'],
+                            feature_versions(get_all_features()[0])['HSIC[A,A type,B,B type]'])
+
+class ParallelTest(unittest.TestCase):
+    """Extraction on worker processes against the serial extraction."""
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        cls.features, cls.used = get_all_features()
+        cls.X = sample_pairs(n=200)
+
+    def test_schedule_pairs(self):
+        costs = np.random.RandomState(0).exponential(size=50)
+        chunks = schedule_pairs(costs, 3)
+        self.assertEqual(sorted(np.concatenate(chunks)), range(50))
+        self.assertEqual(costs[chunks[0][0]], costs.max())
+
+    def test_extract_features(self):
+        expected = extract_features(self.X, self.features)
+        result = extract_features(self.X, self.features, n_jobs=2)
+        assert_features_equal(self, result, expected, sorted(self.used))
+
+    def test_extract_features_symmetric(self):
+        expected = extract_features_symmetric(self.X, self.features)
+        result = extract_features_symmetric(self.X, self.features, n_jobs=2)
+        assert_features_equal(self, result, expected, sorted(self.used))
+
+class FeatureMatrixTest(unittest.TestCase):
+    """Row selections of the shared matrix against the same selections of the frame."""
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        features, used = get_all_features()
+        cls.names = ['A type', 'B type'] + sorted(used)
+        cls.frame = extract_features_symmetric(sample_pairs(n=20), features)[cls.names].astype(float)
+        cls.matrix = feature_matrix(cls.frame, cls.names)
+
+    def assert_same(self, matrix, frame):
+        self.assertEqual(list(matrix.index), list(frame.index))
+        self.assertEqual(matrix.shape, frame.shape)
+        np.testing.assert_array_equal(matrix.select(range(len(self.names))), frame.values)
+        for name in self.names[:5]:
+            np.testing.assert_array_equal(matrix[name], frame[name].values, err_msg=name)
+
+    def test_values(self):
+        self.assertEqual(self.matrix.values.dtype, np.float64)
+        self.assertTrue(self.matrix.values.flags['C_CONTIGUOUS'])
+        self.assert_same(self.matrix, self.frame)
+
+    def test_take(self):
+        mask = self.frame['A type'].values == TYPE_CODES['Numerical']
+        positions = np.array([7, 0, 3, 3, 12])
+        self.assert_same(self.matrix.take(mask), self.frame[mask])
+        self.assert_same(self.matrix.take(slice(1, None, 2)), self.frame.iloc[1::2])
+        self.assert_same(self.matrix.take(positions), self.frame.iloc[positions])
+        # positions of a nested take are relative to the outer selection
+        self.assert_same(self.matrix.take(slice(1, None, 2)).take(positions),
+                         self.frame.iloc[1::2].iloc[positions])
+        self.assert_same(self.matrix.take(mask).take(np.arange(mask.sum()) % 2 == 0),
+                         self.frame[mask].iloc[::2])
+        # selections share the array of the matrix
+        self.assertIs(self.matrix.take(mask).values, self.matrix.values)
+
+    def test_feature_mapper(self):
+        mapper = FeatureMapper(self.names[::-3])
+        rows = np.array([5, 2, 9])
+        np.testing.assert_array_equal(mapper.transform(self.matrix.take(rows)),
+                                      mapper.transform(self.frame.iloc[rows]))
+        # a matrix with another column order resolves the positions again
+        other = feature_matrix(self.frame, self.names[::-1])
+        np.testing.assert_array_equal(mapper.transform(other), mapper.transform(self.frame))
+        np.testing.assert_array_equal(mapper.transform(self.matrix), mapper.transform(self.frame))
+
+class ProfileTest(unittest.TestCase):
+    """Steps recorded by a profile, however the plan runs."""
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        cls.features, cls.used = get_all_features()
+        cls.X = sample_pairs(n=200)
+        cls.steps = [node.name for node, _ in compile_plan(cls.features, available=convert_types(cls.X).columns).steps]
+
+    def profile(self, f=extract_features, **kwargs):
+        profile = PlanProfile()
+        f(self.X, self.features, profile=profile, **kwargs)
+        return profile
+
+    def calls(self, profile):
+        # calls and bytes of every step and pair key, times vary from run to run
+        return dict((k, (calls, nbytes)) for k, (calls, seconds, nbytes) in profile.stats.items())
+
+    def test_extract_features(self):
+        profile = self.profile()
+        keys = {}
+        for pair_id, row in self.X.iterrows():
+            key = ('%s-%s' % (row['A type'], row['B type']), size_bucket(len(row['A'])))
+            keys[key] = keys.get(key, 0) + 1
+        self.assertEqual(sorted(profile.stats), sorted((name,) + key for name in self.steps for key in keys))
+        for (name, types, size), (calls, seconds, nbytes) in profile.stats.items():
+            self.assertEqual(calls, keys[types, size])
+            self.assertGreaterEqual(seconds, 0)
+        self.assertEqual(dict((name, calls) for name, (calls, seconds, nbytes) in profile.totals()),
+                         dict((name, len(self.X)) for name in self.steps))
+
+    def test_extract_features_symmetric(self):
+        # steps run once per pair, or twice when the swapped pair has no mirrored value
+        totals = dict(self.profile(extract_features_symmetric).totals())
+        self.assertEqual(set(calls for calls, seconds, nbytes in totals.values()), set([len(self.X), 2 * len(self.X)]))
+        self.assertEqual(totals['Pearson R[A,A type,B,B type]'][0], len(self.X))
+
+    def test_parallel(self):
+        # profiles of the worker processes are merged into the one passed in
+        self.assertEqual(self.calls(self.profile(n_jobs=2)), self.calls(self.profile()))
+
+    def test_threaded(self):
+        defaults = FeaturePlan.threads, FeaturePlan.parallel_size
+        FeaturePlan.threads, FeaturePlan.parallel_size = 3, 0
+        try:
+            threaded = self.profile()
+        finally:
+            FeaturePlan.threads, FeaturePlan.parallel_size = defaults
+        serial = self.profile()
+        self.assertEqual(dict((k, s[0]) for k, s in threaded.stats.items()), dict((k, s[0]) for k, s in serial.stats.items()))
+        self.assertEqual(sum(s[2] for s in threaded.stats.values()), sum(s[2] for s in serial.stats.values()))
+
+    def test_merge(self):
+        a, b = PlanProfile(), PlanProfile()
+        a.record('f', ('Numerical-Numerical', 100), 1., 10)
+        b.record('f', ('Numerical-Numerical', 100), 2., 20)
+        b.record('g', ('Binary-Numerical', 1000), .5, 5)
+        a.merge(b)
+        self.assertEqual(a.stats, {('f', 'Numerical-Numerical', 100): [2, 3., 30],
+                                   ('g', 'Binary-Numerical', 1000): [1, .5, 5]})
+        self.assertEqual(a.totals(), [('f', [2, 3., 30]), ('g', [1, .5, 5])])
+
+    def test_report_dump(self):
+        profile = self.profile()
+        report = profile.report(limit=5).split('\n')
+        # a header and five lines for the features, then for the type combinations
+        self.assertEqual(len(report), 13)
+        self.assertIn(profile.totals()[0][0][:70], report[1])
+        tmp = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp, 'profile.json')
+            profile.dump(filename)
+            with open(filename) as fi:
+                steps = json.load(fi)['steps']
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(len(steps), len(profile.stats))
+        self.assertEqual(steps, json.loads(json.dumps(profile.rows())))
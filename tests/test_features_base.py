@@ -0,0 +1,298 @@
+import unittest
+import warnings
+from collections import Counter
+
+import numpy as np
+from sklearn.metrics import adjusted_mutual_info_score
+
+import features_base as fb
+from tests import reference
+from tests.data import tied_labels, coded_pairs
+
+CATEGORICAL, NUMERICAL = reference.CATEGORICAL, reference.NUMERICAL
+
+def assert_kernel_close(test, result, expected, name, rtol=1e-9, atol=1e-12):
+    test.assertTrue(np.isclose(result, expected, rtol=rtol, atol=atol, equal_nan=True), "%s: %r != %r" % (name, result, expected))
+
+class UnivariateSummaryTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.labels = [tied_labels(rng, 300, 6), tied_labels(rng, 240, 4) - 7,
+                       tied_labels(rng, 350, 7) * 0.37 + 0.1, np.repeat([3., 1., 2.], 50),
+                       rng.randint(0, 40, 500).astype(float)]
+
+    def test_normalized_value_ties(self):
+        # equal counts keep the rank order of Counter.most_common
+        for x in self.labels:
+            expected = reference.normalize(x, CATEGORICAL)
+            np.testing.assert_array_equal(fb.normalize(x, CATEGORICAL, fb.univariate_summary(x, CATEGORICAL)), expected)
+            np.testing.assert_array_equal(fb.normalize(x, CATEGORICAL), expected)
+
+    def test_univariate_features(self):
+        # every feature of one variable from its summary against the original extractors
+        rng = np.random.RandomState(1)
+        x = rng.standard_normal(300)
+        variables = [(v, CATEGORICAL) for v in self.labels] + [
+            (x, NUMERICAL), (np.round(x, 1), NUMERICAL), ((x > 0).astype(float), reference.BINARY), (np.ones(50), NUMERICAL)]
+        for i, (x, tx) in enumerate(variables):
+            sx = fb.univariate_summary(x, tx)
+            nx = reference.normalize(x, tx)
+            cx = Counter(nx)
+            name = 'variable %d' % i
+            np.testing.assert_array_equal(fb.normalize(x, tx, sx), nx)
+            self.assertEqual(fb.count_value(x, tx, sx), cx)
+            assert_kernel_close(self, fb.normalized_entropy_baseline(x, tx, sx), reference.normalized_entropy_baseline(x, tx, nx), name)
+            assert_kernel_close(self, fb.normalized_entropy(x, tx, sx), reference.normalized_entropy(x, tx, cx), name)
+            if len(cx) < 2:
+                # the original fails on a constant variable as well
+                self.assertRaises(IndexError, reference.gaussian_divergence, x, tx, cx)
+                self.assertRaises(IndexError, fb.gaussian_divergence, x, tx, sx)
+                continue
+            assert_kernel_close(self, fb.gaussian_divergence(x, tx, sx), reference.gaussian_divergence(x, tx, cx), name)
+            assert_kernel_close(self, fb.uniform_divergence(x, tx, sx), reference.uniform_divergence(x, tx, cx), name)
+
+class CountPathTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(5)
+        x = rng.standard_normal(500)
+        self.values = [tied_labels(rng, 300, 6), tied_labels(rng, 240, 4) - 7, (x > 0).astype(float),
+                       rng.randint(-3, 40, 500), np.round(x, 1), np.floor(x * 3),
+                       # not counted: non-integer values and a range too wide
+                       x, np.r_[0., fb.COUNT_RANGE, 5.]]
+
+    def test_unique_levels(self):
+        for x in self.values:
+            levels, inverse, counts = fb.unique_levels(x)
+            expected = np.unique(x, return_inverse=True, return_counts=True)
+            np.testing.assert_array_equal(levels, expected[0])
+            self.assertEqual(levels.dtype, expected[0].dtype)
+            np.testing.assert_array_equal(inverse, expected[1])
+            np.testing.assert_array_equal(counts, expected[2])
+
+    def test_to_numerical(self):
+        rng = np.random.RandomState(0)
+        for x in self.values:
+            y = rng.standard_normal(len(x))
+            expected = reference.to_numerical(x, y)
+            np.testing.assert_allclose(fb.to_numerical(x, y), expected, rtol=1e-12)
+            np.testing.assert_allclose(fb.to_numerical(x, y, fb.univariate_summary(x, CATEGORICAL)), expected, rtol=1e-12)
+
+    def test_joint_histogram(self):
+        # the sparse table against the dense one, including the sorted rows
+        rng = np.random.RandomState(0)
+        for x in self.values[:6]:
+            y = self.values[3][rng.randint(0, 500, len(x))]
+            dense, sparse = fb.JointHistogram(x, y, sparse=False), fb.JointHistogram(x, y, sparse=True)
+            keep = rng.uniform(size=len(dense.xlevels)) < 0.7
+            keep[0] = True
+            np.testing.assert_array_equal(sparse.dense_rows(keep), dense.dense_rows(keep))
+            for cxy in (dense, sparse):
+                np.testing.assert_array_equal(cxy.sorted_rows(keep), np.sort(dense.dense_rows(keep), axis=1))
+                np.testing.assert_array_equal(cxy.row_max(), dense.dense.max(axis=1))
+                np.testing.assert_array_equal(cxy.col_max(), dense.dense.max(axis=0))
+            np.testing.assert_array_equal(sparse.transpose().dense_rows(np.ones(len(dense.ylevels), bool)), dense.dense.T)
+
+class ConditionalMomentsTest(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.pairs = coded_pairs()
+
+    def test_segment_moments(self):
+        rng = np.random.RandomState(0)
+        v = np.r_[rng.standard_normal(40), np.repeat(0.1, 7), rng.standard_normal(3)]
+        w = rng.randint(1, 5, len(v)).astype(float)
+        starts = np.array([0, 1, 13, 40, 47])
+        for weights in (None, w):
+            m2, m3, m4 = fb.segment_moments(v, starts, weights)
+            for k, (lo, hi) in enumerate(zip(starts, np.r_[starts[1:], len(v)])):
+                wk = np.ones(hi - lo) if weights is None else weights[lo:hi]
+                d = v[lo:hi] - np.average(v[lo:hi], weights=wk)
+                for m, order in ((m2, 2), (m3, 3), (m4, 4)):
+                    self.assertAlmostEqual(m[k], np.average(d**order, weights=wk), 12)
+            # the constant segment has no spread
+            self.assertEqual(m2[3], 0)
+
+    def test_fit_noise(self):
+        for name, x, tx, y, ty in self.pairs:
+            xd, yd = reference.discrete_seq(x, tx), reference.discrete_seq(y, ty)
+            cx = Counter(xd)
+            assert_kernel_close(self, fb.fit_noise_entropy(x, tx, y, ty),
+                                reference.fit_noise_entropy(x, tx, y, ty, xd, yd, cx), name)
+            assert_kernel_close(self, fb.fit_noise_skewness(x, tx, y, ty),
+                                reference.fit_noise_skewness(x, tx, y, ty, xd, cx), name)
+            assert_kernel_close(self, fb.fit_noise_kurtosis(x, tx, y, ty),
+                                reference.fit_noise_kurtosis(x, tx, y, ty, xd, cx), name)
+
+class ConditionalDistributionSimilarityTest(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        rng = np.random.RandomState(1)
+        self.pairs = coded_pairs()
+        # numerical effects with few values, whose conditional histograms are aligned by cross-correlation
+        x = rng.standard_normal(400)
+        for name, a, ta in (('numerical', x, NUMERICAL), ('categorical', tied_labels(rng, 400, 5), CATEGORICAL)):
+            b = np.clip(np.round(a + rng.standard_normal(400)), -6, 6)
+            self.pairs.append(('few_values_' + name, a, ta, b, NUMERICAL))
+
+    def test_against_reference(self):
+        for name, x, tx, y, ty in self.pairs:
+            xd, yd = reference.discrete_seq2(x, tx), reference.discrete_seq2(y, ty)
+            expected = reference.conditional_distribution_similarity(x, tx, y, ty, xd, Counter(xd), Counter(yd))
+            assert_kernel_close(self, fb.conditional_distribution_similarity(x, tx, y, ty), expected, name)
+
+    def test_cross_correlation(self):
+        # the dot product and FFT paths against np.correlate
+        rng = np.random.RandomState(0)
+        for ny in (5, 64, 65, 300):
+            rows = rng.randint(0, 20, (4, ny))
+            c = rng.randint(0, 50, ny)
+            expected = np.array([np.correlate(np.r_[np.zeros(ny - 1, int), row, np.zeros(ny - 1, int)], c, 'valid') for row in rows])
+            np.testing.assert_array_equal(fb.cross_correlation(rows, c), expected)
+
+class AdjustedMutualInformationTest(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        rng = np.random.RandomState(2)
+        self.pairs = coded_pairs()
+        constant = np.zeros(200)
+        self.pairs.append(('constant', constant, CATEGORICAL, tied_labels(rng, 200, 4), CATEGORICAL))
+        self.pairs.append(('constant_constant', constant, CATEGORICAL, constant + 1, CATEGORICAL))
+
+    def test_against_sklearn(self):
+        for name, x, tx, y, ty in self.pairs:
+            xd, yd = reference.discrete_seq(x, tx), reference.discrete_seq(y, ty)
+            expected = adjusted_mutual_info_score(xd, yd)
+            assert_kernel_close(self, fb.adjusted_mutual_information(x, tx, y, ty), expected, name)
+            # the swapped pair is served from the memoized expected mutual information
+            assert_kernel_close(self, fb.adjusted_mutual_information(y, ty, x, tx), expected, name)
+
+class IgciTest(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        rng = np.random.RandomState(3)
+        self.pairs = coded_pairs()
+        # distinct values, and a constant cause
+        x = rng.standard_normal(300)
+        self.pairs.append(('distinct', x, NUMERICAL, x**3 + rng.standard_normal(300), NUMERICAL))
+        self.pairs.append(('constant', np.ones(300), NUMERICAL, x, NUMERICAL))
+
+    def test_against_reference(self):
+        for name, x, tx, y, ty in self.pairs:
+            nx, ny = reference.normalize(x, tx), reference.normalize(y, ty)
+            expected = reference.igci(x, tx, y, ty, nx, ny), reference.igci(y, ty, x, tx, ny, nx)
+            result = fb.igci_pair(x, tx, y, ty)
+            assert_kernel_close(self, result[0], expected[0], name)
+            assert_kernel_close(self, result[1], expected[1], name + ' backward')
+            assert_kernel_close(self, fb.igci(x, tx, y, ty), expected[0], name)
+
+class PolyfitTest(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        rng = np.random.RandomState(4)
+        self.pairs = coded_pairs()
+        # variables with at most m distinct values, fitted with a lower degree
+        x = rng.standard_normal(300)
+        self.pairs.append(('two_values', x, NUMERICAL, (x > 0.3).astype(float), NUMERICAL))
+        self.pairs.append(('three_values', np.sign(np.round(x)), NUMERICAL, x + rng.standard_normal(300), NUMERICAL))
+
+    def test_power_sums(self):
+        rng = np.random.RandomState(0)
+        u, v = rng.standard_normal(100), rng.standard_normal(100)
+        su, sv, tuv, tvu = fb.power_sums(u, v, 4, 2)
+        k = np.arange(5)[:, np.newaxis]
+        np.testing.assert_allclose(su, np.sum(u**k, axis=1), rtol=1e-12)
+        np.testing.assert_allclose(sv, np.sum(v**k, axis=1), rtol=1e-12)
+        np.testing.assert_allclose(tuv, np.sum(u**k[:3] * v, axis=1), rtol=1e-12)
+        np.testing.assert_allclose(tvu, np.sum(v**k[:3] * u, axis=1), rtol=1e-12)
+
+    def test_against_reference(self):
+        for name, x, tx, y, ty in self.pairs:
+            forward, backward = fb.polyfit_pair(x, tx, y, ty)
+            assert_kernel_close(self, forward, reference.fit(x, tx, y, ty), name)
+            assert_kernel_close(self, backward, reference.fit(y, ty, x, tx), name + ' backward')
+            forward, backward = fb.polyfit_error_pair(x, tx, y, ty)
+            assert_kernel_close(self, forward, reference.fit_error(x, tx, y, ty), name)
+            assert_kernel_close(self, backward, reference.fit_error(y, ty, x, tx), name + ' backward')
+
+class KernelTest(unittest.TestCase):
+    """The typed kernels against the numpy expressions they replace."""
+    def setUp(self):
+        rng = np.random.RandomState(6)
+        x = rng.standard_normal(500)
+        self.values = [x, np.round(x, 1), np.exp(x), np.r_[x, 40.], rng.randint(0, 30, 200).astype(float)]
+
+    def test_shift_scale(self):
+        for x in self.values:
+            np.testing.assert_array_equal(fb.shift_scale(x, 0.3, 1.7), (x - 0.3) * 1.7)
+            np.testing.assert_array_equal(fb.standardize(x), reference.standardize(x))
+
+    def test_discretize(self):
+        for x in self.values:
+            for ffactor in (2, 3):
+                np.testing.assert_array_equal(fb.discrete_seq(x, NUMERICAL, None, ffactor), reference.discrete_seq(x, NUMERICAL, ffactor))
+
+    def test_code_counts(self):
+        codes = np.random.RandomState(0).randint(0, 50, 300)
+        np.testing.assert_array_equal(fb.code_counts(codes), np.bincount(codes))
+        np.testing.assert_array_equal(fb.code_counts(codes, 80), np.bincount(codes, minlength=80))
+        np.testing.assert_array_equal(fb.code_counts(codes[:0], 3), np.zeros(3))
+
+    def test_spacing_log_sum(self):
+        for x in self.values:
+            xs, counts = np.unique(x, return_counts=True)
+            total, k = fb.spacing_log_sum(np.sort(x))
+            delta = np.diff(np.sort(x))
+            delta = delta[delta != 0]
+            self.assertEqual(k, len(delta))
+            self.assertAlmostEqual(total, np.sum(np.log(delta)), 9)
+            total, k = fb.spacing_log_sum(xs, counts, 2)
+            self.assertAlmostEqual(total, np.sum(counts[1:] * np.log(np.diff(xs) / 2 / counts[1:])), 9)
+
+    def test_rbf_dot(self):
+        for x in self.values:
+            x = x[:200]
+            np.testing.assert_allclose(fb.sq_dists1(x), fb.sq_dists(x[:, np.newaxis], x[:, np.newaxis]), atol=1e-10)
+            np.testing.assert_allclose(fb.rbf_dot(x, -1), reference.rbf_dot(x, -1), rtol=1e-9, atol=1e-12)
+            np.testing.assert_allclose(fb.rbf_dot(x, 0.5), reference.rbf_dot(x, 0.5), rtol=1e-9, atol=1e-12)
+
+    def test_read_only(self):
+        # pair store arrays are mapped read-only
+        x = self.values[0].copy()
+        x.flags.writeable = False
+        np.testing.assert_array_equal(fb.shift_scale(x, 0.3, 1.7), (x - 0.3) * 1.7)
+        np.testing.assert_array_equal(fb.discrete_seq(x, NUMERICAL), reference.discrete_seq(x, NUMERICAL))
+        np.testing.assert_array_equal(fb.segment_moments(x, np.array([0, 100]))[0], fb.segment_moments(x.copy(), np.array([0, 100]))[0])
+        xs = np.sort(x)
+        xs.flags.writeable = False
+        self.assertEqual(fb.spacing_log_sum(xs), fb.spacing_log_sum(xs.copy()))
+        np.testing.assert_array_equal(fb.power_sums(x, x, 4, 2)[0], fb.power_sums(x.copy(), x.copy(), 4, 2)[0])
+        np.testing.assert_array_equal(fb.rbf_dot(x[:100], -1), fb.rbf_dot(x[:100].copy(), -1))
+        codes = np.arange(10).repeat(3)
+        codes.flags.writeable = False
+        np.testing.assert_array_equal(fb.code_counts(codes), np.bincount(codes))
+
+    def test_median(self):
+        for x in self.values:
+            self.assertEqual(fb.median(x), np.median(x))
+            self.assertEqual(fb.median(x[1:]), np.median(x[1:]))
+
+class HsicTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.pairs = []
+        for dependence in (0.0, 0.5, 2.0):
+            for n in (200, 2000):
+                x = rng.standard_normal(n)
+                self.pairs.append((x, np.tanh(dependence * x) + 0.5 * rng.standard_normal(n)))
+
+    def test_exact(self):
+        for x, y in self.pairs:
+            np.testing.assert_allclose(fb.normalized_hsic(x, 2, y, 2), reference.normalized_hsic(x, 2, y, 2, None), rtol=1e-9)
+
+    def test_approximations(self):
+        # on all points of the pair: Nystroem within 5% of the exact statistic, random Fourier features within 25%
+        for x, y in self.pairs:
+            exact = fb.normalized_hsic(x, 2, y, 2, maxpnt=len(x))
+            for approx, rtol in (('nystroem', 0.05), ('rff', 0.25)):
+                h = fb.normalized_hsic(x, 2, y, 2, maxpnt=len(x), approx=approx, n_components=100)
+                np.testing.assert_allclose(h, exact, rtol=rtol, err_msg=approx)
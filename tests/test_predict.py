@@ -0,0 +1,164 @@
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+import urllib2
+import warnings
+
+import numpy as np
+
+import predict
+import predict_client
+from tests.data import sample_pairs, write_pairs_csv, TYPE_CODES
+from tests.models import small_models
+
+def read_predictions(filename):
+    with open(filename) as fi:
+        rows = list(csv.reader(fi))[1:]
+    return [r[0] for r in rows], np.array([float(r[1]) for r in rows])
+
+class PredictTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter('ignore')
+        cls.models = small_models()
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.X = sample_pairs(n=200)
+        self.files = write_pairs_csv(self.X, self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+class RoutingTest(PredictTest):
+    """Only the features the models of a pair read against the full extraction."""
+    def test_predict_pairs(self):
+        # C-N pairs only with the numerical variable first, and pairs of every other combination
+        X = self.X.drop(['Binary-Numerical', 'Categorical-Numerical'])
+        expected = predict.score_test(self.models, predict.extract_test(X))
+        test, predictions = predict.predict_pairs(self.models, X)
+        self.assertEqual(list(test.index), list(X.index))
+        np.testing.assert_array_equal(predictions, expected[1])
+
+    def test_columns(self):
+        # every row holds the features its models read, with the values of the full extraction
+        full = predict.extract_test(self.X)
+        routed = predict.extract_test(self.X, models=self.models)
+        outputs = predict.pair_outputs(self.models)
+        # C-C, N-N and C-N pairs (in either orientation) read different features
+        self.assertEqual(len(set(map(frozenset, outputs.values()))), 3)
+        self.assertEqual(set(routed.columns), set(['A type', 'B type']).union(*outputs.values()))
+        numerical = TYPE_CODES['Numerical']
+        for i in xrange(len(self.X)):
+            key = (full['A type'][2 * i] == numerical, full['B type'][2 * i] == numerical)
+            for name in outputs[key]:
+                np.testing.assert_array_equal(routed[name][2 * i:2 * i + 2], full[name][2 * i:2 * i + 2], err_msg=name)
+
+class FailingModel(object):
+    # scores like model, then fails from the call numbered fail_at on
+    def __init__(self, model, fail_at):
+        self.model, self.fail_at, self.calls = model, fail_at, 0
+        self.systems = model.systems
+
+    def predict(self, X):
+        self.calls += 1
+        if self.calls >= self.fail_at:
+            raise ArithmeticError("scoring failed")
+        return self.model.predict(X)
+
+class StreamTest(PredictTest):
+    def test_batch_sizes(self):
+        # every batch size gives the predictions of the whole file
+        output, test, expected = predict.predict_dir(self.models, self.tmp, self.tmp)
+        for batch_size in (1, 2, 3, 4, 7, 100):
+            n = predict.predict_stream(self.models, self.files[0], self.files[1], os.path.join(self.tmp, 'stream.csv'),
+                                       batch_size=batch_size)
+            self.assertEqual(n, len(self.X))
+            ids, predictions = read_predictions(os.path.join(self.tmp, 'stream.csv'))
+            self.assertEqual(ids, list(self.X.index))
+            np.testing.assert_allclose(predictions, expected, rtol=1e-12, err_msg='batch size %d' % batch_size)
+
+    def test_pairs_alone(self):
+        # a pair is scored against its own swapped pair only, whatever pairs share its batch
+        test, expected = predict.predict_pairs(self.models, self.X)
+        for i in xrange(len(self.X)):
+            test, p = predict.predict_pairs(self.models, self.X.iloc[[i]])
+            self.assertAlmostEqual(p[0], expected[i], 12, self.X.index[i])
+
+    def test_failure(self):
+        # the error of a later batch is raised once every stage has stopped, and the batches
+        # scored before it are kept
+        threads = set(threading.enumerate())
+        models = dict(self.models, amodel=FailingModel(self.models['amodel'], 3))
+        output = os.path.join(self.tmp, 'stream.csv')
+        self.assertRaises(ArithmeticError, predict.predict_stream, models, self.files[0], self.files[1], output, batch_size=2)
+        self.assertEqual(set(threading.enumerate()), threads)
+        ids, predictions = read_predictions(output)
+        self.assertEqual(ids, list(self.X.index[:4]))
+
+class ServerTest(PredictTest):
+    """The three job forms of the daemon against predict_pairs."""
+    def setUp(self):
+        PredictTest.setUp(self)
+        self.server = predict.PredictionServer(('127.0.0.1', 0), self.models)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.expected = predict.predict_pairs(self.models, predict.read_data(self.files[0], self.files[1], False))[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        PredictTest.tearDown(self)
+
+    def post(self, job):
+        return predict_client.post(self.url + '/predict', job)
+
+    def inline(self, X):
+        return [{'SampleID': sid, 'A': list(row['A']), 'B': list(row['B']), 'A type': row['A type'], 'B type': row['B type']}
+                for sid, row in X.iterrows()]
+
+    def test_input_dir(self):
+        result = self.post({'input_dir': self.tmp, 'output_dir': self.tmp})
+        self.assertEqual(result['SampleID'], list(self.X.index))
+        np.testing.assert_allclose(result['Target'], self.expected, rtol=1e-12)
+        ids, predictions = read_predictions(result['output'])
+        self.assertEqual(ids, list(self.X.index))
+        np.testing.assert_allclose(predictions, self.expected, rtol=1e-12)
+
+    def test_pairs_file(self):
+        result = self.post({'pairs_file': self.files[0], 'info_file': self.files[1]})
+        self.assertEqual(result['SampleID'], list(self.X.index))
+        np.testing.assert_allclose(result['Target'], self.expected, rtol=1e-12)
+
+    def test_pairs(self):
+        result = self.post({'pairs': self.inline(self.X)})
+        self.assertEqual(result['SampleID'], list(self.X.index))
+        np.testing.assert_allclose(result['Target'], self.expected, rtol=1e-12)
+        # a single pair of a categorical and a numerical variable
+        i = list(self.X.index).index('Categorical-Numerical')
+        result = self.post({'pairs': self.inline(self.X.iloc[[i]])})
+        np.testing.assert_allclose(result['Target'], self.expected[i:i + 1], rtol=1e-12)
+        request = urllib2.Request(self.url + '/predict', json.dumps({'pairs': []}))
+        with self.assertRaises(urllib2.HTTPError) as error:
+            urllib2.urlopen(request)
+        self.assertEqual(error.exception.code, 400)
+        self.assertEqual(json.loads(error.exception.read()), {'error': 'ValueError: pairs must be a non-empty list'})
+        pairs = self.inline(self.X.iloc[:1])
+        pairs[0]['B type'] = 'Ordinal'
+        self.assertIn('B type of pair', self.post({'pairs': pairs})['error'])
+        self.assertEqual(self.server.jobs, 2)
+
+    def test_client(self):
+        client = os.path.join(os.path.dirname(os.path.abspath(predict.__file__)), 'predict_client.py')
+        out = subprocess.check_output([sys.executable, client, self.tmp, self.tmp, '--port', str(self.server.server_address[1])])
+        self.assertIn('test_predict.csv', out)
+        ids, predictions = read_predictions(os.path.join(self.tmp, 'test_predict.csv'))
+        np.testing.assert_allclose(predictions, self.expected, rtol=1e-12)
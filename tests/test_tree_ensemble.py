@@ -0,0 +1,37 @@
+import unittest
+
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier, GradientBoostingRegressor, RandomForestRegressor
+
+from tree_ensemble import compile_ensemble
+
+class CompileEnsembleTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.X = rng.standard_normal((300, 6))
+        self.y = self.X[:, 0] + np.sin(self.X[:, 1]) + 0.1 * rng.standard_normal(300)
+
+    def test_predictions_match(self):
+        for est in (RandomForestRegressor(n_estimators=10, random_state=0),
+                    GradientBoostingRegressor(n_estimators=20, random_state=0)):
+            est.fit(self.X, self.y)
+            np.testing.assert_array_equal(compile_ensemble(est).predict(self.X), est.predict(self.X))
+        for classes in (2, 3):
+            est = GradientBoostingClassifier(n_estimators=20, random_state=0)
+            est.fit(self.X, np.digitize(self.y, np.percentile(self.y, np.linspace(0, 100, classes + 1)[1:-1])))
+            np.testing.assert_array_equal(compile_ensemble(est).predict_proba(self.X), est.predict_proba(self.X))
+
+    def test_refit(self):
+        est = RandomForestRegressor(n_estimators=10, random_state=0)
+        self.assertIsNone(compile_ensemble(est))
+        est.fit(self.X, self.y)
+        np.testing.assert_array_equal(compile_ensemble(est).predict(self.X), est.predict(self.X))
+        est.fit(self.X, -self.y)
+        np.testing.assert_array_equal(compile_ensemble(est).predict(self.X), est.predict(self.X))
+
+    def test_warm_start(self):
+        est = RandomForestRegressor(n_estimators=5, random_state=0, warm_start=True)
+        est.fit(self.X, self.y)
+        compile_ensemble(est)
+        est.set_params(n_estimators=10).fit(self.X, self.y)
+        np.testing.assert_array_equal(compile_ensemble(est).predict(self.X), est.predict(self.X))
@@ -0,0 +1,20 @@
+cimport cython
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def accumulate_trees(float[:, ::1] X, int[::1] roots, int[::1] feature, double[::1] threshold,
+                     int[::1] left, int[::1] right, double[::1] value, double scale, double[::1] out):
+    # out[i] += scale * (leaf value of sample i) for every tree, one tree after the other;
+    # leaves are the nodes whose left child is themselves
+    cdef Py_ssize_t t, i
+    cdef int node
+    with nogil:
+        for t in range(roots.shape[0]):
+            for i in range(X.shape[0]):
+                node = roots[t]
+                while left[node] != node:
+                    if X[i, feature[node]] <= threshold[node]:
+                        node = left[node]
+                    else:
+                        node = right[node]
+                out[i] += scale * value[node]
@@ -0,0 +1,102 @@
+import weakref
+
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier, GradientBoostingRegressor, RandomForestRegressor
+from tree_base import accumulate_trees
+
+class FlatForest(object):
+    """Fitted trees flattened into contiguous node arrays, leaves pointing to themselves."""
+    def __init__(self, trees):
+        offsets = np.cumsum([0] + [t.node_count for t in trees])
+        n = offsets[-1]
+        self.roots = offsets[:-1].astype(np.int32)
+        self.feature = np.zeros(n, dtype=np.int32)
+        self.threshold = np.zeros(n)
+        self.left = np.zeros(n, dtype=np.int32)
+        self.right = np.zeros(n, dtype=np.int32)
+        self.value = np.zeros(n)
+        for t, o in zip(trees, offsets):
+            nodes = np.arange(o, o + t.node_count, dtype=np.int32)
+            leaf = t.children_left == -1
+            self.feature[nodes] = np.where(leaf, 0, t.feature)
+            self.threshold[nodes] = t.threshold
+            self.left[nodes] = np.where(leaf, nodes, t.children_left + o)
+            self.right[nodes] = np.where(leaf, nodes, t.children_right + o)
+            self.value[nodes] = t.value[:, 0, 0]
+
+    def __len__(self):
+        return len(self.roots)
+
+    def accumulate(self, X, scale, out):
+        # features are compared as float32, like sklearn's trees do
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        accumulate_trees(X, self.roots, self.feature, self.threshold, self.left, self.right, self.value, scale, out)
+        return out
+
+class CompiledForestRegressor(object):
+    def __init__(self, est):
+        self.forest = FlatForest([e.tree_ for e in est.estimators_])
+
+    def predict(self, X):
+        y = self.forest.accumulate(X, 1.0, np.zeros(np.asarray(X).shape[0]))
+        y /= len(self.forest)
+        return y
+
+class CompiledGradientBoostingRegressor(object):
+    def __init__(self, est):
+        # no reference to est itself, which keys the cache of compiled evaluators
+        self.init, self.learning_rate, self.loss = est.init_, est.learning_rate, est.loss_
+        self.n_classes = est.estimators_.shape[1]
+        self.forests = [FlatForest([e.tree_ for e in est.estimators_[:, k]]) for k in xrange(self.n_classes)]
+
+    def decision_function(self, X):
+        # stages are added in order for every sample, like sklearn's predict_stages
+        score = self.init.predict(X).astype(np.float64)
+        for k, forest in enumerate(self.forests):
+            score[:, k] = forest.accumulate(X, self.learning_rate, np.ascontiguousarray(score[:, k]))
+        return score
+
+    def predict(self, X):
+        return self.decision_function(X).ravel()
+
+class CompiledGradientBoostingClassifier(CompiledGradientBoostingRegressor):
+    def predict_proba(self, X):
+        score = self.decision_function(X)
+        loss = self.loss
+        if hasattr(loss, '_score_to_proba'):
+            return loss._score_to_proba(score)
+        if score.shape[1] == 1:
+            proba = np.ones((score.shape[0], 2))
+            proba[:, 1] = 1.0 / (1.0 + np.exp(-score.ravel()))
+            proba[:, 0] -= proba[:, 1]
+            return proba
+        return np.exp(score) / np.sum(np.exp(score), axis=1)[:, np.newaxis]
+
+COMPILERS = [
+    (GradientBoostingClassifier, CompiledGradientBoostingClassifier),
+    (GradientBoostingRegressor, CompiledGradientBoostingRegressor),
+    (RandomForestRegressor, CompiledForestRegressor),
+]
+
+compiled = weakref.WeakKeyDictionary()
+
+def compile_ensemble(est):
+    """Array-based evaluator for a fitted tree ensemble, or None if est is not one.
+
+    The evaluator is built once per fit of the estimator and has the predict
+    (and for classifiers predict_proba) of the estimator it was built from.
+    """
+    compiler = None
+    for cls, c in COMPILERS:
+        if type(est) is cls:
+            compiler = c
+            break
+    trees = getattr(est, 'estimators_', None)
+    if compiler is None or trees is None:
+        return None
+    # a refit binds new trees; warm starts grow the same list of trees
+    entry = compiled.get(est)
+    if entry is None or entry[0] is not trees or entry[1] != len(trees):
+        entry = (trees, len(trees), compiler(est))
+        compiled[est] = entry
+    return entry[2]